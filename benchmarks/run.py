@@ -0,0 +1,319 @@
+#! /usr/bin/env python3
+
+"""
+The LLFI benchmarks measure the harness and the analysis tools on synthetic
+workloads (see synth.py), without LLVM:
+
+  inject       runs/s of llfi-inject (the Campaign of bin/inject.py) over a
+               stand-in fault injection executable whose runs succeed, exit
+               with an error or crash, with 1 job and one job per CPU, and
+               the overhead of the harness per run
+  inject_hang  time taken to detect and kill hung runs, with timeOut: 1
+  tracediff    MB/s of tracediff over a golden and a faulty trace
+  traceunion   MB/s of traceunion over trace difference reports
+  stats        wall time of llfi-stats over the result files of a campaign
+  startup      time taken by llfi to start a command (llfi stats --help), over
+               the startup of the interpreter; fails if it exceeds
+               --startup-budget, or if the command imports the modules of
+               other commands (PyYAML, config/llvm_paths, bin.instrument...)
+
+--scale sizes the workloads: quick for a smoke test, default, or full (traces
+of 10^5 instructions, 10^6 result files for stats). Every benchmark but
+inject_hang is repeated --repeat times and the best time is kept.
+
+The results are printed, and written as JSON with --json along with the
+commit, host and scale they were measured on, so that they can be compared
+over time: --compare prints the change of every metric against a previous
+JSON result.
+
+  python3 benchmarks/run.py --json before.json
+  python3 benchmarks/run.py --compare before.json
+"""
+
+import sys
+import os
+import io
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import contextlib
+import subprocess
+
+script_path = os.path.realpath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(script_path, '..'))
+sys.path.insert(0, os.path.join(script_path, '../tools'))
+import synth
+
+BENCHMARKS = ['inject', 'inject_hang', 'tracediff', 'traceunion', 'stats',
+              'startup']
+
+SCALES = {
+  'quick': {'inject_runs': 40, 'hang_runs': 2, 'trace_lines': 5000,
+            'reports': 2000, 'stats_runs': 2000, 'startup_runs': 5},
+  'default': {'inject_runs': 300, 'hang_runs': 4, 'trace_lines': 20000,
+              'reports': 20000, 'stats_runs': 50000, 'startup_runs': 20},
+  'full': {'inject_runs': 2000, 'hang_runs': 8, 'trace_lines': 100000,
+           'reports': 200000, 'stats_runs': 450000, 'startup_runs': 50},
+}
+
+# modules that llfi stats must not import, as they belong to other commands
+STARTUP_FORBIDDEN = ['yaml', 'llvm_paths', 'bin.instrument', 'bin.inject',
+                     'bin.profile', 'tools.compile', 'importlib.metadata']
+
+def initParser():
+  parser = argparse.ArgumentParser(
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    prog='benchmarks/run.py',
+    epilog=__doc__,
+  )
+  parser.add_argument('--bench', default=','.join(BENCHMARKS), dest='BENCH',
+                      help='comma-separated benchmarks to run (default: all)')
+  parser.add_argument('--scale', choices=sorted(SCALES), default='default',
+                      dest='SCALE', help='size of the workloads (default: \
+                      %(default)s)')
+  parser.add_argument('--repeat', type=int, default=3, dest='REPEAT',
+                      help='times each benchmark is repeated (default: \
+                      %(default)s)')
+  parser.add_argument('--json', dest='JSON',
+                      help='write the results to this file')
+  parser.add_argument('--compare', dest='COMPARE',
+                      help='JSON results to compare the results with')
+  parser.add_argument('--startup-budget', type=float, default=100.0,
+                      dest='STARTUP_BUDGET',
+                      help='milliseconds llfi may take to start a command, \
+                      over the startup of the interpreter (default: \
+                      %(default)s)')
+  parser.add_argument('--workdir', dest='WORKDIR',
+                      help='directory of the synthetic workloads, kept \
+                      (default: a temporary directory, removed)')
+  return parser
+
+################################################################################
+def bestOf(repeat, setup, measure):
+  #best time of measure(setup()) over repeat runs
+  best = None
+  for _ in range(repeat):
+    state = setup()
+    start = time.perf_counter()
+    measure(state)
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+def quiet():
+  #silence the reports the tools print
+  return contextlib.redirect_stdout(io.StringIO())
+
+def benchInject(workdir, scale, repeat):
+  from bin import inject
+  exe, inputfile = synth.makeWorkspace(workdir, {"ok": 70, "exit": 20,
+                                                 "crash": 10})
+  runOpt = {"numOfRuns": scale['inject_runs'], "seed": 1}
+  doc = {"timeOut": 10, "runOption": [{"run": runOpt}]}
+  results = []
+  for jobs in sorted(set([1, len(os.sched_getaffinity(0))])):
+    campaign = inject.Campaign(exe, [os.path.basename(inputfile)], workdir,
+                               doc, jobs=jobs)
+    harness = []
+    def record(spec, outcome):
+      harness.append(outcome['harness'])
+    elapsed = bestOf(repeat, lambda: campaign.configRuns(0, runOpt),
+                     lambda specs: campaign.runAll(specs, record))
+    campaign.close()
+    results.append(({'jobs': jobs, 'runs': len(harness) // repeat}, {
+      'runs_per_s': scale['inject_runs'] / elapsed,
+      'harness_ms_per_run': 1000 * sum(harness) / len(harness),
+    }))
+  return results
+
+def benchInjectHang(workdir, scale, repeat):
+  from bin import inject
+  exe, inputfile = synth.makeWorkspace(workdir, {"hang": 100})
+  runOpt = {"numOfRuns": scale['hang_runs'], "seed": 1}
+  doc = {"timeOut": 1, "runOption": [{"run": runOpt}]}
+  campaign = inject.Campaign(exe, [os.path.basename(inputfile)], workdir, doc,
+                             jobs=scale['hang_runs'])
+  outcomes = campaign.runAll(campaign.configRuns(0, runOpt))
+  campaign.close()
+  assert all(o['code'] == 'TO' for _, o in outcomes), "a stand-in did not hang"
+  latencies = [o['time'] for _, o in outcomes]
+  return [({'runs': len(outcomes), 'timeout': 1}, {
+    'detection_s_avg': sum(latencies) / len(latencies),
+    'detection_s_max': max(latencies),
+  })]
+
+def benchTraceDiff(workdir, scale, repeat):
+  import tracediff
+  golden = os.path.join(workdir, "golden.trace")
+  faulty = os.path.join(workdir, "faulty.trace")
+  size = synth.writeTraces(golden, faulty, scale['trace_lines'],
+                           random.Random(1))
+  def measure(_):
+    with quiet():
+      tracediff.traceDiff(['tracediff', golden, faulty])
+  elapsed = bestOf(repeat, lambda: None, measure)
+  return [({'lines': scale['trace_lines'], 'bytes': size}, {
+    'mb_per_s': size / 1e6 / elapsed,
+    'seconds': elapsed,
+  })]
+
+def benchTraceUnion(workdir, scale, repeat):
+  import traceunion
+  reports = os.path.join(workdir, "reports.txt")
+  size = synth.writeReports(reports, scale['reports'], random.Random(1))
+  def measure(_):
+    with quiet():
+      traceunion.traceUnion([reports])
+  elapsed = bestOf(repeat, lambda: None, measure)
+  return [({'reports': scale['reports'], 'bytes': size}, {
+    'mb_per_s': size / 1e6 / elapsed,
+    'seconds': elapsed,
+  })]
+
+def benchStats(workdir, scale, repeat):
+  import stats
+  llfi_dir = os.path.join(workdir, "results", "llfi")
+  nfiles = synth.writeResults(llfi_dir, scale['stats_runs'], random.Random(1))
+  def measure(_):
+    with quiet():
+      stats.run([llfi_dir])
+  elapsed = bestOf(repeat, lambda: None, measure)
+  return [({'runs': scale['stats_runs'], 'files': nfiles}, {
+    'seconds': elapsed,
+    'files_per_s': nfiles / elapsed,
+  })]
+
+def startupTime(execlist, runs):
+  #median wall time of execlist, in ms
+  times = []
+  for _ in range(runs):
+    start = time.perf_counter()
+    subprocess.run(execlist, stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL)
+    times.append(time.perf_counter() - start)
+  return 1000 * statistics.median(times)
+
+def benchStartup(workdir, scale, repeat, budget):
+  llfi = [sys.executable, os.path.join(script_path, '..', 'llfi.py')]
+  command = llfi + ['stats', '--help']
+  # the modules imported by the command, from the import profile of python
+  p = subprocess.run([sys.executable, '-X', 'importtime'] + command[1:],
+                     stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                     cwd=workdir, universal_newlines=True)
+  assert p.returncode == 0, "llfi stats --help failed:\n" + p.stderr
+  imported = set(line.split('|')[-1].strip() for line in p.stderr.splitlines()
+                 if line.startswith('import time:'))
+  loaded = [m for m in STARTUP_FORBIDDEN if m in imported]
+  assert not loaded, "llfi stats imports " + ", ".join(loaded)
+
+  runs = scale['startup_runs']
+  interpreter = startupTime([sys.executable, '-c', 'pass'], runs)
+  stats = startupTime(command, runs)
+  overhead = stats - interpreter
+  assert overhead <= budget, "llfi stats --help starts in %.1f ms over the " \
+         "interpreter, above the budget of %.1f ms" % (overhead, budget)
+  return [({'runs': runs}, {
+    'interpreter_ms': interpreter,
+    'stats_help_ms': stats,
+    'overhead_ms': overhead,
+  })]
+
+BENCH_FUNCTIONS = {
+  'inject': benchInject,
+  'inject_hang': benchInjectHang,
+  'tracediff': benchTraceDiff,
+  'traceunion': benchTraceUnion,
+  'stats': benchStats,
+  'startup': benchStartup,
+}
+
+################################################################################
+def hostInfo():
+  try:
+    commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                     cwd=script_path, stderr=subprocess.DEVNULL,
+                                     universal_newlines=True).strip()
+  except (OSError, subprocess.CalledProcessError):
+    commit = None
+  return {
+    'commit': commit,
+    'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    'host': platform.node(),
+    'python': platform.python_version(),
+    'cpus': len(os.sched_getaffinity(0)),
+  }
+
+def resultKey(result):
+  return (result['name'], json.dumps(result['params'], sort_keys=True))
+
+def printResults(results):
+  for result in results:
+    params = ", ".join("{}={}".format(k, v) for k, v in sorted(result['params'].items()))
+    print("{} ({})".format(result['name'], params))
+    for metric, value in sorted(result['metrics'].items()):
+      print("   {:<22s} {:>14,.3f}".format(metric, value))
+
+def printComparison(results, baseline):
+  base = dict((resultKey(r), r['metrics']) for r in baseline['results'])
+  print("Compared with {} ({}):".format(baseline.get('commit'), baseline.get('time')))
+  for result in results:
+    before = base.get(resultKey(result))
+    if before is None:
+      print("{}: no baseline with the same parameters".format(result['name']))
+      continue
+    for metric, value in sorted(result['metrics'].items()):
+      if metric in before and before[metric]:
+        print("   {:<12s} {:<22s} {:>14,.3f} -> {:>14,.3f} ({:+.1%})".format(
+              result['name'], metric, before[metric], value,
+              value / before[metric] - 1))
+
+def run(args):
+  parser = initParser()
+  options = parser.parse_args(args)
+  benches = options.BENCH.split(',')
+  for bench in benches:
+    if bench not in BENCH_FUNCTIONS:
+      parser.error("unknown benchmark " + bench + ", choose among " +
+                   ", ".join(BENCHMARKS))
+  if options.STARTUP_BUDGET < 0:
+    parser.error("--startup-budget must not be negative")
+  if options.REPEAT < 1:
+    parser.error("--repeat must be at least 1")
+  scale = SCALES[options.SCALE]
+
+  root = options.WORKDIR or tempfile.mkdtemp(prefix='llfi-bench-')
+  results = []
+  try:
+    for bench in benches:
+      workdir = os.path.join(root, bench)
+      if os.path.isdir(workdir):
+        shutil.rmtree(workdir)
+      os.makedirs(workdir)
+      print("Running " + bench + "...", file=sys.stderr)
+      bargs = [workdir, scale, options.REPEAT]
+      if bench == 'startup':
+        bargs.append(options.STARTUP_BUDGET)
+      for params, metrics in BENCH_FUNCTIONS[bench](*bargs):
+        results.append({'name': bench, 'params': params, 'metrics': metrics})
+  finally:
+    if not options.WORKDIR:
+      shutil.rmtree(root, ignore_errors=True)
+
+  printResults(results)
+  report = hostInfo()
+  report['scale'] = options.SCALE
+  report['results'] = results
+  if options.JSON:
+    with open(options.JSON, 'w') as f:
+      json.dump(report, f, indent=2, sort_keys=True)
+  if options.COMPARE:
+    with open(options.COMPARE) as f:
+      printComparison(results, json.load(f))
+
+if __name__ == "__main__":
+  run(sys.argv[1:])
@@ -0,0 +1,204 @@
+#! /usr/bin/env python3
+
+"""
+Synthetic inputs of the LLFI benchmarks and tests, generated without LLVM:
+stand-ins for fault injection executables, their site catalogs and site
+profiles, instruction traces and trace difference reports, and the result
+files of a campaign, for llfi-stats.
+"""
+
+import os
+import random
+import struct
+
+################################################################################
+# Stand-in for a fault injection executable. Like the real ones, it reads
+# llfi.config.fi.txt from its working directory, writes the llfi.stat files
+# of the runtime and an output file, and reads the input file it is given.
+# The outcome of each run is picked from its fi_seed, per the outcome mix.
+STANDIN = """#!/bin/sh
+. ./llfi.config.fi.txt
+echo "FI stat: fi_cycle=$fi_cycle fi_type=bitflip" > llfi.stat.fi.injectedfaults.txt
+[ -f "$1" ] && cat "$1" > /dev/null
+echo "result $fi_cycle" > output.txt
+outcome=$((fi_seed % 100))
+if [ $outcome -lt {exit} ]; then
+  exit 0
+elif [ $outcome -lt {crash} ]; then
+  exit 1
+elif [ $outcome -lt {hang} ]; then
+  kill -SEGV $$
+fi
+exec sleep 3600
+"""
+
+def writeStandin(path, mix):
+  '''
+    Write a stand-in executable to path. mix gives the percentage of runs
+    that succeed (ok), exit with 1 (exit), crash on SIGSEGV (crash) and hang
+    (hang).
+  '''
+  assert sum(mix.values()) == 100, "the outcome mix must add up to 100%"
+  bounds = {}
+  total = 0
+  for outcome, key in (("ok", "exit"), ("exit", "crash"), ("crash", "hang")):
+    total += mix.get(outcome, 0)
+    bounds[key] = total
+  with open(path, "w") as f:
+    f.write(STANDIN.format(**bounds))
+  os.chmod(path, 0o755)
+
+def makeWorkspace(directory, mix, totalcycles=100000, inputSize=4096):
+  '''
+    Set up the working directory of an llfi-inject campaign of a stand-in
+    executable: llfi/standin, the profile of its golden run beside it and an
+    input file. Returns the (executable, input file) paths.
+  '''
+  llfi_dir = os.path.join(directory, "llfi")
+  os.makedirs(llfi_dir, exist_ok=True)
+  exe = os.path.join(llfi_dir, "standin")
+  writeStandin(exe, mix)
+  with open(os.path.join(llfi_dir, "llfi.stat.prof.txt"), "w") as f:
+    f.write("total_cycle=" + str(totalcycles) + "\n")
+  inputfile = os.path.join(directory, "input.dat")
+  with open(inputfile, "wb") as f:
+    f.write(os.urandom(inputSize))
+  return exe, inputfile
+
+def writeSiteCatalog(path, sites):
+  '''
+    Write a fault injection site catalog, like the one llfi-instrument writes
+    beside the fault injection executable. sites is a list of
+    (llfi_index, opcode, widths, uses), widths the bit widths of the register
+    targets of the site.
+  '''
+  with open(path, "w") as f:
+    f.write("# llfi_index\topcode\tfunction\tblock\tregs\twidths\tuses\n")
+    for index, opcode, widths, uses in sites:
+      f.write("{}\t{}\tmain\tentry\t{}\t{}\t{}\n".format(
+              index, opcode, len(widths), ",".join(str(w) for w in widths),
+              uses))
+
+def writeSiteProfile(path, counts, opcodes=None):
+  '''
+    Write a site profile, like the one of llfi-profile: the dynamic execution
+    count and the opcode of every llfi_index
+  '''
+  if opcodes is None:
+    opcodes = [0] * len(counts)
+  with open(path, "wb") as f:
+    f.write(struct.pack("=8sQ", b"LLFISIT1", len(counts)))
+    f.write(struct.pack("={}Q".format(len(counts)), *counts))
+    f.write(struct.pack("={}B".format(len(opcodes)), *opcodes))
+
+################################################################################
+OPCODES = ["load", "add", "mul", "getelementptr", "icmp", "br", "store",
+           "call", "sub", "ret"]
+
+def traceLine(ID, value):
+  return "ID: {}\tOPCode: {}\tValue: {:08x}\n".format(ID, OPCODES[ID % len(OPCODES)],
+                                                   value)
+
+def writeTraces(golden, faulty, nlines, rng, staticInsts=200, propagation=0.1,
+                divergence=True):
+  '''
+    Write a golden trace of nlines dynamic instructions, looping over
+    staticInsts static ones, and the trace of a faulty run starting at a
+    random fault injection point. The fault propagates to a share of the
+    values that follow it and, with divergence, changes the control flow
+    once. Returns the number of bytes written.
+  '''
+  start = rng.randrange(1, max(nlines // 2, 2))
+  values = [rng.getrandbits(32) for _ in range(staticInsts)]
+  size = 0
+  with open(golden, "w") as g, open(faulty, "w") as f:
+    f.write("#TraceStartInstNumber: {}\n".format(start))
+    skip = rng.randrange(start, nlines) if divergence else -1
+    for n in range(nlines):
+      ID = n % staticInsts
+      value = (values[ID] + n) & 0xffffffff
+      line = traceLine(ID, value)
+      g.write(line)
+      size += len(line)
+      if n < start - 1:
+        continue
+      if n == start - 1:
+        # the injected instruction
+        line = traceLine(ID, value ^ (1 << rng.randrange(32)))
+      elif n == skip:
+        # a branch taken the other way skips an instruction
+        continue
+      elif rng.random() < propagation:
+        line = traceLine(ID, value ^ 1)
+      f.write(line)
+      size += len(line)
+  return size
+
+def writeReports(path, nreports, rng, staticInsts=200, diffsPerReport=20):
+  '''
+    Write nreports trace difference reports, like the ones of tracediff, for
+    faults into random static instructions. Returns the number of bytes
+    written.
+  '''
+  size = 0
+  with open(path, "w") as f:
+    for _ in range(nreports):
+      ID = rng.randrange(staticInsts)
+      lines = ["#FaultReport\n",
+               "1 @ {}\n".format(rng.randrange(1, 1000000)),
+               "ID: {} OPCode: {} Value: {:08x} / {:08x}\n".format(
+                 ID, OPCODES[ID % len(OPCODES)], rng.getrandbits(32),
+                 rng.getrandbits(32)),
+               "Diff@ inst # {0}\\{0} -> inst # {1}\\{1}\n".format(
+                 rng.randrange(1, 1000000), rng.randrange(1, 1000000))]
+      for _ in range(diffsPerReport):
+        diffID = rng.randrange(staticInsts)
+        lines.append("Data Diff: ID: {} OPCode: {} Value: {:08x} \\ {:08x}\n".format(
+                     diffID, OPCODES[diffID % len(OPCODES)], rng.getrandbits(32),
+                     rng.getrandbits(32)))
+      lines.append("\n")
+      text = "".join(lines)
+      f.write(text)
+      size += len(text)
+  return size
+
+################################################################################
+def writeResults(llfi_dir, nruns, rng, groups=4):
+  '''
+    Write the result files of a campaign of nruns runs split into groups run
+    configurations, as llfi-inject does: the runtime stat, the log and, for
+    the runs that failed, the error file of every run. Returns the number of
+    files written.
+  '''
+  dirs = {}
+  for name in ("llfi_stat_output", "log_output", "error_output"):
+    dirs[name] = os.path.join(llfi_dir, name)
+    os.makedirs(dirs[name], exist_ok=True)
+  nfiles = 0
+  for run in range(nruns):
+    run_id = "{}-{}".format(run % groups, run // groups)
+    with open(os.path.join(dirs["llfi_stat_output"],
+                           "llfi.stat.fi.injectedfaults." + run_id + ".txt"), "w") as f:
+      f.write("FI stat: fi_type=bitflip, fi_cycle={}, fi_index={}, fi_bit={}\n".format(
+              rng.randrange(100000), rng.randrange(500), rng.randrange(32)))
+    outcome = rng.random()
+    code, signal = 0, 0
+    if outcome > 0.9:
+      code, signal = -11, 11
+    elif outcome > 0.8:
+      code = 1
+    with open(os.path.join(dirs["log_output"],
+                           "logfile-run-" + run_id + ".txt"), "w") as f:
+      f.write("code={}, time={:0.3f}, utime={:0.3f}, stime={:0.3f}, maxrss={}, "
+              "majflt=0, minflt={}, signal={}\n".format(
+              code, rng.random(), rng.random(), rng.random() / 10,
+              rng.randrange(2000, 50000), rng.randrange(100, 1000), signal))
+    nfiles += 2
+    if code:
+      with open(os.path.join(dirs["error_output"], "errorfile-run-" + run_id), "w") as f:
+        if code < 0:
+          f.write("Program crashed, terminated by the system, return code -11\n")
+        else:
+          f.write("Program crashed, terminated by itself, return code 1\n")
+      nfiles += 1
+  return nfiles
@@ -0,0 +1,349 @@
+#! /usr/bin/env python3
+
+"""
+llfi-bench-overhead measures the cost of the LLFI instrumentation of an IR
+file. It builds the program through the pipeline of llfi-instrument, as:
+
+  native          the IR file, uninstrumented
+  profiling       with the ProfilingPass
+  faultinjection  with the FaultInjectionPass, run without injecting a fault
+                  (fi_cycle past the end of the program)
+  traced          with the ProfilingPass and the InstTracePass, tracing every
+                  dynamic instruction like a golden run
+
+and runs each of them --runs times. It reports the median time of every
+variant and its slowdown over the native one, the calls into preFunc and into
+printInstTracer per second, with the time each call adds over the native
+variant, and the bytes of trace written per traced instruction.
+
+The compileOption of input.yaml beside IR_FILE selects the instructions to
+instrument (the first variant, if it is a list of them); tracingPropagation is
+only applied to the traced variant. preFunc is called once per register
+target of every dynamic fault injection site, which is counted as total_cycle
+by the profiling variant (exactly the number of calls when injecting into
+dstreg with cycleCounting: instruction).
+
+Without EXE_ARGS, the arguments of the program are read from the input file
+beside IR_FILE, named after it as in test_programs (input.factorial for
+factorial.ll).
+"""
+
+import sys, os, shutil
+import yaml
+import subprocess
+import argparse
+import statistics
+import time
+
+script_path = os.path.realpath(os.path.dirname(__file__))
+sys.path.append(script_path)
+import instrument
+
+prog = os.path.basename(sys.argv[0])
+basedir = os.getcwd()
+
+VARIANTS = ['native', 'profiling', 'faultinjection', 'traced']
+
+# cycle of the fault of the faultinjection variant, never reached
+NO_FAULT_CYCLE = 2**63 - 1
+
+class BenchError(Exception):
+  pass
+
+def usage(msg = None):
+  retval = 0
+  if msg is not None:
+    retval = 1
+    msg = "ERROR: " + msg
+    print(msg, file=sys.stderr)
+  print(__doc__ % globals(), file=sys.stderr)
+  sys.exit(retval)
+
+def help():
+  parser = initParser()
+  parser.print_help()
+
+def initParser():
+  parser = argparse.ArgumentParser(
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    prog='llfi bench-overhead',
+    epilog=__doc__,
+  )
+  parser.add_argument('IR_FILE', help='IR file to measure')
+  parser.add_argument('EXE_ARGS', nargs='*',
+                      help='arguments to the program (default: read from the \
+                      input file beside IR_FILE)')
+  parser.add_argument('--runs', type=int, default=5, dest='RUNS',
+                      help='times each variant is run (default: %(default)s)')
+  parser.add_argument('--dir', default='llfi-overhead', dest='DIR',
+                      help='directory to build and run the variants in, under \
+                      the directory of IR_FILE (default: %(default)s)')
+  parser.add_argument('--keep', action='store_true', dest='KEEP',
+                      help='keep the executables and the trace in --dir')
+  parser.add_argument('-l',  action='append', default=[], metavar='LIB',
+                      help='link against LIB')
+  parser.add_argument('-L', action='append', default=[], metavar='DIR',
+                      help='add DIR to search path for linking')
+  parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                      dest='JOBS',
+                      help='number of build steps to run at the same time \
+                      (default: number of CPUs)')
+  parser.add_argument('-v', '--verbose', action='store_true', dest='VERBOSE',
+                      help='show verbose information')
+  return parser
+
+def parseArgs(parser, args):
+  options = parser.parse_args(args)
+  if options.RUNS < 1:
+    usage("The number of runs must be at least 1")
+  if options.JOBS < 1:
+    usage("The number of jobs must be at least 1")
+  if '/' in options.DIR.rstrip('/'):
+    usage("Cannot specify embedded directories for --dir")
+
+  options.IR_FILE = os.path.join(basedir, options.IR_FILE)
+  srcpath = os.path.dirname(options.IR_FILE)
+  options.DIR = os.path.join(srcpath, options.DIR.rstrip('/'))
+  options.L = [os.path.join(basedir, d) for d in options.L]
+  if not options.EXE_ARGS:
+    options.EXE_ARGS = readProgramInput(options.IR_FILE)
+  # input files are given to the program by absolute path, as it runs in --dir
+  options.EXE_ARGS = [os.path.abspath(a) if os.path.isfile(a) else a
+                      for a in options.EXE_ARGS]
+
+  # the options instrument.py builds with, without its build cache
+  options.READABLE = False
+  options.IRonly = False
+  options.GEN_DOT_GRAPH = False
+  options.WORK_DIR = options.DIR
+  options.cache = None
+  return options
+
+def readProgramInput(ir_file):
+  stem = os.path.basename(ir_file)
+  stem = stem[0 : stem.rfind(".")]
+  inputfile = os.path.join(os.path.dirname(ir_file), "input." + stem)
+  if not os.path.isfile(inputfile):
+    return []
+  with open(inputfile, 'r') as f:
+    return f.read().split()
+
+################################################################################
+def readCompileOptions(options):
+  '''
+    Return the passes options of the instrumented variants, and of the traced
+    one, from the compileOption of input.yaml beside IR_FILE
+  '''
+  inputyaml = os.path.join(os.path.dirname(options.IR_FILE), 'input.yaml')
+  try:
+    with open(inputyaml, 'r') as f:
+      doc = yaml.safe_load(f)
+  except (OSError, IOError):
+    raise BenchError("No input.yaml file in the %s directory." %
+                     os.path.dirname(inputyaml))
+  except yaml.YAMLError:
+    raise BenchError("input.yaml is not formatted in proper YAML (reminder: use spaces, not tabs)")
+  if not isinstance(doc, dict) or "compileOption" not in doc:
+    raise BenchError("Please include compileOptions in input.yaml.")
+
+  cOpt = doc["compileOption"]
+  if isinstance(cOpt, list):
+    if not cOpt or not isinstance(cOpt[0], dict):
+      raise BenchError("compileOption must not be an empty list in input.yaml.")
+    cOpt = cOpt[0]
+
+  traceOpt = cOpt.get("tracingPropagationOption") or {}
+  cOpt = dict((k, v) for k, v in cOpt.items()
+              if k not in ("tracingPropagation", "tracingPropagationOption"))
+  try:
+    compileOptions = instrument.readCompileOption(cOpt, options)
+  except instrument.InstrumentError as e:
+    raise BenchError(str(e))
+  traceOptions = compileOptions + ['-insttracepass']
+  if "maxTrace" in traceOpt:
+    traceOptions.extend(['-maxtrace', str(traceOpt["maxTrace"])])
+  return compileOptions, traceOptions
+
+def nativeSteps(options):
+  '''
+    Return the steps building the uninstrumented executable of IR_FILE
+  '''
+  srcbase = os.path.basename(options.IR_FILE)
+  progbin = os.path.join(options.DIR, srcbase[0 : srcbase.rfind(".")])
+  nativefile = progbin + "-native"
+
+  liblist = []
+  for lib_dir in options.L:
+    liblist.extend(["-L", lib_dir])
+  for lib in options.l:
+    liblist.append("-l" + lib)
+
+  execlist = [instrument.llcbin, '-filetype=obj', '-o', nativefile + '.o',
+              options.IR_FILE]
+  objstep = instrument.BuildStep('native.o', execlist, [options.IR_FILE],
+                                 [nativefile + '.o'])
+  execlist = [instrument.llvmgcc, '-o', nativefile + '.exe', nativefile + '.o']
+  execlist.extend(liblist)
+  fallback = [instrument.llvmgxx] + execlist[1:]
+  exestep = instrument.BuildStep('native.exe', execlist, [nativefile + '.o'],
+                                 [nativefile + '.exe'], deps=['native.o'],
+                                 fallback=fallback)
+  return [objstep, exestep], nativefile + '.exe'
+
+def buildVariants(options):
+  '''
+    Build the executables of every variant in options.DIR, and return them
+    by variant name
+  '''
+  compileOptions, traceOptions = readCompileOptions(options)
+  steps, nativeexe = nativeSteps(options)
+
+  srcbase = os.path.basename(options.IR_FILE)
+  progbin = os.path.join(options.DIR, srcbase[0 : srcbase.rfind(".")])
+  llfi_indexed_file = progbin + "-llfi_index"
+  execlist = [instrument.optbin, '-load', instrument.llfilib,
+              '-genllfiindexpass', '-o', llfi_indexed_file + '.bc',
+              options.IR_FILE]
+  steps.append(instrument.BuildStep('index', execlist, [options.IR_FILE],
+                                    [llfi_indexed_file + '.bc'],
+                                    tooldeps=[instrument.llfilib]))
+
+  passsteps, linksteps, proffile, fifile = instrument.variantSteps(
+      options, None, compileOptions, llfi_indexed_file)
+  steps.extend(passsteps + linksteps)
+  # only the profiling executable of the traced variant is run
+  passsteps, linksteps, tracedfile, _ = instrument.variantSteps(
+      options, 'traced', traceOptions, llfi_indexed_file)
+  steps.extend(s for s in passsteps + linksteps
+               if s.name.startswith('traced/profiling'))
+
+  failed = instrument.runBuildGraph(steps, options)
+  if failed is not None:
+    raise BenchError("unable to build the variants of %s, %s failed with "
+                     "return code %s" % (srcbase, failed.name, failed.retcode))
+  return {
+    'native': nativeexe,
+    'profiling': proffile + '.exe',
+    'faultinjection': fifile + '.exe',
+    'traced': tracedfile + '.exe',
+  }
+
+################################################################################
+def cleanRunDir(rundir):
+  for name in os.listdir(rundir):
+    path = os.path.join(rundir, name)
+    if os.path.isdir(path):
+      shutil.rmtree(path)
+    else:
+      os.remove(path)
+
+def runVariant(variant, exe, options, rundir):
+  '''
+    Run exe options.RUNS times in rundir, and return the time of every run,
+    the return code and the statistics files of the last one
+  '''
+  times = []
+  retcode = None
+  for _ in range(options.RUNS):
+    cleanRunDir(rundir)
+    if variant == 'faultinjection':
+      with open(os.path.join(rundir, "llfi.config.fi.txt"), 'w') as f:
+        f.write("fi_cycle=%d\n" % NO_FAULT_CYCLE)
+    start = time.perf_counter()
+    p = subprocess.Popen([exe] + options.EXE_ARGS, cwd=rundir,
+                         stdout=subprocess.DEVNULL)
+    p.wait()
+    times.append(time.perf_counter() - start)
+    retcode = p.returncode
+  return times, retcode
+
+def readTotalCycles(rundir):
+  with open(os.path.join(rundir, "llfi.stat.prof.txt"), 'r') as f:
+    for line in f:
+      if line.startswith("total_cycle="):
+        return int(line.split("=")[1])
+  raise BenchError("no total_cycle in the profile of the profiling variant")
+
+def traceSize(rundir):
+  #bytes and number of instructions of the golden trace
+  size = lines = 0
+  with open(os.path.join(rundir, "llfi.stat.trace.txt"), 'rb') as f:
+    for line in f:
+      if not line.startswith(b'#'):
+        size += len(line)
+        lines += 1
+  return size, lines
+
+def measure(exes, options):
+  '''
+    Run every variant, and return their median times, and the calls into
+    preFunc and printInstTracer and the trace of a run
+  '''
+  rundir = os.path.join(options.DIR, "run")
+  os.mkdir(rundir)
+  results = {}
+  for variant in VARIANTS:
+    print("Running the %s variant %d times..." % (variant, options.RUNS),
+          file=sys.stderr)
+    times, retcode = runVariant(variant, exes[variant], options, rundir)
+    results[variant] = {'median': statistics.median(times), 'min': min(times),
+                        'retcode': retcode}
+    if variant == 'profiling':
+      results['prefunc_calls'] = readTotalCycles(rundir)
+    elif variant == 'traced':
+      results['trace_bytes'], results['tracer_calls'] = traceSize(rundir)
+  return results
+
+def printResults(results, options):
+  native = results['native']
+  print("\n%s %s, %d runs per variant\n" % (
+        os.path.relpath(options.IR_FILE, basedir), ' '.join(options.EXE_ARGS),
+        options.RUNS))
+  print("%-15s %10s %10s %9s" % ("variant", "median(s)", "min(s)", "slowdown"))
+  for variant in VARIANTS:
+    r = results[variant]
+    slowdown = r['median'] / native['median'] if native['median'] > 0 else 0
+    line = "%-15s %10.4f %10.4f %8.2fx" % (variant, r['median'], r['min'],
+                                           slowdown)
+    if r['retcode'] != native['retcode']:
+      line += "  (return code %s, %s natively)" % (r['retcode'],
+                                                   native['retcode'])
+    print(line)
+  print()
+
+  for name, variant, calls in [
+      ("preFunc", 'faultinjection', results['prefunc_calls']),
+      ("printInstTracer", 'traced', results['tracer_calls'])]:
+    elapsed = results[variant]['median']
+    extra = elapsed - native['median']
+    print("%-16s %12d calls, %12.0f calls/s, %8.1f ns per call" % (
+          name + ':', calls, calls / elapsed if elapsed > 0 else 0,
+          1e9 * extra / calls if calls else 0))
+  if results['tracer_calls']:
+    print("%-16s %12d bytes, %12.1f bytes per instruction" % (
+          'trace:', results['trace_bytes'],
+          results['trace_bytes'] / results['tracer_calls']))
+
+################################################################################
+def run(args):
+  parser = initParser()
+  options = parseArgs(parser, args)
+  if os.path.exists(options.DIR):
+    usage(os.path.basename(options.DIR) + " already exists under " +
+          os.path.dirname(options.DIR) + ", you can either specify a " +
+          "different directory for --dir or remove it")
+  os.mkdir(options.DIR)
+
+  try:
+    exes = buildVariants(options)
+    results = measure(exes, options)
+  except BenchError as e:
+    print("\nERROR: " + str(e), file=sys.stderr)
+    sys.exit(1)
+  finally:
+    if not options.KEEP:
+      shutil.rmtree(options.DIR, ignore_errors=True)
+  printResults(results, options)
+
+if __name__=="__main__":
+  run(sys.argv[1:])
@@ -13,6 +13,133 @@ Prerequisites:
      outputs, if your output is not under current directory, you need to store
      that output by yourself.
   4. You need to put input files (if any) in the current working directory.
+
+A run configuration in runOption may give a plan instead of fi_cycle, fi_index
+or fi_rate. Its runs are then allocated across strata of instructions (by
+opcode, function or llfi_index range) using the site profile written by llfi-profile
+(profileSites in compileOption). Each run injects into a random dynamic
+instance of its stratum and is given a weight, recorded in
+log_output/planfile-run-<config>, so that llfi-stats can estimate
+program-level rates:
+  plan:
+    strata: opcode        # opcode/function/indexRange
+    rangeSize: 100        # llfi indices per stratum, for indexRange
+    allocation: equal     # equal/proportional runs per stratum
+
+With --exhaustive, every fault of the space (dynamic instruction, register,
+bit) is injected once, for each run configuration, from the site profile and
+the registers and bit widths of each site in the catalog of FI_EXE
+(llfi.stat.catalog.txt, written by llfi-instrument). When injecting into
+destination registers, the faults into a value that is never read (per the
+catalog) are all equivalent to one another, and a single one of them is
+injected in their stead. The space can be split with --shard I/N across
+workers, and a stopped campaign resumes where it left off when run again:
+completed faults are journaled in log_output/planfile-run-<config>, with the
+share of the space each of them stands for as weight.
+
+With --cache, the outcome of every run (return code, time and output files)
+is recorded in a cache shared across campaigns, keyed on FI_EXE and the LLFI
+runtime library, its arguments and input files, and the fully resolved fault.
+A run identical to a recorded one reuses its outcome instead of executing.
+Each run is then given a seed for the random choices of the runtime
+(fi_seed), drawn from the seed of its run configuration in runOption if there
+is one, so that a campaign with a seed can be replayed from the cache. This
+assumes the program itself is deterministic.
+
+Instead of the static timeOut, input.yaml may give an adaptiveTimeOut, which
+derives the timeout of FI_EXE from the time of the golden run recorded by
+llfi-profile (baseline/golden_time):
+  adaptiveTimeOut:
+    factor: 10    # timeout = factor * golden time + slack, in seconds
+    slack: 1
+    min: 1        # bounds of the timeout, max defaults to timeOut
+    max: 500
+The number of hangs, and how long they took to detect, is then reported in the
+summary of each run configuration.
+
+With heartbeat in input.yaml, FI_EXE publishes its cycle counter to the
+harness while it runs, and a run is considered hung as soon as neither the
+counter nor the CPU time of FI_EXE advance for stallInterval seconds, or the
+counter passes cycleFactor times the total cycles of the profiling run,
+instead of only at the timeout:
+  heartbeat:
+    stallInterval: 10  # seconds
+    cycleFactor: 10    # 0 to only detect stalls
+    pollInterval: 0.1  # seconds between two reads of the counter
+Only instrumented code advances the counter: a run blocked for longer than
+stallInterval in a system call, on I/O or in sleep() is killed as stalled,
+so stallInterval must exceed the longest such wait of the program. A run
+looping in uninstrumented library code uses CPU time and is only caught at
+the timeout.
+
+The log of every run (log_output/logfile-run-<run>.txt) records its return
+code and time, and the resource usage of FI_EXE reported by wait4(): user and
+system CPU time, max RSS (KiB), major and minor page faults, and the signal
+that terminated it. The usage is summarized per run configuration, and
+aggregated by llfi-stats.
+
+The resources of each run can be limited with runLimits in input.yaml. Sizes
+are in bytes, or with a K, M or G suffix:
+  runLimits:
+    memory: 4G          # RLIMIT_AS
+    fileSize: 1G        # RLIMIT_FSIZE
+    openFiles: 1024     # RLIMIT_NOFILE
+    cgroup:             # cgroup v2 limits, if the controllers are delegated
+      path: /sys/fs/cgroup/llfi   # parent of the run cgroups (default: own)
+      memory: 4G        # memory.max
+      cpu: 1            # cpu.max, in CPUs
+    memoryPressure: 10  # wait before each run while the "some avg10" memory
+                        # pressure of the host (/proc/pressure/memory) is
+                        # above this percentage
+Runs killed by a limit (SIGXCPU at the timeout in CPU time, SIGXFSZ, or the
+OOM killer of their cgroup) are logged with the limit they hit. Exceeding
+RLIMIT_AS makes allocations fail instead, which the program itself may or
+may not survive.
+
+With --jobs N, N runs are executed in parallel, each in its own directory
+under llfi/workers (with copies of the input files given in EXE_ARGS),
+rather than in the current directory. The faults of the runs do not depend
+on N. With --cpus, every job is pinned to its own CPUs, and llfi-inject
+itself to the CPUs left, so that the times of the runs are comparable.
+
+With --jobs auto, the first runs of the campaign calibrate the number of
+jobs: they are executed with 1, 2, 4... jobs (up to one per CPU) while the
+throughput keeps improving and the memory pressure and available memory of
+the host stay healthy. The throughput curve and the number of jobs selected
+are recorded in log_output/jobs-calibration.
+
+The progress bar shows the throughput of the run configuration and an ETA.
+With --telemetry, the progress of each run configuration is also exported in
+the Prometheus text format to log_output/telemetry.prom, refreshed every
+--telemetry-interval seconds, and with --telemetry-port, served on that port
+of localhost: runs completed and planned, runs/s, ETA, the counts of each
+return code and of hangs, and the average time of FI_EXE and overhead of the
+harness per run.
+
+With --profile-harness, every phase of every run (waiting for a worker,
+writing llfi.config.fi.txt, the directory snapshot, spawning FI_EXE, waiting
+for it, moving its outputs, replenishing the input files, logging...) is
+timed with perf_counter_ns, and written to log_output/harness-profile.jsonl,
+one line per run:
+  {"run":"0-3","slot":1,"start":1234,"phases":[["queue",812],["config",40511],...]}
+with the start of the run and the duration of each phase, in order, in
+nanoseconds. llfi-stats --harness summarizes them.
+
+The campaign can also be driven from Python, without llfi-inject, through
+Campaign and RunSpec. A Campaign reads input.yaml (or a doc given to it) and
+sets up the directories and workers of FI_EXE, and its asynchronous run()
+launches RunSpecs, at most jobs at a time, yielding each outcome as its run
+finishes:
+  campaign = inject.Campaign("llfi/prog-faultinjection.exe", ["data.in"],
+                             jobs=4)
+  specs = campaign.configRuns(0, campaign.doc["runOption"][0])
+  async for spec, outcome in campaign.run(specs):
+    print(spec.run_id, outcome["code"])
+The outcome of a run is a dict with its return code (ret, and code, 'TO' for
+hangs), time, hang reason, resource usage, the time spent in the harness
+(harness) and whether it was reused from the cache (cached), and it is logged
+like the runs of llfi-inject. runAll() runs specs to completion from
+synchronous code. Errors in the configuration raise InjectError.
 """
 
 # This script injects faults the program and produces output
@@ -25,12 +152,36 @@ import random
 import shutil
 import argparse
 import resource
+import math
+import mmap
+import struct
+import signal
 import glob
-import threading
+import json
+import itertools
+import asyncio
+import bisect
 from collections import defaultdict
 
+script_path = os.path.realpath(os.path.dirname(__file__))
+sys.path.append(os.path.join(script_path, '../tools'))
+from tracetools import readCatalog
+import buildcache
+import outcomecache
+import telemetry
+
 runOverride = False
-timeout = 500
+DEFAULT_TIMEOUT = 500
+HEARTBEAT_MAGIC = b"LLFIHB01"
+HEARTBEAT = struct.Struct("=8sQ")
+# seconds a hung run is given to exit after SIGTERM, before SIGKILL
+HANG_KILL_GRACE = 1.0
+# --jobs auto: runs per job at each level of concurrency tried, the minimum
+# relative throughput gain to keep going, and the health of the host required
+CALIBRATION_RUNS_PER_JOB = 4
+CALIBRATION_GAIN = 0.1
+CALIBRATION_MAX_PRESSURE = 10.0
+CALIBRATION_MIN_MEMORY = 0.1
 
 basedir = os.getcwd()
 prog = os.path.basename(sys.argv[0])
@@ -39,6 +190,9 @@ yaml_options = {
   "verbose": False,
 }
 
+class InjectError(Exception):
+  pass
+
 def usage(msg = None):
   retval = 0
   if msg is not None:
@@ -61,13 +215,45 @@ def initParser():
   parser.add_argument('FI_EXE', help='instrumented executable')
   parser.add_argument('EXE_ARGS', nargs='*',
                       help='arguments to FI_EXE used during profiling')
+  parser.add_argument('--exhaustive', action='store_true', dest='EXHAUSTIVE',
+                      help='inject every fault of the fault space')
+  parser.add_argument('--shard', default='0/1', dest='SHARD',
+                      help='only inject the faults of shard I out of N, as I/N, \
+                      for --exhaustive')
+  parser.add_argument('--cache', action='store_true', dest='USE_CACHE',
+                      help='reuse the recorded outcomes of identical runs')
+  parser.add_argument('--cache-dir', default=buildcache.defaultCacheDir(),
+                      dest='CACHE_DIR',
+                      help='location of the outcome cache (default: %(default)s)')
+  parser.add_argument('-j', '--jobs', default='1', dest='JOBS',
+                      help='number of runs executed in parallel, or auto to \
+                      calibrate it on the first runs (default: %(default)s)')
+  parser.add_argument('--cpus', dest='CPUS',
+                      help='pin each job to its own CPUs, split from a list \
+                      like 0-3,8, or from all but the first CPU with auto')
+  parser.add_argument('--telemetry', action='store_true', dest='TELEMETRY',
+                      help='export the progress of the campaign to \
+                      log_output/telemetry.prom')
+  parser.add_argument('--telemetry-port', type=int, dest='TELEMETRY_PORT',
+                      help='also serve the telemetry on this port of localhost')
+  parser.add_argument('--profile-harness', action='store_true',
+                      dest='PROFILE_HARNESS',
+                      help='time the phases of every run, to \
+                      log_output/harness-profile.jsonl')
+  parser.add_argument('--telemetry-interval', type=float, default=5.0,
+                      dest='TELEMETRY_INTERVAL',
+                      help='seconds between two refreshes of the telemetry \
+                      file (default: %(default)s)')
   return parser
 
 
 def parseArgs(parser, args):
   options = parser.parse_args(args)
   options.FI_EXE = os.path.realpath(options.FI_EXE)
-  if os.path.dirname(os.path.dirname(options.FI_EXE)) != basedir:
+  # FI_EXE is either in the llfi directory under the current directory, or in
+  # the directory of a compileOption variant below it
+  exedir = os.path.dirname(options.FI_EXE)
+  if exedir == basedir or not exedir.startswith(basedir + os.sep):
     usage("You need to invoke llfi-inject at the parent directory of FI_EXE")
 
   # remove the directory prefix for input files, this is to make it easier for the program
@@ -79,179 +265,1245 @@ def parseArgs(parser, args):
       else:
         options.EXE_ARGS[index] = os.path.basename(opt)
 
+  try:
+    shard, nshards = [int(x) for x in options.SHARD.split('/')]
+    assert 0 <= shard < nshards
+  except (ValueError, AssertionError):
+    usage("--shard must be I/N, with 0 <= I < N")
+  options.SHARD = (shard, nshards)
+  if options.JOBS != 'auto':
+    try:
+      options.JOBS = int(options.JOBS)
+      assert options.JOBS >= 1
+    except (ValueError, AssertionError):
+      usage("--jobs must be auto or at least 1")
+  if options.TELEMETRY_INTERVAL <= 0:
+    usage("--telemetry-interval must be greater than 0")
+
+  options.cache = None
+  if options.USE_CACHE:
+    options.cache = outcomecache.outcomeCache(options.CACHE_DIR)
+
   return options
 
-def checkInputYaml():
-  global timeout, doc
+def loadInputYaml(workdir):
+  global runOverride
   #Check for input.yaml's presence
   try:
-    f = open(os.path.join(basedir, 'input.yaml'),'r')
-  except:
-    usage("No input.yaml file in the parent directory of FI_EXE")
-    exit(1)
+    f = open(os.path.join(workdir, 'input.yaml'),'r')
+  except (IOError, OSError):
+    raise InjectError("No input.yaml file in the parent directory of FI_EXE")
 
   #Check for input.yaml's correct formmating
   try:
-    doc = yaml.load(f)
-    f.close()
-    if "kernelOption" in doc:
-      for opt in doc["kernelOption"]:
-        if opt=="forceRun":
-          runOverride = True
-          print("Kernel: Forcing run")
-    if "timeOut" in doc:
+    with f:
+      doc = yaml.safe_load(f)
+  except yaml.YAMLError:
+    raise InjectError("input.yaml is not formatted in proper YAML (reminder: "
+                      "use spaces, not tabs)")
+  if not isinstance(doc, dict):
+    raise InjectError("input.yaml must be a mapping of LLFI options")
+  if "kernelOption" in doc:
+    for opt in doc["kernelOption"]:
+      if opt=="forceRun":
+        runOverride = True
+        print("Kernel: Forcing run")
+  if "timeOut" in doc:
+    try:
       timeout = int(doc["timeOut"])
-      assert timeout > 0, "The timeOut option must be greater than 0"
-    else:
-      print("Run FI_EXE with default timeout " + str(timeout))
-  except:
-    usage("input.yaml is not formatted in proper YAML (reminder: use spaces, not tabs)")
-    exit(1)
+    except (TypeError, ValueError):
+      timeout = 0
+    if timeout <= 0:
+      raise InjectError("The timeOut option must be greater than 0")
+  return doc
+
+def configTimeout(doc, fi_exe):
+  '''
+    Return the timeout of FI_EXE, the wall-clock time allowed on top of it
+    before a run is considered hung, and what the outcome cache keys the
+    timeout on. The timeout is derived from the golden run time recorded by
+    llfi-profile if adaptiveTimeOut is given in input.yaml, and then keyed on
+    the parameters of adaptiveTimeOut: the golden run time varies with every
+    llfi-profile.
+  '''
+  if "timeOut" in doc:
+    timeout = int(doc["timeOut"])
+  else:
+    timeout = DEFAULT_TIMEOUT
+    print("Run FI_EXE with default timeout " + str(timeout))
+  # padding, that way we only catch the problematic hangs
+  padding = 1
+  if "adaptiveTimeOut" not in doc:
+    return timeout, padding, timeout
+  opt = doc["adaptiveTimeOut"] or {}
+  try:
+    factor = float(opt.get("factor", 10))
+    slack = float(opt.get("slack", 1))
+    lower = float(opt.get("min", 1))
+    upper = float(opt.get("max", timeout))
+    assert factor > 0 and slack >= 0 and 0 < lower <= upper
+  except (AttributeError, ValueError, AssertionError):
+    raise InjectError("adaptiveTimeOut must have a positive factor, a "
+                      "non-negative slack and 0 < min <= max")
+
+  golden_file = os.path.join(os.path.dirname(fi_exe), "baseline", "golden_time")
+  try:
+    with open(golden_file) as f:
+      golden = float(f.read())
+  except (IOError, OSError, ValueError):
+    print("WARNING: no golden run time in " + golden_file + ", run llfi-profile "
+          "first. Run FI_EXE with timeout " + str(timeout))
+    return timeout, padding, timeout
+
+  timeout = min(max(factor * golden + slack, lower), upper)
+  print("Run FI_EXE with timeout %.3f (golden run %.3f)" % (timeout, golden))
+  # the slack already accounts for the variance of the run time
+  return timeout, 0, ("adaptiveTimeOut", factor, slack, lower, upper)
 
 
-def print_progressbar(idx, nruns):
+def print_progressbar(idx, nruns, status=None):
   pct = (float(idx) / float(nruns))
   WIDTH = 50
   bar = "=" *  int(pct * WIDTH)
   bar += ">"
   bar += "-" * (WIDTH - int(pct * WIDTH))
-  print(("\r[%s] %.1f%% (%d / %d)" % (bar, pct * 100, idx, nruns)), end=' ')
+  line = "\r[%s] %.1f%% (%d / %d)" % (bar, pct * 100, idx, nruns)
+  if status:
+    # padded to overwrite a longer status
+    line += " %-30s" % status
+  print(line, end=' ')
   sys.stdout.flush()
 
 
 ################################################################################
-def config(fi_exe):
-  global inputdir, outputdir, errordir, stddir, llfi_stat_dir, logdir
-  # config
-  llfi_dir = os.path.dirname(fi_exe)
-  inputdir = os.path.join(llfi_dir, "prog_input")
-  outputdir = os.path.join(llfi_dir, "prog_output")
-  errordir = os.path.join(llfi_dir, "error_output")
-  stddir = os.path.join(llfi_dir, "std_output")
-  logdir = os.path.join(llfi_dir, "log_output")
-  llfi_stat_dir = os.path.join(llfi_dir, "llfi_stat_output")
-
-  if not os.path.isdir(outputdir):
-    os.mkdir(outputdir)
-  if not os.path.isdir(errordir):
-    os.mkdir(errordir)
-  if not os.path.isdir(inputdir):
-    os.mkdir(inputdir)
-  if not os.path.isdir(stddir):
-    os.mkdir(stddir)
-  if not os.path.isdir(logdir):
-    os.mkdir(logdir)
-  if not os.path.isdir(llfi_stat_dir):
-    os.mkdir(llfi_stat_dir)
+def configHeartbeat(doc, totalcycles):
+  #hang detection from the cycle counter published by the runtime, if enabled
+  if "heartbeat" not in doc:
+    return None
+  opt = doc["heartbeat"] or {}
+  try:
+    heartbeat = {
+      "stall": float(opt.get("stallInterval", 10)),
+      "cycleFactor": float(opt.get("cycleFactor", 10)),
+      "poll": float(opt.get("pollInterval", 0.1)),
+    }
+    assert heartbeat["stall"] > 0 and heartbeat["poll"] > 0
+    assert heartbeat["cycleFactor"] >= 0
+  except (AttributeError, ValueError, AssertionError):
+    raise InjectError("heartbeat must have a positive stallInterval and "
+                      "pollInterval, and a non-negative cycleFactor")
+  heartbeat["cycles"] = heartbeat["cycleFactor"] * int(totalcycles)
+  return heartbeat
 
 ################################################################################
-def set_timeout():
-  resource.setrlimit(resource.RLIMIT_CPU, (timeout, timeout))
-
-def execute(execlist):
-  global outputfile
-  global return_codes
-
-  # stores the process obj and the process execution time.
-  # this is an array so we can modify it directly in run_prog()
-  p = [None, None]
-  def run_prog():
-    # Run process!
-    p_time = -time.time()
-    p[0] = subprocess.Popen(execlist, stdout = outputFile,
-                            preexec_fn = set_timeout)
-    p[0].communicate()
-    p_time += time.time()
-    p[1] = p_time
-
-  #get state of directory
-  dirSnapshot()
-
-  with open(outputfile, "w") as outputFile:
-    # Some process hangs aren't solved by setrlimit(), so they're now spawned
-    # in a thread that is joined with a timeout. This is a hack, but I'm not
-    # sure of a better way to do this.
-    t = threading.Thread(target=run_prog)
-    t.start()
-    # +1 for padding, that way we only catch the problematic hangs
-    t.join(timeout + 1)
-
-    if not t.is_alive():
-      p_retcode = p[0].returncode
-    else:
-      # Process hang, terminate it and manually set return code info
-      p[0].terminate()
-      p[0].returncode = -9 # timeout
-      p[1] = timeout
-      p_retcode = -9
-
-  moveOutput()
-  replenishInput() #for cases where program deletes input or alters them each run
-
-  # return code -9 is from a timeout
-  if p_retcode != -9:
-    return_codes[p_retcode] += 1
-  else:
-    p_retcode = 'timed-out'
-    return_codes['TO'] += 1
-
-  return (str(p[0].returncode), p[1])
+def parseSize(val):
+  #size in bytes, from an integer or a string with a K, M or G suffix
+  if isinstance(val, str) and val[-1:].upper() in ('K', 'M', 'G'):
+    return int(float(val[:-1]) * 1024 ** ('KMG'.index(val[-1].upper()) + 1))
+  return int(val)
+
+def cgroupPath():
+  #cgroup v2 directory of this process
+  with open("/proc/self/cgroup") as f:
+    for line in f:
+      if line.startswith("0::"):
+        return "/sys/fs/cgroup" + line[3:].strip()
+  raise OSError("not in a cgroup v2 hierarchy")
+
+def configLimits(doc):
+  #resource limits of the runs from runLimits, if given
+  if "runLimits" not in doc:
+    return None
+  opt = doc["runLimits"] or {}
+  try:
+    limits = {"rlimits": [], "cgroup": None, "pressure": None}
+    for key, rlimit in (("memory", resource.RLIMIT_AS),
+                        ("fileSize", resource.RLIMIT_FSIZE),
+                        ("openFiles", resource.RLIMIT_NOFILE)):
+      if key in opt:
+        val = parseSize(opt[key])
+        assert val > 0
+        limits["rlimits"].append((rlimit, val))
+    if "memoryPressure" in opt:
+      limits["pressure"] = float(opt["memoryPressure"])
+      assert 0 <= limits["pressure"] < 100
+    cgopt = opt.get("cgroup")
+  except (AttributeError, TypeError, ValueError, AssertionError):
+    raise InjectError("runLimits sizes must be positive, optionally with a K, "
+                      "M or G suffix, and memoryPressure a percentage")
+
+  if cgopt:
+    try:
+      cg = {"path": cgopt.get("path") or cgroupPath(), "files": []}
+      if "memory" in cgopt:
+        cg["files"].append(("memory.max", str(parseSize(cgopt["memory"]))))
+      if "cpu" in cgopt:
+        period = 100000
+        cg["files"].append(("cpu.max", "%d %d" % (float(cgopt["cpu"]) * period,
+                                                  period)))
+      controllers = open(os.path.join(cg["path"],
+                                      "cgroup.subtree_control")).read().split()
+      missing = [f.split('.')[0] for f, _ in cg["files"]
+                 if f.split('.')[0] not in controllers]
+      if missing:
+        raise OSError("the " + ", ".join(missing) + " controllers are not "
+                      "enabled in " + cg["path"])
+      limits["cgroup"] = cg
+    except (OSError, ValueError) as e:
+      print("WARNING: cgroup limits disabled: " + str(e))
+  if limits["pressure"] is not None and not os.path.isfile("/proc/pressure/memory"):
+    print("WARNING: memoryPressure ignored, /proc/pressure/memory is unavailable")
+    limits["pressure"] = None
+  return limits
+
+def memoryPressure():
+  #"some avg10" memory pressure of the host, in percent
+  with open("/proc/pressure/memory") as f:
+    for line in f:
+      if line.startswith("some"):
+        return float(line.split()[1].split("=")[1])
+  return 0.0
+
+def cpuTime(pid):
+  #user and system CPU time of process pid in clock ticks, from /proc, or
+  #None if it is gone
+  try:
+    with open("/proc/%d/stat" % pid) as f:
+      stat = f.read()
+  except (IOError, OSError):
+    return None
+  # the fields after the command name, which may contain spaces
+  flds = stat[stat.rindex(")") + 2:].split()
+  return int(flds[11]) + int(flds[12])
+
+def memoryAvailable():
+  #fraction of the memory of the host available, from /proc/meminfo
+  info = {}
+  try:
+    with open("/proc/meminfo") as f:
+      for line in f:
+        key, val = line.split(":", 1)
+        info[key] = int(val.split()[0])
+    return float(info["MemAvailable"]) / info["MemTotal"]
+  except (IOError, OSError, KeyError, ValueError, ZeroDivisionError):
+    return 1.0
+
+def removeRunCgroup(cg):
+  '''
+    Remove the cgroup of a run, returning whether the OOM killer killed
+    processes in it
+  '''
+  oom = False
+  try:
+    with open(os.path.join(cg, "memory.events")) as f:
+      for line in f:
+        key, val = line.split()
+        oom = oom or (key == "oom_kill" and int(val) > 0)
+  except (IOError, OSError, ValueError):
+    pass
+  try:
+    os.rmdir(cg)
+  except OSError:
+    pass
+  return oom
+
+def limitHit(usage, oom):
+  #the limit that killed the run, if any
+  if oom:
+    return "memory"
+  if usage is None:
+    return None
+  if usage["signal"] == signal.SIGXCPU:
+    return "cpu"
+  if usage["signal"] == signal.SIGXFSZ:
+    return "file size"
+  return None
+
+def waitProcess(pid):
+  '''
+    Future of the wait4() result of the child pid, once it exits. The child is
+    reaped from a pidfd watched by the event loop where it is available, and
+    from a thread otherwise.
+  '''
+  loop = asyncio.get_running_loop()
+  try:
+    pidfd = os.pidfd_open(pid)
+  except (AttributeError, OSError):
+    return loop.run_in_executor(None, os.wait4, pid, 0)
+  exited = loop.create_future()
+  def reap():
+    loop.remove_reader(pidfd)
+    os.close(pidfd)
+    try:
+      exited.set_result(os.wait4(pid, 0))
+    except OSError as e:
+      exited.set_exception(e)
+  loop.add_reader(pidfd, reap)
+  return exited
 
 ################################################################################
-def storeInputFiles(exe_args):
-  global inputList
-  inputList=[]
-  for opt in exe_args:
-    if os.path.isfile(opt):#stores all files in inputList and copy over to inputdir
-      shutil.copy2(opt, os.path.join(inputdir, opt))
-      inputList.append(opt)
+def readCycles(llfi_dir):
+  #total cycles of the profiling run, profiled beside FI_EXE by llfi-profile
+  try:
+    profinput= open(os.path.join(llfi_dir, "llfi.stat.prof.txt"),"r")
+  except (IOError, OSError):
+    raise InjectError("No profile llfi.stat.prof.txt in " + llfi_dir + ", "
+                      "run llfi profile on the profiling executable there first.")
+  while 1:
+    line = profinput.readline()
+    if line.strip():
+      if line[0] == 't':
+        label, totalcycles = line.split("=")
+        break
+  profinput.close()
+  return totalcycles
 
-################################################################################
-def replenishInput():#TODO make condition to skip this if input is present
-  for each in inputList:
-    if not os.path.isfile(each):#copy deleted inputfiles back to basedir
-      shutil.copy2(os.path.join(inputdir, each), each)
+def runtimeLib():
+  #the LLFI runtime library, which fault injection executables are linked to
+  libname = "libllfi-rt.dylib" if sys.platform == "darwin" else "libllfi-rt.so"
+  return os.path.join(script_path, "../runtime_lib", libname)
+
+def faultRate(runOpt, totalcycles):
+  #fi_rate of a run configuration, from fi_rate or fi_exp, or None
+  if "fi_exp" in runOpt:
+    if runOpt["fi_exp"] == 0:
+      return 0
+    return int(int(totalcycles) / runOpt["fi_exp"])
+  return runOpt.get("fi_rate")
 
 ################################################################################
-def moveOutput():
-  #move all newly created files
-  newfiles = [_file for _file in os.listdir(".")]
-  for each in newfiles:
-    if each not in dirBefore:
-      fileSize = os.stat(each).st_size
-      if fileSize == 0 and each.startswith("llfi"):
-        #empty library output, can delete
-        #print each+ " is going to be deleted for having size of " + str(fileSize)
-        os.remove(each)
+class RunSpec:
+  '''
+    A run of FI_EXE: its id, which names its outputs, and its fault, the
+    runtime configuration written to llfi.config.fi.txt (fi_cycle, fi_index,
+    fi_bit...). info is left to the caller, to tell its runs apart.
+  '''
+  def __init__(self, run_id, fault, info=None):
+    self.run_id = run_id
+    self.fault = fault
+    self.info = info
+
+  def ficonfig(self):
+    return "".join("{}={}\n".format(key, val) for key, val in self.fault.items())
+
+class phaseLog:
+  '''
+    Timestamps of the phases of a run, with perf_counter_ns, for
+    --profile-harness. mark(phase) ends phase, which started at the previous
+    mark. A disabled log ignores the marks.
+  '''
+  def __init__(self, enabled=True):
+    self.enabled = enabled
+    self.phases = []
+    if enabled:
+      self.start = self.last = time.perf_counter_ns()
+
+  def mark(self, phase):
+    if self.enabled:
+      now = time.perf_counter_ns()
+      self.phases.append((phase, now - self.last))
+      self.last = now
+
+class runSlot:
+  '''
+    A worker running FI_EXE: the directory its runs execute in, the file of
+    their heartbeat and the CPUs they are pinned to (None to not pin them)
+  '''
+  def __init__(self, index, directory, heartbeat, cpus=None):
+    self.index = index
+    self.dir = directory
+    self.cpus = cpus
+    self.heartbeat = heartbeat
+
+def parseCpuList(cpulist):
+  #CPUs of a list like 0-3,8,10-11
+  cpus = []
+  for part in cpulist.split(','):
+    lo, _, hi = part.partition('-')
+    cpus.extend(range(int(lo), int(hi or lo) + 1))
+  return cpus
+
+class Campaign:
+  '''
+    The fault injection runs of fi_exe, with its arguments exe_args, from
+    workdir (the parent directory of the llfi directory of fi_exe, by default
+    the current directory) and the options of doc (by default its
+    input.yaml). At most jobs runs execute at a time, or with 'auto', as many
+    as calibrated on the first runs. cpus pins every job to its own CPUs, from
+    a list of CPUs, a string like 0-3,8, or 'auto', and keeps the calling
+    process off them until close(). cache is an outcomeCache
+    to reuse the outcomes of identical runs, if given. profile is the file the
+    phases of every run are written to, as JSON lines, if given.
+  '''
+  def __init__(self, fi_exe, exe_args=(), workdir=None, doc=None, jobs=1,
+               cpus=None, cache=None, profile=None):
+    self.fi_exe = os.path.realpath(fi_exe)
+    self.exe_args = list(exe_args)
+    self.workdir = os.path.realpath(workdir or os.getcwd())
+    self.jobs = jobs
+    self.cache = cache
+    self.profile = None
+    # the CPU affinity of llfi-inject before --cpus moved it off the workers
+    self.affinity = None
+    if not os.path.isfile(self.fi_exe):
+      raise InjectError("The executable " + self.fi_exe + " does not exist.\n"
+                        "Please build the executables with create-executables.")
+    self.doc = doc if doc is not None else loadInputYaml(self.workdir)
+    self._configDirs()
+    self.timeout, self.timeout_padding, self.timeoutKey = \
+      configTimeout(self.doc, self.fi_exe)
+
+    # get total num of cycles
+    self.totalcycles = readCycles(self.llfi_dir)
+    self.heartbeat = configHeartbeat(self.doc, self.totalcycles)
+    self.limits = configLimits(self.doc)
+    self._storeInputFiles()
+    if self.cache is not None:
+      # the injection logic is in the runtime FI_EXE links against
+      runtime = runtimeLib()
+      self.runtimeHash = buildcache.hashFile(runtime) if os.path.isfile(runtime) \
+                         else None
+    self._setupSlots(cpus)
+    if profile is not None:
+      self.profile = open(profile, "w")
+      self.profileStart = time.perf_counter_ns()
+
+  def close(self):
+    if self.profile is not None:
+      self.profile.close()
+      self.profile = None
+    if self.affinity is not None:
+      os.sched_setaffinity(0, self.affinity)
+      self.affinity = None
+
+  def _configDirs(self):
+    self.llfi_dir = os.path.dirname(self.fi_exe)
+    self.inputdir = os.path.join(self.llfi_dir, "prog_input")
+    self.outputdir = os.path.join(self.llfi_dir, "prog_output")
+    self.errordir = os.path.join(self.llfi_dir, "error_output")
+    self.stddir = os.path.join(self.llfi_dir, "std_output")
+    self.logdir = os.path.join(self.llfi_dir, "log_output")
+    self.llfi_stat_dir = os.path.join(self.llfi_dir, "llfi_stat_output")
+    for directory in (self.outputdir, self.errordir, self.inputdir,
+                      self.stddir, self.logdir, self.llfi_stat_dir):
+      if not os.path.isdir(directory):
+        os.mkdir(directory)
+
+  def _storeInputFiles(self):
+    #stores all files in inputList and copy over to inputdir
+    self.inputList = []
+    for opt in self.exe_args:
+      path = os.path.join(self.workdir, opt)
+      if os.path.isfile(path):
+        shutil.copy2(path, os.path.join(self.inputdir, opt))
+        self.inputList.append(opt)
+
+  def _setupSlots(self, cpulist):
+    '''
+      Create the worker slots. A single worker runs FI_EXE in workdir, several
+      each run it in their own directory under llfi/workers with copies of
+      the input files.
+    '''
+    available = sorted(os.sched_getaffinity(0))
+    # --jobs auto may use up to one job per CPU
+    nslots = self.jobs if self.jobs != 'auto' else len(available)
+    cpus = [None] * nslots
+    if cpulist:
+      if cpulist == 'auto':
+        # leave the first CPU to the harness
+        pool = available[1:] if len(available) > 1 else available
+      elif isinstance(cpulist, str):
+        try:
+          pool = parseCpuList(cpulist)
+        except ValueError:
+          raise InjectError("--cpus must be auto or a list of CPUs like 0-3,8")
+      else:
+        pool = list(cpulist)
+      if self.jobs == 'auto':
+        nslots = len(pool)
+      if len(pool) < nslots:
+        raise InjectError("--cpus gives %d CPUs for %d jobs" % (len(pool), nslots))
+      per = len(pool) // nslots
+      cpus = [pool[i * per:(i + 1) * per] for i in range(nslots)]
+      # keep the harness off the CPUs of the workers
+      harness = set(available) - set(pool[:per * nslots])
+      if harness:
+        self.affinity = available
+        os.sched_setaffinity(0, harness)
+      else:
+        print("WARNING: no CPU left to llfi-inject, it shares them with the "
+              "workers")
+
+    def heartbeat(i):
+      return os.path.join(self.llfi_dir, "llfi.heartbeat.{}".format(i))
+    if nslots == 1:
+      self.slots = [runSlot(0, self.workdir, heartbeat(0), cpus[0])]
+      return
+    self.slots = []
+    for i in range(nslots):
+      directory = os.path.join(self.llfi_dir, "workers", str(i))
+      if not os.path.isdir(directory):
+        os.makedirs(directory)
+      self.replenishInput(directory)
+      self.slots.append(runSlot(i, directory, heartbeat(i), cpus[i]))
+
+  ##############################################################################
+  def configRuns(self, ii, runOpt):
+    '''
+      The RunSpecs of run configuration ii of runOption, from its run dict
+      runOpt. The faults of all runs are drawn up front, in order, so that
+      they do not depend on the order in which the runs complete.
+    '''
+    if "numOfRuns" not in runOpt:
+      raise InjectError("Must include a run number per fi config in input.yaml.")
+
+    run_number=runOpt["numOfRuns"]
+    checkValues("run_number", run_number)
+
+    # a seeded configuration draws the same faults, and fi_seed, every time
+    seeded = "seed" in runOpt
+    if seeded:
+      checkValues("seed", runOpt["seed"])
+      random.seed(runOpt["seed"])
+
+    for key in ("fi_type", "fi_cycle", "fi_rate", "fi_exp", "fi_index",
+                "fi_reg_index", "fi_bit"):
+      if key in runOpt:
+        checkValues(key, runOpt[key], totalcycles=self.totalcycles)
+    fi_rate = faultRate(runOpt, self.totalcycles)
+
+    if "fi_cycle" not in runOpt and "fi_index" in runOpt:
+      print(("\nINFO: You choose to inject faults based on LLFI index, "
+             "this will inject into every runtime instruction whose LLFI "
+             "index is %d\n" % runOpt["fi_index"]))
+
+    need_to_calc_fi_cycle = "fi_cycle" not in runOpt and \
+                            "fi_index" not in runOpt and fi_rate is None
+
+    plan = None
+    if "plan" in runOpt:
+      if not need_to_calc_fi_cycle:
+        raise InjectError("A plan cannot be combined with fi_cycle, fi_index, "
+                          "fi_rate or fi_exp in input.yaml.")
+      plan = makePlan(runOpt["plan"], run_number, self)
+      writePlan(plan, ii, self.logdir)
+      need_to_calc_fi_cycle = False
+
+    specs = []
+    for index in range(0, run_number):
+      fault = {}
+      if plan is not None:
+        fault["fi_index"] = plan[index][1]
+        fault["fi_index_instance"] = plan[index][2]
+      elif need_to_calc_fi_cycle:
+        fault["fi_cycle"] = random.randint(0, int(self.totalcycles) - 1)
+      elif "fi_cycle" in runOpt:
+        fault["fi_cycle"] = runOpt["fi_cycle"]
+      elif "fi_index" in runOpt:
+        fault["fi_index"] = runOpt["fi_index"]
+      else:
+        fault["fi_rate"] = fi_rate
+
+      for key in ("fi_type", "fi_reg_index", "fi_bit"):
+        if key in runOpt:
+          fault[key] = runOpt[key]
+      if seeded or self.cache is not None:
+        fault["fi_seed"] = random.getrandbits(31)
+      specs.append(RunSpec(str(ii)+"-"+str(index), fault))
+    return specs
+
+  ##############################################################################
+  async def run(self, specs):
+    '''
+      Asynchronous generator running the RunSpecs of the iterable specs, and
+      yielding (spec, outcome) for each of them in order of completion. specs
+      is consumed as workers free up, so that it can be a generator. With
+      jobs 'auto', the first runs calibrate the number of jobs.
+    '''
+    specs = iter(specs)
+    if self.jobs == 'auto':
+      async for result in self._calibrate(specs):
+        yield result
+    async for result in self._runOnSlots(specs, self.jobs):
+      yield result
+
+  def runAll(self, specs, done=None):
+    '''
+      Run the RunSpecs of specs to completion. done(spec, outcome) is called as
+      each of them completes if given, otherwise the list of (spec, outcome) is
+      returned.
+    '''
+    async def drive():
+      results = []
+      async for spec, outcome in self.run(specs):
+        if done is not None:
+          done(spec, outcome)
+        else:
+          results.append((spec, outcome))
+      return results
+    return asyncio.run(drive())
+
+  async def _runOnSlots(self, specs, jobs):
+    #run specs on the first jobs slots
+    free = asyncio.Queue()
+    for slot in self.slots[:jobs]:
+      free.put_nowait(slot)
+
+    async def work(spec):
+      phases = phaseLog(self.profile is not None)
+      slot = await free.get()
+      phases.mark("queue")
+      start = time.time()
+      try:
+        outcome = await self._runInjection(spec, slot, phases)
+      finally:
+        free.put_nowait(slot)
+      # wall-clock time of the run outside of FI_EXE
+      wall = time.time() - start
+      outcome['harness'] = wall if outcome.get('cached') else \
+                           max(wall - outcome['time'], 0.0)
+      self.recordOutcome(spec, outcome)
+      phases.mark("log")
+      if self.profile is not None:
+        self._writeProfile(spec, slot, phases)
+      return spec, outcome
+
+    pending = set()
+    for spec in specs:
+      if len(pending) >= jobs:
+        finished, pending = await asyncio.wait(
+          pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in finished:
+          yield task.result()
+      pending.add(asyncio.ensure_future(work(spec)))
+    while pending:
+      finished, pending = await asyncio.wait(
+        pending, return_when=asyncio.FIRST_COMPLETED)
+      for task in finished:
+        yield task.result()
+
+  async def _calibrate(self, specs):
+    '''
+      Pick the number of jobs for jobs 'auto': the first runs of the campaign
+      are executed with 1, 2, 4... jobs, as long as the throughput improves by
+      CALIBRATION_GAIN and the host stays healthy (memory pressure and
+      available memory). The throughput curve is written to
+      log_output/jobs-calibration.
+    '''
+    limits = self.limits
+    pressure = limits["pressure"] if limits and limits["pressure"] is not None \
+               else CALIBRATION_MAX_PRESSURE
+    psi = os.path.isfile("/proc/pressure/memory")
+    curve = []
+    best = None
+    jobs = 1
+    while True:
+      batch = list(itertools.islice(specs, CALIBRATION_RUNS_PER_JOB * jobs))
+      if not batch:
+        break
+      start = time.time()
+      async for result in self._runOnSlots(batch, jobs):
+        yield result
+      rate = len(batch) / max(time.time() - start, 1e-6)
+      mempressure = memoryPressure() if psi else 0.0
+      available = memoryAvailable()
+      healthy = mempressure <= pressure and available >= CALIBRATION_MIN_MEMORY
+      curve.append((jobs, len(batch), rate, mempressure, available))
+      if healthy and (best is None or rate > best[1] * (1 + CALIBRATION_GAIN)):
+        best = (jobs, rate)
       else:
-        flds = each.split(".")
-        newName = '.'.join(flds[0:-1])
-        newName+='.'+run_id+'.'+flds[-1]
-        if newName.startswith("llfi"):
-          os.rename(each, os.path.join(llfi_stat_dir, newName))
+        break
+      if jobs == len(self.slots):
+        break
+      jobs = min(jobs * 2, len(self.slots))
+
+    self.jobs = best[0] if best is not None else 1
+    with open(os.path.join(self.logdir, "jobs-calibration"), "w") as f:
+      f.write("# jobs,runs,runs_per_s,memory_pressure,memory_available\n")
+      for point in curve:
+        f.write("{},{},{:0.3f},{:0.2f},{:0.3f}\n".format(*point))
+      f.write("# selected jobs: {}\n".format(self.jobs))
+    print("\nINFO: Calibrated --jobs to %d (%s)" % (self.jobs, ", ".join(
+          "%d: %.2f runs/s" % (j, r) for j, _, r, _, _ in curve)))
+
+  def _writeProfile(self, spec, slot, phases):
+    self.profile.write(json.dumps({
+      "run": spec.run_id,
+      "slot": slot.index,
+      "start": phases.start - self.profileStart,
+      "phases": phases.phases,
+    }, separators=(',', ':')) + '\n')
+
+  ##############################################################################
+  async def _runInjection(self, spec, slot, phases):
+    '''
+      Execute spec in slot, or with a cache, reuse the outcome recorded for an
+      identical run. Returns the outcome as a dict (ret, time, code, hang,
+      usage).
+    '''
+    ficonfig = spec.ficonfig()
+    with open(os.path.join(slot.dir, "llfi.config.fi.txt"), 'w') as f:
+      f.write(ficonfig)
+    phases.mark("config")
+
+    if self.cache is not None:
+      key = self.cache.key(buildcache.hashFile(self.fi_exe), self.runtimeHash,
+                           self.exe_args,
+                           [(f, buildcache.hashFile(os.path.join(self.inputdir, f)))
+                            for f in self.inputList],
+                           ficonfig, self.timeoutKey,
+                           self.heartbeat and sorted(self.heartbeat.items()),
+                           self.doc.get("runLimits"))
+      record = self.cache.lookup(key)
+      phases.mark("cache_lookup")
+      if record is not None:
+        self.cache.restore(record, lambda kind, name:
+                           self.outputPath(kind, name, spec.run_id))
+        if record.get('usage'):
+          # the run was not admitted again
+          record['usage']['admission'] = 0.0
+        record['cached'] = True
+        phases.mark("cache_restore")
+        return record
+
+    record = await self._execute(spec.run_id, slot, phases)
+    outputs = record.pop('outputs')
+    if self.cache is not None:
+      files = [('std', 'std', self.stdoutPath(spec.run_id))]
+      files.extend((kind, name, self.outputPath(kind, name, spec.run_id))
+                   for kind, name in outputs)
+      self.cache.store(key, record, files)
+      phases.mark("cache_store")
+    return record
+
+  async def _execute(self, run_id, slot, phases):
+    '''
+      Run FI_EXE in the directory of slot, and return its outcome as a dict
+      (ret, time, code, hang, usage, outputs)
+    '''
+    env = None
+    if self.heartbeat is not None:
+      with open(slot.heartbeat, "wb") as f:
+        f.write(b"\0" * HEARTBEAT.size)
+      env = dict(os.environ, LLFI_HEARTBEAT_FILE=slot.heartbeat)
+      phases.mark("heartbeat")
+
+    admission = await self._admitRun()
+    phases.mark("admission")
+    cg = self._createRunCgroup(run_id)
+    phases.mark("cgroup")
+
+    #get state of directory
+    dirBefore = os.listdir(slot.dir)
+    phases.mark("snapshot")
+
+    with open(self.stdoutPath(run_id), "w") as outputFile:
+      start = time.time()
+      p = subprocess.Popen([self.fi_exe] + self.exe_args, stdout = outputFile,
+                           cwd = slot.dir, env = env,
+                           preexec_fn = lambda: self._setLimits(cg, slot.cpus))
+    phases.mark("spawn")
+    # reaped by waitProcess() rather than by p, for the rusage of the run.
+    # Some process hangs aren't solved by setrlimit(), so they're also
+    # watched for from here.
+    exited = waitProcess(p.pid)
+    if self.heartbeat is None:
+      finished, _ = await asyncio.wait([exited],
+                                       timeout=self.timeout + self.timeout_padding)
+      hang = None if finished else "timeout"
+    else:
+      hang = await self._watchHeartbeat(exited, start, slot.heartbeat, p.pid)
+    # for hangs, the time taken to detect the hang
+    p_time = time.time() - start
+    if hang:
+      # Process hang, terminate it, and kill it if it does not exit (it may
+      # ignore SIGTERM, or be stopped)
+      try:
+        os.kill(p.pid, signal.SIGTERM)
+        finished, _ = await asyncio.wait([exited], timeout=HANG_KILL_GRACE)
+        if not finished:
+          os.kill(p.pid, signal.SIGKILL)
+      except ProcessLookupError:
+        pass
+    _, status, rusage = await exited
+    phases.mark("wait")
+    # for hangs too, the signal that terminated FI_EXE
+    p.returncode = os.waitstatus_to_exitcode(status)
+    usage = {
+      'utime': rusage.ru_utime,
+      'stime': rusage.ru_stime,
+      'maxrss': rusage.ru_maxrss, # KiB
+      'majflt': rusage.ru_majflt,
+      'minflt': rusage.ru_minflt,
+      'signal': os.WTERMSIG(status) if os.WIFSIGNALED(status) else 0,
+    }
+
+    oom = removeRunCgroup(cg) if cg is not None else False
+    usage['limit'] = limitHit(usage, oom)
+    usage['admission'] = admission
+    phases.mark("reap")
+
+    outputs = self.moveOutput(slot.dir, dirBefore, run_id)
+    phases.mark("move_output")
+    self.replenishInput(slot.dir) #for cases where program deletes input or alters them each run
+    phases.mark("replenish_input")
+
+    code = 'TO' if hang else p.returncode
+    return {'ret': str(p.returncode), 'time': p_time, 'code': code,
+            'hang': hang, 'usage': usage, 'outputs': outputs}
+
+  async def _watchHeartbeat(self, exited, start, hbfile, pid):
+    '''
+      Wait for FI_EXE (process pid) to exit while watching the cycle counter
+      of the run. Returns why the run is considered hung, or None if it
+      finished.
+    '''
+    deadline = start + self.timeout + self.timeout_padding
+    last_cycle = last_cpu = None
+    with open(hbfile, "r+b") as f:
+      mm = mmap.mmap(f.fileno(), HEARTBEAT.size)
+    try:
+      while True:
+        finished, _ = await asyncio.wait([exited], timeout=self.heartbeat["poll"])
+        if finished:
+          return None
+        now = time.time()
+        if now >= deadline:
+          return "timeout"
+        magic, cycle = HEARTBEAT.unpack_from(mm)
+        if magic != HEARTBEAT_MAGIC:
+          # the runtime is not initialized yet
+          continue
+        # time spent in uninstrumented code does not advance the counter
+        cpu = cpuTime(pid)
+        if cycle != last_cycle or cpu != last_cpu:
+          last_cycle, last_cpu, last_progress = cycle, cpu, now
+        elif now - last_progress >= self.heartbeat["stall"]:
+          return "stalled"
+        if self.heartbeat["cycles"] and cycle > self.heartbeat["cycles"]:
+          return "cycle limit"
+    finally:
+      mm.close()
+
+  async def _admitRun(self):
+    '''
+      Wait until the memory pressure of the host is under memoryPressure.
+      Returns the time waited.
+    '''
+    if self.limits is None or self.limits["pressure"] is None:
+      return 0.0
+    if memoryPressure() <= self.limits["pressure"]:
+      return 0.0
+    start = time.time()
+    while memoryPressure() > self.limits["pressure"]:
+      await asyncio.sleep(1)
+    return time.time() - start
+
+  def _createRunCgroup(self, run_id):
+    if self.limits is None or self.limits["cgroup"] is None:
+      return None
+    cg = os.path.join(self.limits["cgroup"]["path"],
+                      "llfi-{}-{}".format(os.getpid(), run_id))
+    try:
+      os.mkdir(cg)
+      for name, val in self.limits["cgroup"]["files"]:
+        with open(os.path.join(cg, name), "w") as f:
+          f.write(val)
+    except OSError as e:
+      print("WARNING: cgroup limits disabled: " + str(e))
+      self.limits["cgroup"] = None
+      removeRunCgroup(cg)
+      return None
+    return cg
+
+  def _setLimits(self, cg=None, cpus=None):
+    cpulimit = int(math.ceil(self.timeout))
+    resource.setrlimit(resource.RLIMIT_CPU, (cpulimit, cpulimit))
+    if self.limits is not None:
+      for rlimit, val in self.limits["rlimits"]:
+        resource.setrlimit(rlimit, (val, val))
+    if cg is not None:
+      with open(os.path.join(cg, "cgroup.procs"), "w") as f:
+        f.write("0")
+    if cpus:
+      os.sched_setaffinity(0, cpus)
+
+  ##############################################################################
+  def replenishInput(self, directory):#TODO make condition to skip this if input is present
+    for each in self.inputList:
+      if not os.path.isfile(os.path.join(directory, each)):#copy deleted inputfiles back
+        shutil.copy2(os.path.join(self.inputdir, each), os.path.join(directory, each))
+
+  def stdoutPath(self, run_id):
+    return self.stddir + "/std_outputfile-" + "run-"+run_id
+
+  def outputPath(self, kind, name, run_id):
+    #destination of the output file name of run run_id
+    if kind == 'std':
+      return self.stdoutPath(run_id)
+    flds = name.split(".")
+    newName = '.'.join(flds[0:-1])
+    newName+='.'+run_id+'.'+flds[-1]
+    if newName.startswith("llfi"):
+      return os.path.join(self.llfi_stat_dir, newName)
+    else:
+      return os.path.join(self.outputdir, newName)
+
+  def moveOutput(self, directory, dirBefore, run_id):
+    #move all newly created files, and return their (kind, name)
+    outputs = []
+    for each in os.listdir(directory):
+      if each not in dirBefore:
+        path = os.path.join(directory, each)
+        fileSize = os.stat(path).st_size
+        if fileSize == 0 and each.startswith("llfi"):
+          #empty library output, can delete
+          os.remove(path)
         else:
-          os.rename(each, os.path.join(outputdir, newName))
+          os.rename(path, self.outputPath('file', each, run_id))
+          outputs.append(('file', each))
+    return outputs
+
+  def recordOutcome(self, spec, outcome):
+    ret = outcome['ret']
+    usage = outcome.get('usage')
+    errorfile = self.errordir + "/errorfile-" + "run-"+spec.run_id
+    limit = usage.get('limit') if usage else None
+    if outcome['code'] == 'TO':
+      error_File = open(errorfile, 'w')
+      error_File.write("Program hang\n")
+      error_File.close()
+    elif limit:
+      error_File = open(errorfile, 'w')
+      error_File.write("Program killed by the " + limit + " limit, return code " + ret + '\n')
+      error_File.close()
+    elif int(ret) < 0:
+      error_File = open(errorfile, 'w')
+      error_File.write("Program crashed, terminated by the system, return code " + ret + '\n')
+      error_File.close()
+    elif int(ret) > 0:
+      error_File = open(errorfile, 'w')
+      error_File.write("Program crashed, terminated by itself, return code " + ret + '\n')
+      error_File.close()
+    elif os.path.isfile(errorfile):
+      # the errorfile of an earlier campaign would outlive a rerun that exits
+      # successfully, and llfi-stats would count the run as failed
+      os.remove(errorfile)
+
+    # Log time and return code information
+    logname = os.path.join(self.logdir, 'logfile-run-{}.txt'.format(spec.run_id))
+    with open(logname, 'a') as logfile:
+      line = 'code={}, time={:0.3f}'.format(ret, outcome['time'])
+      if usage:
+        line += (', utime={utime:0.3f}, stime={stime:0.3f}, maxrss={maxrss}, '
+                 'majflt={majflt}, minflt={minflt}, signal={signal}'.format(**usage))
+        if limit:
+          line += ', limit={}'.format(limit)
+      logfile.write(line + '\n')
 
 ################################################################################
-def dirSnapshot():
-  #snapshot of directory before each execute() is performed
-  global dirBefore
-  dirBefore = [_file for _file in os.listdir(".")]
+def printCacheSummary(cache):
+  if cache is not None:
+    print("Outcome cache: %d runs reused, %d executed" %
+          (cache.hits, cache.misses))
+
+def hangSummary(timeout, outcomes):
+  #lines summarizing the hangs of the outcomes of a run configuration
+  # outcomes recorded by older versions have no hang reason or usage
+  hangs = [(o['hang'], o['time']) for o in outcomes if o.get('hang')]
+  lines = ['timeout: {:0.3f}'.format(timeout), 'hangs: {}'.format(len(hangs))]
+  for reason in sorted(set(reason for reason, _ in hangs)):
+    lines.append('hangs ({}): {}'.format(
+                 reason, sum(1 for r, _ in hangs if r == reason)))
+  if hangs:
+    latencies = [latency for _, latency in hangs]
+    lines.append('hang detection latency avg: {:0.3f}'.format(
+                 sum(latencies) / len(latencies)))
+    lines.append('hang detection latency max: {:0.3f}'.format(max(latencies)))
+  return lines
+
+def usageSummary(outcomes):
+  #lines summarizing the resource usage of the outcomes of a run configuration
+  usages = [o['usage'] for o in outcomes if o.get('usage')]
+  if not usages:
+    return []
+  n = float(len(usages))
+  lines = []
+  for key in ('utime', 'stime'):
+    lines.append('avg {}: {:0.3f}'.format(key, sum(u[key] for u in usages) / n))
+  lines.append('avg maxrss: {:0.0f}'.format(sum(u['maxrss'] for u in usages) / n))
+  lines.append('max maxrss: {}'.format(max(u['maxrss'] for u in usages)))
+  for key in ('majflt', 'minflt'):
+    lines.append('avg {}: {:0.1f}'.format(key, sum(u[key] for u in usages) / n))
+  lines.append('signaled: {}'.format(sum(1 for u in usages if u['signal'])))
+  for limit in sorted(set(u.get('limit') for u in usages) - set([None])):
+    lines.append('killed by the {} limit: {}'.format(
+                 limit, sum(1 for u in usages if u.get('limit') == limit)))
+  admission = sum(u.get('admission', 0.0) for u in usages)
+  if admission:
+    lines.append('admission wait: {:0.3f}'.format(admission))
+  return lines
 
 ################################################################################
-def readCycles():
-  global totalcycles
-  profinput= open("llfi.stat.prof.txt","r")
-  while 1:
-    line = profinput.readline()
-    if line.strip():
-      if line[0] == 't':
-        label, totalcycles = line.split("=")
-        break
-  profinput.close()
+def opcodeNames():
+  '''
+    Map of opcode to instruction name, from Instruction.def of the runtime
+    library (empty if it cannot be found)
+  '''
+  names = {}
+  defFile = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                         "../runtime_lib/Instruction.def")
+  try:
+    with open(defFile) as f:
+      for line in f:
+        if line.startswith("HANDLE_INST"):
+          flds = line[line.index("(") + 1:].split(",")
+          names[int(flds[0])] = flds[1].strip().lower()
+  except (IOError, OSError, ValueError):
+    pass
+  return names
+
+def readSiteCatalog(fi_exe):
+  '''
+    Return the catalog of the fault injection sites of FI_EXE as a dict of
+    llfi index -> catalogEntry, or None if it was built without one
+  '''
+  catalog = os.path.join(os.path.dirname(fi_exe), "llfi.stat.catalog.txt")
+  if not os.path.isfile(catalog):
+    return None
+  return dict((e.index, e) for e in readCatalog(catalog))
+
+def readSites(llfi_dir, what):
+  #the site profile of llfi-profile beside FI_EXE, for what needs it
+  if __package__:
+    from .profile import loadSiteProfile
+  else:
+    from profile import loadSiteProfile
+  try:
+    return loadSiteProfile(os.path.join(llfi_dir, "llfi.stat.prof.sites.bin"))
+  except (IOError, OSError, ValueError) as e:
+    raise InjectError(what + " needs the site profile llfi.stat.prof.sites.bin ("
+                      + str(e) + "). Instrument with profileSites: True in "
+                      "compileOption and rerun llfi profile.")
+
+def allocateRuns(weights, run_number, allocation):
+  '''
+    Split run_number runs across strata, at least one per stratum. weights maps
+    each stratum to its share of the dynamic instructions.
+  '''
+  # largest strata first, so that they get the leftover runs
+  strata = sorted(weights, key=lambda s: (-weights[s], s))
+  if allocation == "equal":
+    alloc = dict((s, run_number // len(strata)) for s in strata)
+    for s in strata[:run_number % len(strata)]:
+      alloc[s] += 1
+  else:
+    # one run each, the rest proportionally with the largest remainders
+    extra = run_number - len(strata)
+    alloc = dict((s, 1 + int(extra * weights[s])) for s in strata)
+    left = run_number - sum(alloc.values())
+    strata.sort(key=lambda s: -(extra * weights[s] - int(extra * weights[s])))
+    for s in strata[:left]:
+      alloc[s] += 1
+  return alloc
+
+def makePlan(planOpt, run_number, campaign):
+  '''
+    Return the fault injection plan of a run configuration: a list of
+    (stratum, fi_index, fi_index_instance, weight), one per run
+  '''
+  strataType = planOpt.get("strata", "opcode")
+  allocation = planOpt.get("allocation", "equal")
+  rangeSize = planOpt.get("rangeSize", 100)
+  if strataType not in ("opcode", "function", "indexRange"):
+    raise InjectError("plan strata must be opcode, function or indexRange in "
+                      "input.yaml")
+  if allocation not in ("equal", "proportional"):
+    raise InjectError("plan allocation must be equal or proportional in "
+                      "input.yaml")
+  if not isinstance(rangeSize, int) or isinstance(rangeSize, bool) or \
+     rangeSize <= 0:
+    raise InjectError("plan rangeSize must be an integer greater than 0 in "
+                      "input.yaml")
+
+  sites = readSites(campaign.llfi_dir, "A plan")
+
+  names = opcodeNames()
+  catalog = None
+  if strataType == "function":
+    catalog = readSiteCatalog(campaign.fi_exe)
+    if catalog is None:
+      raise InjectError("Function strata need the site catalog "
+                        "llfi.stat.catalog.txt of FI_EXE, instrument the "
+                        "program again to generate it.")
+  # stratum -> llfi indices, and their cumulative dynamic counts
+  indices = defaultdict(list)
+  cumcounts = defaultdict(list)
+  with sites:
+    for index, count, opcode in sites.executed():
+      if strataType == "opcode":
+        stratum = "opcode=" + names.get(opcode, str(opcode))
+      elif strataType == "function":
+        if index not in catalog:
+          continue
+        stratum = "function=" + catalog[index].function
+      else:
+        start = index - index % rangeSize
+        stratum = "index={}-{}".format(start, start + rangeSize - 1)
+      prev = cumcounts[stratum][-1] if cumcounts[stratum] else 0
+      indices[stratum].append(index)
+      cumcounts[stratum].append(prev + count)
+
+  if not indices:
+    raise InjectError("The site profile does not contain any executed "
+                      "instruction.")
+  if run_number < len(indices):
+    raise InjectError("A plan over %d strata needs at least as many numOfRuns."
+                      % len(indices))
+
+  total = float(sum(c[-1] for c in cumcounts.values()))
+  weights = dict((s, cumcounts[s][-1] / total) for s in indices)
+  alloc = allocateRuns(weights, run_number, allocation)
+
+  plan = []
+  for stratum in sorted(indices):
+    for _ in range(alloc[stratum]):
+      # uniform over the dynamic instances of the stratum
+      r = random.randrange(cumcounts[stratum][-1])
+      site = bisect.bisect_right(cumcounts[stratum], r)
+      before = cumcounts[stratum][site - 1] if site > 0 else 0
+      plan.append((stratum, indices[stratum][site], r - before,
+                   weights[stratum] / alloc[stratum]))
+  return plan
+
+def writePlan(plan, ii, logdir):
+  planfile = os.path.join(logdir, 'planfile-run-{}'.format(ii))
+  with open(planfile, 'w') as f:
+    f.write("# run,stratum,fi_index,fi_index_instance,weight\n")
+    for index, (stratum, fi_index, instance, weight) in enumerate(plan):
+      f.write("{},{},{},{},{!r}\n".format(index, stratum, fi_index, instance,
+                                          weight))
 
 ################################################################################
-def checkValues(key, val, var1 = None,var2 = None,var3 = None,var4 = None):
+def injectsDstReg(doc, fi_exe):
+  '''
+    Whether FI_EXE was built to inject into destination registers, according
+    to compileOption in input.yaml
+  '''
+  cOpt = doc.get("compileOption")
+  if isinstance(cOpt, list):
+    variant = os.path.basename(os.path.dirname(fi_exe))
+    cOpt = dict((v.get("name"), v) for v in cOpt).get(variant)
+  return isinstance(cOpt, dict) and cOpt.get("regSelMethod") == "regloc" \
+         and cOpt.get("regloc") == "dstreg"
+
+def exhaustiveSpace(executed, widths, dead):
+  '''
+    Generator of the fault space, in a fixed order, as
+    (class, fi_index, fi_index_instance, fi_reg_index, fi_bit, size): size is
+    the number of faults of the space the fault stands for. widths maps each
+    llfi index to the bit widths of its register targets.
+  '''
+  for index, count, opcode in executed:
+    if index in dead:
+      yield ("pruned", index, 0, 0, 0, count * sum(widths[index]))
+      continue
+    for instance in range(count):
+      for reg, width in enumerate(widths[index]):
+        for bit in range(width):
+          yield ("live", index, instance, reg, bit, 1)
+
+def readJournal(ii, logdir):
+  done = set()
+  journal = os.path.join(logdir, 'planfile-run-{}'.format(ii))
+  if os.path.isfile(journal):
+    with open(journal) as f:
+      for line in f:
+        if line.strip() and not line.startswith('#'):
+          done.add(int(line.split(',')[0]))
+  return done
+
+def runExhaustive(campaign, options, rOpt, progress):
+  sites = readSites(campaign.llfi_dir, "--exhaustive")
+  catalog = readSiteCatalog(campaign.fi_exe)
+  if catalog is None:
+    # the registers and widths of the sites cannot be guessed: injecting past
+    # the width of a value aborts the runtime, and wider ones are left out
+    raise InjectError("--exhaustive needs the site catalog llfi.stat.catalog.txt "
+                      "beside " + os.path.basename(campaign.fi_exe) + ". "
+                      "Instrument the program again with llfi instrument.")
+  with sites:
+    executed = list(sites.executed())
+  # instructions executed but not instrumented cannot be injected into
+  executed = [s for s in executed if s[0] in catalog]
+  widths = dict((index, catalog[index].widths) for index, _, _ in executed)
+
+  dead = set()
+  if injectsDstReg(campaign.doc, campaign.fi_exe):
+    dead = set(index for index, e in catalog.items() if e.uses == 0)
+
+  shard, nshards = options.SHARD
+  spacesize = sum(count * sum(widths[index]) for index, count, _ in executed)
+  ninjections = sum(1 if index in dead else count * sum(widths[index])
+                    for index, count, _ in executed)
+  print("======Exhaustive Fault Injection======")
+  print("Fault space: %d faults, %d injections after pruning" %
+        (spacesize, ninjections))
+  inshard = len(range(shard, ninjections, nshards))
+
+  for ii, run in enumerate(rOpt):
+    if ii > 0:
+      print("")
+    print("---FI Config #"+str(ii)+"---")
+
+    done = readJournal(ii, campaign.logdir)
+    ntodo = inshard - sum(1 for k in done if k % nshards == shard)
+    if ntodo < inshard:
+      print("Resuming, %d injections left" % ntodo)
+    journal = open(os.path.join(campaign.logdir, 'planfile-run-{}'.format(ii)), 'a')
+    if not done:
+      journal.write("# run,class,fi_index,fi_index_instance,fi_reg_index,"
+                    "fi_bit,weight\n")
+    progress.startConfig(ii, ntodo)
+
+    def specs():
+      space = exhaustiveSpace(executed, widths, dead)
+      for k, fault in enumerate(space):
+        if k % nshards != shard or k in done:
+          continue
+        cls, fi_index, instance, reg, bit, size = fault
+        ficonfig = {"fi_index": fi_index, "fi_index_instance": instance,
+                    "fi_reg_index": reg, "fi_bit": bit}
+        if "fi_type" in run["run"]:
+          ficonfig["fi_type"] = run["run"]["fi_type"]
+        if campaign.cache is not None or "seed" in run["run"]:
+          ficonfig["fi_seed"] = (run["run"].get("seed", 0) + k) % (1 << 31)
+        yield RunSpec(str(ii)+"-"+str(k), ficonfig, (k,) + fault)
+
+    n = [0]
+    hangs = []
+    def record(spec, outcome):
+      # journal the fault once its outcome is recorded, to resume after it
+      k, cls, fi_index, instance, reg, bit, size = spec.info
+      journal.write("{},{},{},{},{},{},{!r}\n".format(
+          k, cls, fi_index, instance, reg, bit, float(size) / spacesize))
+      journal.flush()
+      if outcome.get('hang'):
+        hangs.append(outcome)
+      progress.record(ii, outcome)
+      n[0] += 1
+      print_progressbar(n[0], ntodo, progress.status(ii))
+
+    campaign.runAll(specs(), record)
+    journal.close()
+    print("")
+    if hangs:
+      print(', '.join(hangSummary(campaign.timeout, hangs)))
+  printCacheSummary(campaign.cache)
+
+################################################################################
+def checkValues(key, val, var1 = None,var2 = None,var3 = None,var4 = None,
+                totalcycles = None):
   #preliminary input checking for fi options
   #also checks for fi_bit usage by non-kernel users
   #optional var# are used for fi_bit's case only
@@ -275,6 +1527,10 @@ def checkValues(key, val, var1 = None,var2 = None,var3 = None,var4 = None):
     assert isinstance(val, int)==True, key+" must be an integer in input.yaml"
     assert int(val) >= 0, key+" must be greater than or equal to 0 in input.yaml"
 
+  elif key == 'seed':
+    assert isinstance(val, int)==True, key+" must be an integer in input.yaml"
+    assert int(val) >= 0, key+" must be greater than or equal to 0 in input.yaml"
+
   elif key == 'fi_index':
     assert isinstance(val, int)==True, key+" must be an integer in input.yaml"
     assert int(val) >= 0, key+" must be greater than or equal to 0 in input.yaml"
@@ -300,213 +1556,116 @@ def checkValues(key, val, var1 = None,var2 = None,var3 = None,var4 = None):
         exit(1)
 
 ################################################################################
-def run(args):
-  global outputfile, totalcycles,run_id, return_codes
+def runConfigs(campaign, rOpt, progress):
+  print("======Fault Injection======")
+  for ii, run in enumerate(rOpt):
+    # Put an empty line between configs
+    if ii > 0:
+      print("")
+    print("---FI Config #"+str(ii)+"---")
+
+    # check for verbosity option, set at the FI run level
+    if "verbose" in run["run"]:
+      yaml_options["verbose"] = run["run"]["verbose"]
+
+    specs = campaign.configRuns(ii, run["run"])
+    run_number = len(specs)
+    progress.startConfig(ii, run_number)
+
+    outcomes = []
+    def record(spec, outcome):
+      outcomes.append(outcome)
+      progress.record(ii, outcome)
+      # Print updates
+      print_progressbar(len(outcomes), run_number, progress.status(ii))
+
+    print_progressbar(0, run_number)
+    campaign.runAll(specs, record)
+    tot_time = sum(o['time'] for o in outcomes)
+    print("")
+    printCacheSummary(campaign.cache)
+    # Maintain a dict of all return codes received and print summary at end
+    return_codes = defaultdict(int)
+    for o in outcomes:
+      return_codes[o['code']] += 1
+    summary = hangSummary(campaign.timeout, outcomes) + usageSummary(outcomes)
+    # Print summary
+    if yaml_options["verbose"]:
+      print("========== SUMMARY ==========")
+      print("Return codes:")
+      for r in list(return_codes.keys()):
+        print(("  %3s: %5d" % (str(r), return_codes[r])))
+      for line in summary:
+        print("  " + line)
+
+    # write summary file
+    summary_file = os.path.join(campaign.logdir, 'summaryfile-run-{}'.format(ii))
+    with open(summary_file, 'w') as f:
+      f.write('runs: {}\n'.format(run_number))
+      avg_time = tot_time / run_number
+      f.write('avg time: {:0.3f}\n'.format(avg_time))
+      for line in summary:
+        f.write(line + '\n')
+
+      fi_rate = faultRate(run["run"], campaign.totalcycles)
+      if fi_rate is not None:
+        f.write('fi_rate: {}\n'.format(fi_rate))
+        expected = 0
+        if fi_rate != 0:
+          expected = float(campaign.totalcycles) / float(fi_rate)
+        f.write('faults expected: {:0.3f}\n'.format(expected))
+        # count average number of injected faults
+        nfaults = 0
+        base = os.path.join(campaign.llfi_stat_dir,
+                            'llfi.stat.fi.injectedfaults.{}-*'.format(ii))
+        logs = glob.glob(base)
+        for log in logs:
+          with open(log,'r') as log_f:
+            nfaults += sum(1 for line in log_f)
+        avg_faults = float(nfaults) / run_number
+
+        f.write('faults avg: {:0.3f}\n'.format(avg_faults))
 
+################################################################################
+def run(args):
   parser = initParser()
   options = parseArgs(parser, args)
-  checkInputYaml()
-  config(options.FI_EXE)
 
-  # get total num of cycles
-  readCycles()
-  storeInputFiles(options.EXE_ARGS)
-
-  #Set up each config file and its corresponding run_number
+  progress = None
+  campaign = None
   try:
-    rOpt = doc["runOption"]
-  except:
-    print("ERROR: Please include runOption in input.yaml.")
-    exit(1)
-
-  if not os.path.isfile(options.FI_EXE):
-    print("ERROR: The executable "+ options.FI_EXE + " does not exist.")
-    print("Please build the executables with create-executables.\n")
+    llfi_dir = os.path.dirname(options.FI_EXE)
+    campaign = Campaign(options.FI_EXE, options.EXE_ARGS, basedir,
+                        jobs=options.JOBS, cpus=options.CPUS,
+                        cache=options.cache,
+                        profile=os.path.join(llfi_dir, "log_output",
+                                             "harness-profile.jsonl")
+                        if options.PROFILE_HARNESS else None)
+    #Set up each config file and its corresponding run_number
+    if "runOption" not in campaign.doc:
+      raise InjectError("Please include runOption in input.yaml.")
+    rOpt = campaign.doc["runOption"]
+
+    progress = telemetry.campaignTelemetry(
+      os.path.join(campaign.logdir, "telemetry.prom") if options.TELEMETRY
+      else None, options.TELEMETRY_PORT, options.TELEMETRY_INTERVAL)
+    try:
+      progress.start()
+    except OSError as e:
+      raise InjectError("Cannot serve the telemetry on port %d: %s" %
+                        (options.TELEMETRY_PORT, e))
+    if options.EXHAUSTIVE:
+      runExhaustive(campaign, options, rOpt, progress)
+    else:
+      runConfigs(campaign, rOpt, progress)
+  except InjectError as e:
+    print("ERROR: " + str(e))
     exit(1)
-  else:
-    print("======Fault Injection======")
-    for ii, run in enumerate(rOpt):
-      # Maintain a dict of all return codes received and print summary at end
-      return_codes = defaultdict(int)
-      tot_time = 0.0
-
-      # Put an empty line between configs
-      if ii > 0:
-        print("")
-      print("---FI Config #"+str(ii)+"---")
-
-      if "numOfRuns" not in run["run"]:
-        print ("ERROR: Must include a run number per fi config in input.yaml.")
-        exit(1)
-
-      run_number=run["run"]["numOfRuns"]
-      checkValues("run_number", run_number)
-
-      # check for verbosity option, set at the FI run level
-      if "verbose" in run["run"]:
-        yaml_options["verbose"] = run["run"]["verbose"]
-
-      # reset all configurations
-      if 'fi_type' in locals():
-        del fi_type
-      if 'fi_cycle' in locals():
-        del fi_cycle
-      if 'fi_rate' in locals():
-        del fi_rate
-      if 'fi_exp' in locals():
-        del fi_exp
-      if 'fi_index' in locals():
-        del fi_index
-      if 'fi_reg_index' in locals():
-        del fi_reg_index
-      if 'fi_bit' in locals():
-        del fi_bit
-
-      #write new fi config file according to input.yaml
-      if "fi_type" in run["run"]:
-        fi_type=run["run"]["fi_type"]
-        checkValues("fi_type",fi_type)
-      if "fi_cycle" in run["run"]:
-        fi_cycle=run["run"]["fi_cycle"]
-        checkValues("fi_cycle",fi_cycle)
-      if "fi_rate" in run["run"]:
-        fi_rate=run["run"]["fi_rate"]
-        checkValues("fi_rate",fi_rate)
-      if "fi_exp" in run["run"]:
-        fi_exp=run["run"]["fi_exp"]
-        checkValues("fi_exp",fi_exp)
-        if fi_exp == 0:
-          fi_rate = 0
-        else:
-          fi_rate = int(int(totalcycles) / fi_exp)
-      if "fi_index" in run["run"]:
-        fi_index=run["run"]["fi_index"]
-        checkValues("fi_index",fi_index)
-      if "fi_reg_index" in run["run"]:
-        fi_reg_index=run["run"]["fi_reg_index"]
-        checkValues("fi_reg_index",fi_reg_index)
-      if "fi_bit" in run["run"]:
-        fi_bit=run["run"]["fi_bit"]
-        checkValues("fi_bit",fi_bit)
-
-      if ('fi_cycle' not in locals()) and 'fi_index' in locals():
-        print(("\nINFO: You choose to inject faults based on LLFI index, "
-               "this will inject into every runtime instruction whose LLFI "
-               "index is %d\n" % fi_index))
-
-      need_to_calc_fi_cycle = True
-      if ('fi_cycle' in locals()) or ('fi_index' in locals()) or ('fi_rate' in locals()):
-        need_to_calc_fi_cycle = False
-
-      # fault injection
-      for index in range(0, run_number):
-        run_id = str(ii)+"-"+str(index)
-        outputfile = stddir + "/std_outputfile-" + "run-"+run_id
-        errorfile = errordir + "/errorfile-" + "run-"+run_id
-        execlist = [options.FI_EXE]
-
-        if need_to_calc_fi_cycle:
-          fi_cycle = random.randint(0, int(totalcycles) - 1)
-
-        ficonfig_File = open("llfi.config.fi.txt", 'w')
-        if 'fi_cycle' in locals():
-          ficonfig_File.write("fi_cycle="+str(fi_cycle)+'\n')
-        elif 'fi_index' in locals():
-          ficonfig_File.write("fi_index="+str(fi_index)+'\n')
-        elif 'fi_rate' in locals():
-          ficonfig_File.write("fi_rate="+str(fi_rate)+'\n')
-
-        if 'fi_type' in locals():
-          ficonfig_File.write("fi_type="+fi_type+'\n')
-        if 'fi_reg_index' in locals():
-          ficonfig_File.write("fi_reg_index="+str(fi_reg_index)+'\n')
-        if 'fi_bit' in locals():
-          ficonfig_File.write("fi_bit="+str(fi_bit)+'\n')
-        ficonfig_File.close()
-
-        # print run index before executing. Comma removes newline for prettier
-        # formatting
-        execlist.extend(options.EXE_ARGS)
-        ret, curr_time = execute(execlist)
-        tot_time += curr_time
-
-        if ret == "timed-out":
-          error_File = open(errorfile, 'w')
-          error_File.write("Program hang\n")
-          error_File.close()
-        elif int(ret) < 0:
-          error_File = open(errorfile, 'w')
-          error_File.write("Program crashed, terminated by the system, return code " + ret + '\n')
-          error_File.close()
-        elif int(ret) > 0:
-          error_File = open(errorfile, 'w')
-          error_File.write("Program crashed, terminated by itself, return code " + ret + '\n')
-          error_File.close()
-
-        # Log time and return code information
-        logname = os.path.join(logdir, 'logfile-run-{}.txt'.format(run_id))
-        with open(logname, 'a') as logfile:
-          logfile.write('code={}, time={:0.3f}\n'.format(ret,curr_time))
-
-        # Print updates
-        print_progressbar(index, run_number)
-
-      print_progressbar(run_number, run_number)
-      print("")
-      # Print summary
-      if yaml_options["verbose"]:
-        print("========== SUMMARY ==========")
-        print("Return codes:")
-        for r in list(return_codes.keys()):
-          print(("  %3s: %5d" % (str(r), return_codes[r])))
-
-      # write summary file
-      summary_file = os.path.join(logdir, 'summaryfile-run-{}'.format(ii))
-      with open(summary_file, 'w') as f:
-        f.write('runs: {}\n'.format(run_number))
-        avg_time = tot_time / run_number
-        f.write('avg time: {:0.3f}\n'.format(avg_time))
-
-        if 'fi_rate' in locals():
-          f.write('fi_rate: {}\n'.format(fi_rate))
-          expected = 0
-          if fi_rate != 0:
-            expected = float(totalcycles) / float(fi_rate)
-          f.write('faults expected: {:0.3f}\n'.format(expected))
-          # count average number of injected faults
-          nfaults = 0
-          base = os.path.join(llfi_stat_dir,'llfi.stat.fi.injectedfaults.{}-*'.format(ii))
-          logs = glob.glob(base)
-          for log in logs:
-            with open(log,'r') as log_f:
-              nfaults += sum(1 for line in log_f)
-          avg_faults = float(nfaults) / run_number
-
-          f.write('faults avg: {:0.3f}\n'.format(avg_faults))
-
-      # write summary file
-      summary_file = os.path.join(logdir, 'summaryfile-run-{}'.format(ii))
-      with open(summary_file, 'w') as f:
-        f.write('runs: {}\n'.format(run_number))
-        avg_time = tot_time / run_number
-        f.write('avg time: {:0.3f}\n'.format(avg_time))
-
-        if 'fi_rate' in locals():
-          f.write('fi_rate: {}\n'.format(fi_rate))
-          expected = 0
-          if fi_rate != 0:
-            expected = float(totalcycles) / float(fi_rate)
-          f.write('faults expected: {:0.3f}\n'.format(expected))
-          # count average number of injected faults
-          nfaults = 0
-          base = os.path.join(llfi_stat_dir,'llfi.stat.fi.injectedfaults.{}-*'.format(ii))
-          logs = glob.glob(base)
-          for log in logs:
-            with open(log,'r') as log_f:
-              nfaults += sum(1 for line in log_f)
-          avg_faults = float(nfaults) / run_number
-
-          f.write('faults avg: {:0.3f}\n'.format(avg_faults))
+  finally:
+    if progress is not None:
+      progress.stop()
+    if campaign is not None:
+      campaign.close()
 
 ################################################################################
 
@@ -3,12 +3,28 @@
 """
 llfi-instrument takes a single IR file as input and generates IR files (and
 executables, depending on the -IRonly option) with instrumented profiling and
-fault injection function calls
+fault injection function calls. With --batch, the IR files listed in a
+manifest are instrumented together, sharing one pool of worker jobs
 
 
 Prerequisites:
   1. 'input.yaml' contains appropriate options for LLFI and must be under the
      same directory as IR_FILE
+
+If compileOption in input.yaml is a list of named variants, the executables
+of each variant are generated in a sub-directory of DIR named after it.
+
+A batch manifest is a YAML file listing the programs to instrument, paths
+being relative to the manifest:
+  programs:
+    - ir: factorial/factorial.ll
+      input: factorial/input.yaml  # optional, input.yaml beside the IR file
+      dir: llfi                    # optional, --dir for this program
+      l: [m]                       # optional, libraries to link against
+      L: [lib]                     # optional, library search paths
+The programs must have different output directories. The statistics the
+passes write (llfi.stat.totalindex.txt, llfi.stat.graph.dot) then go to the
+output directory of each program, rather than to the current directory.
 """
 
 # Everytime the contents of compileOption is changed in input.yaml
@@ -18,10 +34,15 @@ import sys, os, shutil
 import yaml
 import subprocess
 import argparse
+import concurrent.futures
+import threading
+import time
 
 script_path = os.path.realpath(os.path.dirname(__file__))
 sys.path.append(os.path.join(script_path, '../config'))
 import llvm_paths
+sys.path.append(os.path.join(script_path, '../tools'))
+import buildcache
 
 optbin = os.path.join(llvm_paths.LLVM_DST_ROOT, "bin/opt")
 llcbin = os.path.join(llvm_paths.LLVM_DST_ROOT, "bin/llc")
@@ -33,12 +54,23 @@ basedir = os.getcwd()
 
 if sys.platform == "linux" or sys.platform == "linux2":
   llfilib = os.path.join(script_path, "../llvm_passes/llfi-passes.so")
+  llfirtlib = os.path.join(llfilinklib, "libllfi-rt.so")
 elif sys.platform == "darwin":
   llfilib = os.path.join(script_path, "../llvm_passes/llfi-passes.dylib")
+  llfirtlib = os.path.join(llfilinklib, "libllfi-rt.dylib")
 else:
   print("ERROR: LLFI does not support platform " + sys.platform + ".")
   exit(1)
 
+class InstrumentError(Exception):
+  '''
+    Raised when a program cannot be instrumented, retcode being the exit
+    status of the failed tool (or 1)
+  '''
+  def __init__(self, msg, retcode=1):
+    Exception.__init__(self, msg)
+    self.retcode = retcode
+
 def help():
   parser = initParser()
   parser.print_help()
@@ -47,9 +79,31 @@ def help():
 def run(args):
   parser = initParser()
   options = parseArgs(parser, args)
+  if options.BATCH:
+    sys.exit(runBatch(options))
+  if options.JOBS is None:
+    options.JOBS = os.cpu_count()
+
+  try:
+    prepareOptions(options)
+  except InstrumentError as e:
+    usage(str(e))
+  try:
+    instrumentProg(options)
+  except InstrumentError as e:
+    print("\nERROR: " + str(e), file=sys.stderr)
+    sys.exit(e.retcode)
+  if not options.IRonly:
+    print("\nSuccess", file=sys.stderr)
+
+def instrumentProg(options, pool=None):
+  '''
+    Instrument options.IR_FILE, running the build steps in pool if given.
+    Raises InstrumentError on failure.
+  '''
   yamlOpts = checkInputYaml(options)
-  compileOptions = readCompileOption(yamlOpts, options)
-  compileProg(options, compileOptions)
+  variants = readVariants(yamlOpts, options)
+  compileProg(options, variants, pool)
 ################################################################################
 
 def initParser():
@@ -58,7 +112,9 @@ def initParser():
     prog='llfi instrument',
     epilog=__doc__,
   )
-  parser.add_argument('IR_FILE', help='source IR file to instrument')
+  parser.add_argument('IR_FILE', nargs='?', help='source IR file to instrument')
+  parser.add_argument('--batch', metavar='MANIFEST', dest='BATCH',
+                      help='instrument all the IR files listed in MANIFEST')
   parser.add_argument('--dir', default='llfi', dest='DIR',
                       help='directory to store instrumented executables')
   parser.add_argument('-l',  action='append', default=[], metavar='LIB',
@@ -70,6 +126,17 @@ def initParser():
   parser.add_argument('--IRonly', action='store_true',
                       help='only generate instrumented IR files; linking and \
                       executable generation will be done manually')
+  parser.add_argument('-j', '--jobs', type=int, dest='JOBS',
+                      help='number of instrumentation steps to run at the \
+                      same time (default: jobs of the batch manifest, or \
+                      number of CPUs)')
+  parser.add_argument('--cache', action='store_true', dest='USE_CACHE',
+                      help='restore unchanged instrumentation steps from a \
+                      content-addressed build cache; an existing --dir is \
+                      then updated in place')
+  parser.add_argument('--cache-dir', default=buildcache.defaultCacheDir(),
+                      dest='CACHE_DIR',
+                      help='location of the build cache (default: %(default)s)')
   parser.add_argument('-v', '--verbose', action='store_true', dest='VERBOSE',
                       help='show verbose information')
   # secret option set by YAML
@@ -80,29 +147,56 @@ def initParser():
 def parseArgs(parser, args):
   options = parser.parse_args(args)
 
+  if (options.IR_FILE is None) == (options.BATCH is None):
+    usage("Specify either an IR_FILE or --batch MANIFEST")
+  if options.JOBS is not None and options.JOBS < 1:
+    usage("The number of jobs must be at least 1")
+
   # some post processing is necessary
   options.DIR = options.DIR.rstrip('/')
-  options.IR_FILE = os.path.join(basedir, options.IR_FILE)
-  for _, d in enumerate(options.L):
-    d = os.path.join(basedir, d)
+  if options.IR_FILE is not None:
+    options.IR_FILE = os.path.join(basedir, options.IR_FILE)
+  for index, d in enumerate(options.L):
+    options.L[index] = os.path.join(basedir, d)
+  # opt writes its statistics into the directory it runs in
+  options.WORK_DIR = basedir
+  options.INPUT_YAML = None
+
+  options.cache = None
+  if options.USE_CACHE:
+    options.cache = buildcache.buildCache(options.CACHE_DIR, 'instrument')
+  return options
 
+def prepareOptions(options):
+  '''
+    Create the output directory of options.IR_FILE
+  '''
+  # only a directory created here is removed on errors
+  options.CREATED_DIR = False
   if '/' in options.DIR:
-    usage("Cannot specify embedded directories for --dir")
+    raise InstrumentError("Cannot specify embedded directories for --dir")
   else:
     srcpath = os.path.dirname(options.IR_FILE)
     fullpath = os.path.join(srcpath, options.DIR)
-    if os.path.exists(fullpath):
-      usage(options.DIR + " already exists under " + srcpath + \
+    if options.USE_CACHE and os.path.isdir(fullpath):
+      options.DIR = fullpath
+    elif os.path.exists(fullpath):
+      raise InstrumentError(options.DIR + " already exists under " + srcpath + \
             ", you can either specify a different directory for --dir or " +\
             "remove " + options.DIR + " from " + srcpath)
     else:
       try:
         os.mkdir(fullpath)
         options.DIR = fullpath
+        options.CREATED_DIR = True
       except:
-        usage("Unable to create a directory named " + options.DIR +\
-              " under " + srcpath)
-  return options
+        raise InstrumentError("Unable to create a directory named " +
+                              options.DIR + " under " + srcpath)
+
+def removeOutputDir(options):
+  #remove the output directory after an error, if this invocation created it
+  if options.CREATED_DIR:
+    shutil.rmtree(options.DIR, ignore_errors = True)
 
 def usage(msg = None):
   retval = 0
@@ -116,42 +210,48 @@ def usage(msg = None):
 
 def verbosePrint(msg, verbose):
   if verbose:
-    print(msg)
+    # single write, so lines from concurrent build steps do not interleave
+    sys.stdout.write(msg + "\n")
+    sys.stdout.flush()
 
 def checkInputYaml(options):
   #Check for input.yaml's presence
   srcpath = os.path.dirname(options.IR_FILE)
+  inputyaml = options.INPUT_YAML or os.path.join(srcpath, 'input.yaml')
   try:
-    f = open(os.path.join(srcpath, 'input.yaml'), 'r')
+    f = open(inputyaml, 'r')
   except:
-    print("ERROR: No input.yaml file in the %s directory." % srcpath)
-    os.rmdir(options.DIR)
-    exit(1)
+    removeOutputDir(options)
+    raise InstrumentError("No input.yaml file in the %s directory." %
+                          os.path.dirname(inputyaml))
 
   #Check for input.yaml's correct formmating
   try:
-    doc = yaml.load(f)
+    doc = yaml.safe_load(f)
     f.close()
     verbosePrint(yaml.dump(doc), options.VERBOSE)
   except:
-    print("Error: input.yaml is not formatted in proper YAML (reminder: use spaces, not tabs)")
-    os.rmdir(options.DIR)
-    exit(1)
+    removeOutputDir(options)
+    raise InstrumentError("input.yaml is not formatted in proper YAML (reminder: use spaces, not tabs)")
 
   #Check for compileOption in input.yaml
   cOpt = None
   try:
     cOpt = doc["compileOption"]
   except:
-    print("ERROR: Please include compileOptions in input.yaml.")
-    os.rmdir(options.DIR)
-    exit(1)
+    removeOutputDir(options)
+    raise InstrumentError("Please include compileOptions in input.yaml.")
   return cOpt
 
 ################################################################################
 def execCompilation(execlist, options):
   verbosePrint(' '.join(execlist), options.VERBOSE)
-  p = subprocess.Popen(execlist)
+  try:
+    p = subprocess.Popen(execlist, cwd=options.WORK_DIR)
+  except OSError as e:
+    print("ERROR: unable to run " + execlist[0] + ": " + str(e),
+          file=sys.stderr)
+    return 1
   p.wait()
   return p.returncode
 
@@ -161,8 +261,7 @@ def readCompileOption(cOpt, options):
 
   ###Instruction selection method
   if "instSelMethod" not in cOpt:
-    print ("\n\nERROR: Please include an 'instSelMethod' key value pair under compileOption in input.yaml.\n")
-    exit(1)
+    raise InstrumentError("Please include an 'instSelMethod' key value pair under compileOption in input.yaml.")
   else:
     validMethods = ["insttype", "funcname", "custominstselector"]
     # Generate list of instruction selection methods
@@ -171,8 +270,7 @@ def readCompileOption(cOpt, options):
     for method in instSelMethod:
       methodName = list(method.keys())[0]
       if methodName not in validMethods:
-        print ("\n\nERROR: Unknown instruction selection method in input.yaml.\n")
-        exit(1)
+        raise InstrumentError("Unknown instruction selection method in input.yaml.")
       if methodName != "custominstselector":
         compileOptions.append("-%s" % (str(methodName)))
       else:
@@ -183,8 +281,7 @@ def readCompileOption(cOpt, options):
       # Ensure that 'include' is specified at least
       # TODO: This isn't a very extendible way of doing this.
       if methodName != "custominstselector" and "include" not in method[methodName]:
-        print(("\n\nERROR: An 'include' list must be present for the %s method in input.yaml.\n" % (methodName)))
-        exit(1)
+        raise InstrumentError("An 'include' list must be present for the %s method in input.yaml." % methodName)
 
       # Parse all options for current method
       for attr in list(method[methodName].keys()):
@@ -201,15 +298,13 @@ def readCompileOption(cOpt, options):
 
   ###Register selection method
   if "regSelMethod" not in cOpt:
-    print ("\n\nERROR: Please include an 'regSelMethod' key value pair under compileOption in input.yaml.\n")
-    exit(1)
+    raise InstrumentError("Please include an 'regSelMethod' key value pair under compileOption in input.yaml.")
   else:
     #Select by register location
     if cOpt["regSelMethod"] == 'regloc':
       compileOptions.append('-regloc')
       if "regloc" not in cOpt:
-        print ("\n\nERROR: An 'regloc' key value pair must be present for the regloc method in input.yaml.\n")
-        exit(1)
+        raise InstrumentError("An 'regloc' key value pair must be present for the regloc method in input.yaml.")
       else:
         compileOptions.append('-'+cOpt["regloc"])
 
@@ -217,8 +312,7 @@ def readCompileOption(cOpt, options):
     elif cOpt["regSelMethod"]  == 'customregselector':
       compileOptions.append('-customregselector')
       if "customRegSelector" not in cOpt:
-        print ("\n\nERROR: An 'customRegSelector' key value pair must be present for the customregselector method in input.yaml.\n")
-        exit(1)
+        raise InstrumentError("An 'customRegSelector' key value pair must be present for the customregselector method in input.yaml.")
       else:
           compileOptions.append('-firegselectorname='+cOpt["customRegSelector"])
           if "customRegSelectorOption" in cOpt:
@@ -226,8 +320,7 @@ def readCompileOption(cOpt, options):
               compileOptions.append(opt)
 
     else:
-      print ("\n\nERROR: Unknown Register selection method in input.yaml.\n")
-      exit(1)
+      raise InstrumentError("Unknown Register selection method in input.yaml.")
 
   ###Injection Trace selection
   if "includeInjectionTrace" in cOpt:
@@ -237,8 +330,18 @@ def readCompileOption(cOpt, options):
       elif trace == 'backward':
         compileOptions.append('-includebackwardtrace')
       else:
-        print ("\n\nERROR: Invalid value for trace (forward/backward allowed) in input.yaml.\n")
-        exit(1)
+        raise InstrumentError("Invalid value for trace (forward/backward allowed) in input.yaml.")
+
+  ###Cycle counting granularity
+  if "cycleCounting" in cOpt:
+    if cOpt["cycleCounting"] == 'block':
+      compileOptions.append('-blockcyclecounting')
+    elif cOpt["cycleCounting"] != 'instruction':
+      raise InstrumentError("Invalid value for cycleCounting (instruction/block allowed) in input.yaml.")
+
+  ###Per llfi_index profile
+  if str(cOpt.get("profileSites", False)).lower() == "true":
+    compileOptions.append('-profilesites')
 
   ###Tracing Proppass
   if "tracingPropagation" in cOpt:
@@ -263,6 +366,28 @@ def readCompileOption(cOpt, options):
 
   return compileOptions
 
+################################################################################
+def readVariants(cOpt, options):
+  '''
+    compileOption is either a single set of options, or a list of named
+    variants, e.g. one per instruction type. Returns a list of
+    (name, compileOptions) tuples, name being None for a single configuration.
+  '''
+  if not isinstance(cOpt, list):
+    return [(None, readCompileOption(cOpt, options))]
+
+  variants = []
+  for variant in cOpt:
+    if not isinstance(variant, dict) or "name" not in variant:
+      raise InstrumentError("Each compileOption variant must have a 'name' in input.yaml.")
+    name = str(variant["name"])
+    if name in [n for n, _ in variants] or '/' in name or name.startswith('.'):
+      raise InstrumentError("Invalid or duplicated compileOption variant name '%s' in input.yaml." % name)
+    variants.append((name, readCompileOption(variant, options)))
+  if len(variants) == 0:
+    raise InstrumentError("compileOption must not be an empty list in input.yaml.")
+  return variants
+
 ################################################################################
 def _suffixOfIR(options):
   if options.READABLE:
@@ -270,58 +395,140 @@ def _suffixOfIR(options):
   else:
     return ".bc"
 
-def compileProg(options, compileOptions):
+class BuildStep:
+  '''
+    One external tool invocation of the instrumentation pipeline. A step is
+    started as soon as all the steps named in deps have succeeded.
+  '''
+  def __init__(self, name, execlist, inputs, outputs, deps=(), tooldeps=(),
+               fallback=None):
+    self.name = name
+    self.execlist = execlist
+    # files read and written by the step, and other files (libraries) its
+    # result depends on; used to key the build cache
+    self.inputs = list(inputs)
+    self.outputs = list(outputs)
+    self.tooldeps = list(tooldeps)
+    self.deps = list(deps)
+    # alternative command tried when execlist fails
+    self.fallback = fallback
+    self.retcode = None
+
+def stepCacheKey(step, cache):
+  # only the contents of inputs and outputs matter, not where they are, so
+  # their paths are replaced by placeholders on the command line, also as the
+  # value of an option (-llficatalogfile=<path>)
+  placeholders = {}
+  for i, f in enumerate(step.inputs):
+    placeholders[f] = '<input%d>' % i
+  for i, f in enumerate(step.outputs):
+    placeholders[f] = '<output%d>' % i
+  def placeholder(arg):
+    if arg in placeholders:
+      return placeholders[arg]
+    opt, sep, val = arg.partition('=')
+    if sep and val in placeholders:
+      return opt + sep + placeholders[val]
+    return arg
+  args = [placeholder(arg) for arg in step.execlist[1:]]
+  filehashes = [buildcache.hashFile(f) for f in step.inputs]
+  filehashes += [buildcache.hashFile(f) if os.path.isfile(f) else None
+                 for f in step.tooldeps]
+  return cache.key(buildcache.toolVersion(step.execlist[0]), args, filehashes)
+
+def runStep(step, options):
+  if options.cache is not None:
+    key = stepCacheKey(step, options.cache)
+    if options.cache.restore(key, step.outputs):
+      verbosePrint("Restored " + ", ".join(step.outputs) + " from cache",
+                   options.VERBOSE)
+      return 0
+
+  retcode = execCompilation(step.execlist, options)
+  if retcode != 0 and step.fallback is not None:
+    print("...Error compiling with " + os.path.basename(step.execlist[0]) +
+          ", trying with " + os.path.basename(step.fallback[0]) + ".")
+    retcode = execCompilation(step.fallback, options)
+
+  if retcode == 0 and options.cache is not None:
+    options.cache.store(key, step.outputs)
+  return retcode
+
+def runBuildGraph(steps, options, pool=None):
+  '''
+    Run the steps in dependency order, with independent steps running at the
+    same time in pool (by default, a pool of options.JOBS workers). No new step
+    is started after a failure. Returns the first failed step, or None if
+    every step succeeded.
+  '''
+  if pool is None:
+    with concurrent.futures.ThreadPoolExecutor(max_workers=options.JOBS) as pool:
+      return runBuildGraph(steps, options, pool)
+
+  pending = list(steps)
+  done = set()
+  running = {}
+  failed = None
+  while True:
+    if failed is None:
+      ready = [s for s in pending if all(d in done for d in s.deps)]
+      for step in ready:
+        pending.remove(step)
+        running[pool.submit(runStep, step, options)] = step
+    if not running:
+      break
+    finished, _ = concurrent.futures.wait(
+        running, return_when=concurrent.futures.FIRST_COMPLETED)
+    for future in finished:
+      step = running.pop(future)
+      step.retcode = future.result()
+      if step.retcode == 0:
+        done.add(step.name)
+      elif failed is None:
+        failed = step
+  return failed
+
+def variantSteps(options, variant, compileOptions, llfi_indexed_file):
+  '''
+    Return the pass steps and link steps building the profiling and fault
+    injection executables of one compileOption variant
+  '''
   srcbase = os.path.basename(options.IR_FILE)
-  progbin = os.path.join(options.DIR, srcbase[0 : srcbase.rfind(".")])
+  vardir = options.DIR
+  prefix = ''
+  if variant is not None:
+    vardir = os.path.join(options.DIR, variant)
+    prefix = variant + '/'
+    if not os.path.isdir(vardir):
+      os.mkdir(vardir)
+  progbin = os.path.join(vardir, srcbase[0 : srcbase.rfind(".")])
 
-  llfi_indexed_file = progbin + "-llfi_index"
   proffile = progbin + "-profiling"
   fifile = progbin + "-faultinjection"
-  tmpfiles = []
-
-  execlist = [optbin, '-load', llfilib, '-genllfiindexpass','-o',
-              llfi_indexed_file + _suffixOfIR(options), options.IR_FILE]
-  if options.READABLE:
-    execlist.append('-S')
-  if options.GEN_DOT_GRAPH:
-    execlist.append('-dotgraphpass')
-  retcode = execCompilation(execlist, options)
 
-  if retcode == 0:
-    execlist = [optbin, '-load', llfilib, '-profilingpass']
-    execlist2 = ['-o', proffile + _suffixOfIR(options), llfi_indexed_file + _suffixOfIR(options)]
+  passsteps = []
+  for name, passname, outfile in [('profiling', '-profilingpass', proffile),
+                                  ('faultinjection', '-faultinjectionpass',
+                                   fifile)]:
+    execlist = [optbin, '-load', llfilib, passname]
     execlist.extend(compileOptions)
-    execlist.extend(execlist2)
+    outputs = [outfile + _suffixOfIR(options)]
+    if name == 'faultinjection':
+      # catalog of the fault injection sites, beside the executables
+      catalog = os.path.join(vardir, "llfi.stat.catalog.txt")
+      execlist.append('-llficatalogfile=' + catalog)
+      outputs.append(catalog)
+    execlist.extend(['-o', outfile + _suffixOfIR(options),
+                     llfi_indexed_file + _suffixOfIR(options)])
     if options.READABLE:
       execlist.append("-S")
-    retcode = execCompilation(execlist, options)
-
-  if retcode == 0:
-    execlist = [optbin, '-load', llfilib, "-faultinjectionpass"]
-    execlist2 = ['-o', fifile + _suffixOfIR(options), llfi_indexed_file + _suffixOfIR(options)]
-    execlist.extend(compileOptions)
-    execlist.extend(execlist2)
-    if options.READABLE:
-      execlist.append("-S")
-    retcode = execCompilation(execlist, options)
-
-  if retcode != 0:
-    print("\nERROR: there was an error during running the "\
-                         "instrumentation pass, please follow"\
-                         " the provided instructions for %s." % prog, file=sys.stderr)
-    shutil.rmtree(options.DIR, ignore_errors = True)
-    sys.exit(retcode)
+    passsteps.append(BuildStep(prefix + name, execlist,
+                               [llfi_indexed_file + _suffixOfIR(options)],
+                               outputs, deps=['index'], tooldeps=[llfilib]))
 
+  # object generation and linking
+  linksteps = []
   if not options.IRonly:
-    if retcode == 0:
-      execlist = [llcbin, '-filetype=obj', '-o', proffile + '.o', proffile + _suffixOfIR(options)]
-      tmpfiles.append(proffile + '.o')
-      retcode = execCompilation(execlist, options)
-    if retcode == 0:
-      execlist = [llcbin, '-filetype=obj', '-o', fifile + '.o', fifile + _suffixOfIR(options)]
-      tmpfiles.append(fifile + '.o')
-      retcode = execCompilation(execlist, options)
-
     liblist = []
     for lib_dir in options.L:
       liblist.extend(["-L", lib_dir])
@@ -330,36 +537,198 @@ def compileProg(options, compileOptions):
     liblist.append("-Wl,-rpath")
     liblist.append(llfilinklib)
 
-    if retcode == 0:
-      execlist = [llvmgcc, '-o', proffile + '.exe', proffile + '.o', '-L'+llfilinklib , '-lllfi-rt']
-      execlist.extend(liblist)
-      retcode = execCompilation(execlist, options)
-      if retcode != 0:
-        print("...Error compiling with " + os.path.basename(llvmgcc) + ", trying with " + os.path.basename(llvmgxx) + ".")
-        execlist[0] = llvmgxx
-        retcode = execCompilation(execlist, options)
-    if retcode == 0:
-      execlist = [llvmgcc, '-o', fifile + '.exe', fifile + '.o', '-L'+llfilinklib , '-lllfi-rt']
+    for name, outfile in [('profiling', proffile), ('faultinjection', fifile)]:
+      execlist = [llcbin, '-filetype=obj', '-o', outfile + '.o',
+                  outfile + _suffixOfIR(options)]
+      linksteps.append(BuildStep(prefix + name + '.o', execlist,
+                                 [outfile + _suffixOfIR(options)],
+                                 [outfile + '.o'], deps=[prefix + name]))
+
+      execlist = [llvmgcc, '-o', outfile + '.exe', outfile + '.o',
+                  '-L'+llfilinklib , '-lllfi-rt']
       execlist.extend(liblist)
-      retcode = execCompilation(execlist, options)
-      if retcode != 0:
-        print("...Error compiling with " + os.path.basename(llvmgcc) + ", trying " + os.path.basename(llvmgxx) + ".")
-        execlist[0] = llvmgxx
-        retcode = execCompilation(execlist, options)
+      fallback = [llvmgxx] + execlist[1:]
+      linksteps.append(BuildStep(prefix + name + '.exe', execlist,
+                                 [outfile + '.o'], [outfile + '.exe'],
+                                 deps=[prefix + name + '.o'],
+                                 tooldeps=[llfirtlib], fallback=fallback))
 
+  return passsteps, linksteps, proffile, fifile
 
-    for tmpfile in tmpfiles:
-      try:
-        os.remove(tmpfile)
-      except:
-        pass
-    if retcode != 0:
-      print("\nERROR: there was an error during linking and generating executables,"\
-                           "Please take %s and %s and generate the executables manually (linking llfi-rt "\
-                           "in directory %s)." %(proffile + _suffixOfIR(), fifile + _suffixOfIR(), llfilinklib), file=sys.stderr)
-      sys.exit(retcode)
-    else:
-      print("\nSuccess", file=sys.stderr)
+def compileProg(options, variants, pool=None):
+  srcbase = os.path.basename(options.IR_FILE)
+  progbin = os.path.join(options.DIR, srcbase[0 : srcbase.rfind(".")])
+
+  # the indexed IR does not depend on the selectors, so it is built once and
+  # shared by all the variants
+  llfi_indexed_file = progbin + "-llfi_index"
+  execlist = [optbin, '-load', llfilib, '-genllfiindexpass','-o',
+              llfi_indexed_file + _suffixOfIR(options), options.IR_FILE]
+  # the index pass also writes statistics into the working directory
+  outputs = [llfi_indexed_file + _suffixOfIR(options),
+             os.path.join(options.WORK_DIR, "llfi.stat.totalindex.txt")]
+  if options.READABLE:
+    execlist.append('-S')
+  if options.GEN_DOT_GRAPH:
+    execlist.append('-dotgraphpass')
+    outputs.append(os.path.join(options.WORK_DIR, "llfi.stat.graph.dot"))
+  passsteps = [BuildStep('index', execlist, [options.IR_FILE], outputs,
+                         tooldeps=[llfilib])]
+
+  linksteps = []
+  irfiles = {}
+  for variant, compileOptions in variants:
+    vpasssteps, vlinksteps, proffile, fifile = variantSteps(
+        options, variant, compileOptions, llfi_indexed_file)
+    passsteps.extend(vpasssteps)
+    linksteps.extend(vlinksteps)
+    for step in vlinksteps:
+      irfiles[step.name] = (proffile, fifile)
+
+  failed = runBuildGraph(passsteps + linksteps, options, pool)
+  if options.cache is not None:
+    verbosePrint("Build cache: %d steps restored, %d rebuilt" %
+                 (options.cache.hits, options.cache.misses), options.VERBOSE)
+
+  # object files are only intermediates
+  for step in linksteps:
+    for output in step.outputs:
+      if output.endswith('.o'):
+        try:
+          os.remove(output)
+        except:
+          pass
+
+  if failed in passsteps:
+    removeOutputDir(options)
+    raise InstrumentError("there was an error during running the "\
+                          "instrumentation pass, please follow"\
+                          " the provided instructions for %s." % srcbase,
+                          failed.retcode)
+
+  if not options.IRonly and failed is not None:
+    proffile, fifile = irfiles[failed.name]
+    raise InstrumentError("there was an error during linking and generating executables,"\
+                          "Please take %s and %s and generate the executables manually (linking llfi-rt "\
+                          "in directory %s)." %(proffile + _suffixOfIR(options), fifile + _suffixOfIR(options), llfilinklib),
+                          failed.retcode)
+
+################################################################################
+def readManifest(manifest):
+  '''
+    Return the list of programs of a batch manifest, with their paths made
+    absolute
+  '''
+  try:
+    with open(manifest, 'r') as f:
+      doc = yaml.safe_load(f)
+  except (OSError, IOError):
+    raise InstrumentError("Unable to read the batch manifest " + manifest)
+  except yaml.YAMLError:
+    raise InstrumentError(manifest + " is not formatted in proper YAML "\
+                          "(reminder: use spaces, not tabs)")
+  if not isinstance(doc, dict) or not isinstance(doc.get('programs'), list)\
+     or not doc['programs']:
+    raise InstrumentError("The batch manifest needs a non-empty list of programs")
+
+  mandir = os.path.dirname(os.path.abspath(manifest))
+  programs = []
+  for prog in doc['programs']:
+    if isinstance(prog, str):
+      prog = {'ir': prog}
+    if not isinstance(prog, dict) or 'ir' not in prog:
+      raise InstrumentError("Every program of the batch manifest needs an ir entry")
+    prog = dict(prog)
+    prog['ir'] = os.path.join(mandir, prog['ir'])
+    if 'input' in prog:
+      prog['input'] = os.path.join(mandir, prog['input'])
+    prog['L'] = [os.path.join(mandir, d) for d in prog.get('L', [])]
+    programs.append(prog)
+
+  jobs = doc.get('jobs')
+  if jobs is not None and (not isinstance(jobs, int) or jobs < 1):
+    raise InstrumentError("jobs in the batch manifest must be at least 1")
+  return programs, jobs
+
+def batchOptions(options, prog):
+  '''
+    Options of a single program of the batch, the command line options being
+    the defaults
+  '''
+  progOptions = argparse.Namespace(**vars(options))
+  progOptions.BATCH = None
+  progOptions.IR_FILE = prog['ir']
+  progOptions.INPUT_YAML = prog.get('input')
+  progOptions.DIR = str(prog.get('dir', options.DIR)).rstrip('/')
+  progOptions.l = options.l + list(prog.get('l', []))
+  progOptions.L = options.L + prog['L']
+  progOptions.READABLE = prog.get('readable', options.READABLE)
+  progOptions.IRonly = prog.get('IRonly', options.IRonly)
+  # run the tools in the output directory of each program, so that the
+  # statistics they write do not collide between programs
+  progOptions.WORK_DIR = os.path.join(os.path.dirname(prog['ir']),
+                                      progOptions.DIR)
+  return progOptions
+
+def runBatch(options):
+  try:
+    programs, jobs = readManifest(options.BATCH)
+  except InstrumentError as e:
+    print("\nERROR: " + str(e), file=sys.stderr)
+    return 1
+  if options.JOBS is None:
+    options.JOBS = jobs or os.cpu_count()
+  # the programs must not overwrite the files of one another
+  outdirs = {}
+  for prog in programs:
+    outdir = batchOptions(options, prog).WORK_DIR
+    if outdir in outdirs:
+      print("\nERROR: %s and %s would share the output directory %s, give "
+            "them different dir entries in the batch manifest" %
+            (outdirs[outdir], prog['ir'], outdir), file=sys.stderr)
+      return 1
+    outdirs[outdir] = prog['ir']
+
+  results = [None] * len(programs)
+  lock = threading.Lock()
+
+  def instrumentOne(i, prog):
+    start = time.time()
+    try:
+      progOptions = batchOptions(options, prog)
+      prepareOptions(progOptions)
+      instrumentProg(progOptions, pool)
+      status = 'ok'
+    except InstrumentError as e:
+      status = 'failed'
+      with lock:
+        print("\nERROR: %s: %s" % (prog['ir'], e), file=sys.stderr)
+    except Exception as e:
+      status = 'failed'
+      with lock:
+        print("\nERROR: %s: unexpected error: %r" % (prog['ir'], e),
+              file=sys.stderr)
+    results[i] = (prog['ir'], status, time.time() - start)
+
+  # the programs share one pool of workers for their build steps; each
+  # program only schedules its own steps, from its own thread
+  with concurrent.futures.ThreadPoolExecutor(max_workers=options.JOBS) as pool:
+    threads = [threading.Thread(target=instrumentOne, args=(i, prog))
+               for i, prog in enumerate(programs)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+
+  width = max(len(os.path.relpath(r[0], basedir)) for r in results)
+  print("\n%-*s  %-6s  %s" % (width, "program", "status", "time"))
+  for ir, status, elapsed in results:
+    print("%-*s  %-6s  %.1fs" % (width, os.path.relpath(ir, basedir), status,
+                                 elapsed))
+  nfailed = sum(1 for r in results if r[1] != 'ok')
+  print("\n%d of %d programs instrumented" % (len(results) - nfailed,
+                                              len(results)))
+  return 1 if nfailed else 0
 
 if __name__=="__main__":
   run(sys.argv[1:])
@@ -13,6 +13,16 @@ Prerequisites:
      outputs. If your output is not under current directory, you need to store
      that output by yourself.
   4. You need to put input files (if any) in the current working directory.
+
+The profile (llfi.stat.prof.txt) is moved beside PROF_EXE, so that every
+compileOption variant keeps its own for llfi-inject. If the executables were
+instrumented with profileSites in compileOption, the dynamic execution count
+of every llfi_index is also written to llfi.stat.prof.sites.bin, which
+loadSiteProfile() memory-maps.
+
+The wall-clock time of the golden run, in seconds, is written to
+baseline/golden_time, from which llfi-inject derives its timeout with
+adaptiveTimeOut in input.yaml.
 """
 
 # This script profiles the program to produce llfi.stat.prof.txt
@@ -24,11 +34,18 @@ import time
 import subprocess
 import shutil
 import argparse
+import mmap
+import struct
 
 prog = os.path.basename(sys.argv[0])
 
 basedir = os.getcwd()
 
+# files produced by profiling, moved beside PROF_EXE for llfi-inject
+PROFILE_FILES = ("llfi.stat.prof.txt", "llfi.stat.prof.sites.bin")
+SITE_PROFILE_MAGIC = b"LLFISIT1"
+SITE_PROFILE_HEADER = struct.Struct("=8sQ")
+
 def usage(msg = None):
   retval = 0
   if msg is not None:
@@ -56,7 +73,10 @@ def initParser():
 def parseArgs(parser, args):
   options = parser.parse_args(args)
   options.PROF_EXE = os.path.realpath(options.PROF_EXE)
-  if os.path.dirname(os.path.dirname(options.PROF_EXE)) != basedir:
+  # PROF_EXE is either in the llfi directory under the current directory, or in
+  # the directory of a compileOption variant below it
+  exedir = os.path.dirname(options.PROF_EXE)
+  if exedir == basedir or not exedir.startswith(basedir + os.sep):
     usage("You need to invoke llfi-inject at the parent directory of PROF_EXE")
 
   # remove the directory prefix for input files, this is to make it easier for the program
@@ -72,25 +92,25 @@ def parseArgs(parser, args):
 
 def checkInputYaml(prof_exe):
   #Check for input.yaml's presence
-  yamldir = os.path.dirname(os.path.dirname(prof_exe))
+  yamldir = basedir
   try:
     f = open(os.path.join(yamldir, 'input.yaml'), 'r')
   except:
-    usage("No input.yaml file in the parent directory of profiling executable")
+    usage("No input.yaml file in the current directory")
     exit(1)
 
   #Check for input.yaml's correct formmating
   try:
-    doc = yaml.load(f)
+    doc = yaml.safe_load(f)
     f.close()
-  except:
+  except yaml.YAMLError:
     usage("input.yaml is not formatted in proper YAML (reminder: use spaces, not tabs)")
     exit(1)
 
 
 ################################################################################
 def config(profiling_exe):
-  global inputdir, outputdir, baselinedir, errordir
+  global llfi_dir, inputdir, outputdir, baselinedir, errordir
   # config
   llfi_dir = os.path.dirname(profiling_exe)
 
@@ -112,24 +132,27 @@ def config(profiling_exe):
 def execute(execlist):
   global outputfile
   print('\t' + ' '.join(execlist))
+  # a profile left by an earlier run is not taken for the profile of this one
+  for each in PROFILE_FILES:
+    for path in (each, os.path.join(llfi_dir, each)):
+      if os.path.isfile(path):
+        os.remove(path)
   #get state of directory
   dirSnapshot()
+  elapsetime = -time.time()
   p = subprocess.Popen(execlist, stdout = subprocess.PIPE)
-  elapsetime = 0
-  while True:
-    elapsetime += 1
-    time.sleep(1)
-    #print p.poll()
-    if p.poll() is not None:
-      moveOutput()
-      print("\t program finish", p.returncode)
-      print("\t time taken", elapsetime,"\n")
-      outputFile = open(outputfile, "wb")
-      outputFile.write(p.communicate()[0])
-      outputFile.close()
-      replenishInput() #for cases where program deletes input or alters them each run
-      #inputFile.close()
-      return p.returncode
+  output = p.communicate()[0]
+  elapsetime += time.time()
+  moveOutput()
+  print("\t program finish", p.returncode)
+  print("\t time taken %.3f\n" % elapsetime)
+  outputFile = open(outputfile, "wb")
+  outputFile.write(output)
+  outputFile.close()
+  with open(os.path.join(baselinedir, "golden_time"), "w") as timeFile:
+    timeFile.write("%.6f\n" % elapsetime)
+  replenishInput() #for cases where program deletes input or alters them each run
+  return p.returncode
 
 ################################################################################
 def storeInputFiles(exe_args):
@@ -148,10 +171,13 @@ def replenishInput():#TODO make condition to skip this if input is present
 
 ################################################################################
 def moveOutput():
-  #move all newly created files that are not "llfi.stat.prof.txt" < -- since this is a product of profiling
+  #move all newly created files; PROFILE_FILES are a product of profiling,
+  #and go beside the profiling executable
   newfiles = [_file for _file in os.listdir(".")]
   for each in newfiles:
-    if each not in dirBefore and each != "llfi.stat.prof.txt":
+    if each in PROFILE_FILES:
+      shutil.move(each, os.path.join(llfi_dir, each))
+    elif each not in dirBefore:
       fileSize = os.stat(each).st_size
       if fileSize == 0 and each.startswith("llfi"):
         #empty library output, can delete
@@ -169,6 +195,75 @@ def dirSnapshot():
   global dirBefore
   dirBefore = [_file for _file in os.listdir(".")]
 
+################################################################################
+class siteProfile:
+  '''
+    Dynamic execution count (counts[i]) and opcode (opcodes[i]) of every
+    llfi_index i, memory-mapped from a site profile. The arrays are NumPy
+    memmaps if NumPy is available, and memoryviews otherwise.
+  '''
+  def __init__(self, counts, opcodes, closer=None):
+    self.counts = counts
+    self.opcodes = opcodes
+    self._closer = closer
+
+  def __len__(self):
+    return len(self.counts)
+
+  def executed(self):
+    '''
+      Generator of (llfi_index, count, opcode) for the indices executed at
+      least once
+    '''
+    for index in range(len(self.counts)):
+      if self.counts[index]:
+        yield index, int(self.counts[index]), int(self.opcodes[index])
+
+  def close(self):
+    if self._closer is not None:
+      self._closer()
+      self._closer = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+def loadSiteProfile(filename="llfi.stat.prof.sites.bin"):
+  with open(filename, "rb") as f:
+    magic, n = SITE_PROFILE_HEADER.unpack(f.read(SITE_PROFILE_HEADER.size))
+  if magic != SITE_PROFILE_MAGIC:
+    raise ValueError(filename + " is not an LLFI site profile")
+  offset = SITE_PROFILE_HEADER.size
+  if os.path.getsize(filename) < offset + 9 * n:
+    raise ValueError(filename + " is truncated")
+
+  try:
+    import numpy
+  except ImportError:
+    numpy = None
+  if numpy is not None:
+    counts = numpy.memmap(filename, dtype=numpy.uint64, mode="r",
+                          offset=offset, shape=(n,))
+    opcodes = numpy.memmap(filename, dtype=numpy.uint8, mode="r",
+                           offset=offset + 8 * n, shape=(n,))
+    return siteProfile(counts, opcodes)
+
+  with open(filename, "rb") as f:
+    if n == 0:
+      return siteProfile([], [])
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  view = memoryview(mm)
+  counts = view[offset:offset + 8 * n].cast("Q")
+  opcodes = view[offset + 8 * n:offset + 9 * n]
+  def closer():
+    counts.release()
+    opcodes.release()
+    view.release()
+    mm.close()
+  return siteProfile(counts, opcodes, closer)
+
 ################################################################################
 def run(args):
   global outputfile
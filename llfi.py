@@ -9,25 +9,55 @@ LLFI is a toolchain used to inject faults into application code.
 
 # System imports
 import sys
+import importlib
 
-# LLFI imports
-import bin.inject as inject
-import bin.instrument as instrument
-import bin.profile as profile
-import tools.stats as stats
-import tools.compile as compile
-
-# Accepted commands mapped to their corresponding module, executed in the
-# form `llfi <cmd>`
+# Accepted commands mapped to the module implementing them, executed in the
+# form `llfi <cmd>`. A module is only imported when its command is dispatched,
+# so that a command does not pay for the imports (PyYAML, config/llvm_paths) and
+# the platform checks of the others.
 cmds = {
-  'compile' : compile,
-  'help' : int,
-  'inject' : inject,
-  'instrument' : instrument,
-  'profile' : profile,
-  'stats' : stats,
+  'bench-overhead' : 'bin.benchoverhead',
+  'compile' : 'tools.compile',
+  'inject' : 'bin.inject',
+  'instrument' : 'bin.instrument',
+  'profile' : 'bin.profile',
+  'propagation' : 'tools.propagation',
+  'stats' : 'tools.stats',
 }
 
+# Other packages add commands with entry points of this group, naming an
+# object (usually a module) with run(args) and, optionally, help():
+#   [project.entry-points."llfi.commands"]
+#   mytool = "mypackage.mytool"
+# The commands of LLFI take precedence over them.
+ENTRY_POINT_GROUP = 'llfi.commands'
+
+def entryPoints():
+  '''
+    The entry points of the commands of other packages, by name
+  '''
+  try:
+    from importlib import metadata
+  except ImportError:
+    return {}
+  eps = metadata.entry_points()
+  if hasattr(eps, 'select'):
+    eps = eps.select(group=ENTRY_POINT_GROUP)
+  else:
+    eps = eps.get(ENTRY_POINT_GROUP, [])
+  return dict((ep.name, ep) for ep in eps if ep.name not in cmds)
+
+def loadCommand(cmd):
+  '''
+    Import the implementation of cmd, or return None if cmd is not a command
+  '''
+  if cmd in cmds:
+    return importlib.import_module(cmds[cmd])
+  ep = entryPoints().get(cmd)
+  if ep is None:
+    return None
+  return ep.load()
+
 def print_help():
   s = \
 '''{}
@@ -36,7 +66,8 @@ Supported commands are:
 
 You can use `llfi help CMD` for information about a specific tool.
 '''
-  print(s.format(__doc__, '\n    '.join(sorted(cmds.keys()))))
+  names = sorted(list(cmds.keys()) + ['help'] + list(entryPoints().keys()))
+  print(s.format(__doc__, '\n    '.join(names)))
 
 if __name__ == '__main__':
   # Empty invocation, just print help
@@ -48,21 +79,25 @@ if __name__ == '__main__':
   args = sys.argv[2:] # possibly []
 
   if cmd == 'help' or cmd == '-h':
+    command = loadCommand(args[0]) if args else None
     if len(args) == 0:
       print_help()
-    elif args[0] in cmds:
-      cmds[args[0]].help() # specific sub-command help
+    elif command is not None:
+      if hasattr(command, 'help'):
+        command.help() # specific sub-command help
+      else:
+        print("llfi: no help for {!r}.".format(args[0]))
     else:
       print("llfi: {!r} is not a recognized command.".format(args[0]))
       print_help()
     sys.exit(0)
 
   # Check for invalid command
-  if cmd not in cmds:
+  command = loadCommand(cmd)
+  if command is None:
     print("llfi: {!r} is not a recognized command.".format(cmd))
     print_help()
     sys.exit(1)
 
   # Execute command!
-  cmds[cmd].run(args)
-
+  command.run(args)
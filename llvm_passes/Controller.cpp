@@ -95,6 +95,14 @@ cl::opt < std::string > llfilogfile("llfilogfile",
       cl::Hidden,
       cl::desc("Name of compilation passes logging file"));
 
+/**
+ * Cycle counting
+ */
+cl::opt< bool > blockcyclecounting("blockcyclecounting",
+    cl::init(false),
+    cl::desc("Count execution cycles once per basic block (segment) instead "
+             "of once per instruction"));
+
 
 Controller *Controller::ctrl = NULL;
 
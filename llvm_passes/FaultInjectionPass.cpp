@@ -19,9 +19,11 @@
 #include "llvm/IR/Function.h"
 #include "llvm/IR/LLVMContext.h"
 #include "llvm/IR/DataLayout.h"
+#include "llvm/Support/CommandLine.h"
 #include "llvm/Support/Debug.h"
 #include "llvm/Support/raw_ostream.h"
 
+#include <fstream>
 #include <vector>
 
 #include "FaultInjectionPass.h"
@@ -30,6 +32,12 @@
 
 namespace llfi {
 
+extern cl::opt< bool > blockcyclecounting;
+
+static cl::opt< std::string > llficatalogfile("llficatalogfile",
+    cl::init("llfi.stat.catalog.txt"),
+    cl::desc("Name of the catalog of fault injection sites"));
+
 std::string FaultInjectionPass::getFIFuncNameforType(const Type *type) {
   std::string funcname;
   if (fi_rettype_funcname_map.find(type) != fi_rettype_funcname_map.end()) {
@@ -95,6 +103,12 @@ void FaultInjectionPass::insertInjectionFuncCall(
       Instruction* ficall = CallInst::Create(
           injectfunc, args_array_ref, "fi", insertptr);
 
+      // preFunc counts the cycles of the instruction at its last register
+      long long cycle = getOpcodeExecCycle(fi_inst->getOpcode());
+      fi_call_cycles[ficall] = std::make_pair(
+          reg_index == total_reg_num - 1 ? cycle : 0, cycle);
+      fi_calls.insert(ficall);
+
       // redirect the data dependencies
       if (fi_reg == fi_inst) {
         // inject into destination
@@ -212,12 +226,89 @@ bool FaultInjectionPass::runOnModule(Module &M) {
   std::map<Instruction*, std::list< Value* >* > *fi_inst_regs_map;
   Controller *ctrl = Controller::getInstance(M);
   ctrl->getFIInstRegsMap(&fi_inst_regs_map);
+  writeCatalog(fi_inst_regs_map);
   insertInjectionFuncCall(fi_inst_regs_map, M);
+  if (blockcyclecounting)
+    insertCycleSegmentFuncCall(M);
 
   finalize(M);
   return true;
 }
 
+// The catalog lists every fault injection site, one per line in llfi index
+// order, with tab separated fields: llfi index, opcode name, function,
+// basic block, number of register targets, bit width of each register
+// target (comma separated) and number of uses of the instruction value.
+// It is written before the injection calls change the uses.
+void FaultInjectionPass::writeCatalog(
+    std::map<Instruction*, std::list< Value* >* > *inst_regs_map) {
+  std::ofstream catalog(llficatalogfile.c_str());
+  if (!catalog.is_open()) {
+    errs() << "ERROR: Unable to open the fault injection site catalog "
+        << llficatalogfile << "\n";
+    exit(1);
+  }
+
+  std::map<long, Instruction*> sites;
+  for (std::map<Instruction*, std::list< Value* >* >::iterator inst_reg_it =
+       inst_regs_map->begin(); inst_reg_it != inst_regs_map->end();
+       ++inst_reg_it)
+    sites[getLLFIIndexofInst(inst_reg_it->first)] = inst_reg_it->first;
+
+  DataLayout &td = getAnalysis<DataLayout>();
+  catalog << "# llfi_index\topcode\tfunction\tblock\tregs\twidths\tuses\n";
+  for (std::map<long, Instruction*>::iterator site_it = sites.begin();
+       site_it != sites.end(); ++site_it) {
+    Instruction *fi_inst = site_it->second;
+    BasicBlock *bb = fi_inst->getParent();
+    Function *func = bb->getParent();
+
+    std::string block = bb->getName().str();
+    if (block.empty()) {
+      // unnamed blocks are named after their position in the function
+      long pos = 0;
+      for (Function::iterator bb_it = func->begin(); &*bb_it != bb; ++bb_it)
+        ++pos;
+      block = "bb" + longToString(pos);
+    }
+
+    std::list<Value*> *fi_regs = (*inst_regs_map)[fi_inst];
+    std::string widths;
+    for (std::list<Value*>::iterator reg_it = fi_regs->begin();
+         reg_it != fi_regs->end(); ++reg_it) {
+      if (!widths.empty())
+        widths += ",";
+      widths += longToString(td.getTypeSizeInBits((*reg_it)->getType()));
+    }
+
+    catalog << site_it->first << "\t" << fi_inst->getOpcodeName() << "\t"
+        << func->getName().str() << "\t" << block << "\t" << fi_regs->size()
+        << "\t" << widths << "\t" << fi_inst->getNumUses() << "\n";
+  }
+  catalog.close();
+}
+
+// With block cycle counting, each segment tells the runtime the cycles of its
+// injection function calls up front. Unless the target cycle falls inside the
+// segment, the runtime then skips the per instruction checks of preFunc.
+void FaultInjectionPass::insertCycleSegmentFuncCall(Module &M) {
+  std::vector<CycleSegment> segments;
+  getCycleSegments(M, fi_call_cycles, fi_calls, segments);
+
+  Constant *entercycleblockfunc = getLLFILibEnterCycleBlockFunc(M);
+  Type *i64type = Type::getInt64Ty(M.getContext());
+  for (std::vector<CycleSegment>::iterator seg_it = segments.begin();
+       seg_it != segments.end(); ++seg_it) {
+    std::vector<Value*> args(2);
+    args[0] = ConstantInt::get(i64type, seg_it->delta);
+    args[1] = ConstantInt::get(i64type, seg_it->window);
+
+    // LLVM 3.3 Upgrade
+    ArrayRef<Value*> args_array_ref(args);
+    CallInst::Create(entercycleblockfunc, args_array_ref, "", seg_it->first);
+  }
+}
+
 void FaultInjectionPass::checkforMainFunc(Module &M) {
   Function* mainfunc = M.getFunction("main");
   if (mainfunc == NULL) {
@@ -303,6 +394,22 @@ Constant *FaultInjectionPass::getLLFILibPostInjectionFunc(Module &M) {
   return postfifunc;
 }
 
+Constant *FaultInjectionPass::getLLFILibEnterCycleBlockFunc(Module &M) {
+  LLVMContext &context = M.getContext();
+  std::vector<Type*> paramtypes(2);
+  paramtypes[0] = Type::getInt64Ty(context); // cycles of the segment
+  paramtypes[1] = Type::getInt64Ty(context); // cycle window of the segment
+
+  // LLVM 3.3 Upgrade
+  ArrayRef<Type*> paramtypes_array_ref(paramtypes);
+
+  FunctionType *entercycleblockfunctype = FunctionType::get(
+      Type::getVoidTy(context), paramtypes_array_ref, false);
+  Constant *entercycleblockfunc = M.getOrInsertFunction("enterCycleBlock",
+                                                     entercycleblockfunctype);
+  return entercycleblockfunc;
+}
+
 static RegisterPass<FaultInjectionPass> X(
     "faultinjectionpass", "Fault injection pass", false, false);
 }
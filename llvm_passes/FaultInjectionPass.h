@@ -10,6 +10,7 @@
 #include <iostream>
 #include <list>
 #include <map>
+#include <set>
 #include <string>
 
 using namespace llvm;
@@ -34,6 +35,9 @@ class FaultInjectionPass: public ModulePass {
                                   std::string &funcname, Constant *fi_func, 
                                   Constant *pre_func);
 	void createInjectionFunctions(Module &M);
+  void insertCycleSegmentFuncCall(Module &M);
+  void writeCatalog(
+      std::map<Instruction*, std::list< Value* >* > *inst_regs_map);
 
  private:
   std::string getFIFuncNameforType(const Type* type);
@@ -42,8 +46,12 @@ class FaultInjectionPass: public ModulePass {
   Constant *getLLFILibFIFunc(Module &M);
   Constant *getLLFILibInitInjectionFunc(Module &M);
   Constant *getLLFILibPostInjectionFunc(Module &M);
+  Constant *getLLFILibEnterCycleBlockFunc(Module &M);
  private:
   std::map<const Type*, std::string> fi_rettype_funcname_map;
+  // injection function calls, and the cycles each of them counts
+  std::map<Instruction*, std::pair<long long, long long> > fi_call_cycles;
+  std::set<Instruction*> fi_calls;
 };
 
 char FaultInjectionPass::ID=0;
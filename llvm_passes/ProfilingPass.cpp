@@ -17,6 +17,7 @@
 #include "llvm/IR/Instruction.h"
 #include "llvm/IR/Instructions.h"
 #include "llvm/IR/LLVMContext.h"
+#include "llvm/Support/CommandLine.h"
 #include "llvm/Support/raw_ostream.h"
 
 #include <list>
@@ -31,6 +32,14 @@ using namespace llvm;
 
 namespace llfi {
 
+extern cl::opt< bool > blockcyclecounting;
+
+static cl::opt< bool > profilesites("profilesites",
+    cl::init(false),
+    cl::desc("Also profile the dynamic execution count of every llfi index; "
+             "needs a profiling call per instruction, even with "
+             "-blockcyclecounting"));
+
 bool ProfilingPass::runOnModule(Module &M) {
 	LLVMContext &context = M.getContext();
 
@@ -38,6 +47,9 @@ bool ProfilingPass::runOnModule(Module &M) {
   Controller *ctrl = Controller::getInstance(M);
   ctrl->getFIInstRegsMap(&fi_inst_regs_map);
 
+  // instruction (profiling call position) -> cycles counted there
+  std::map<Instruction*, std::pair<long long, long long> > hooks;
+
   for (std::map<Instruction*, std::list< Value* >* >::const_iterator 
        inst_reg_it = fi_inst_regs_map->begin(); 
        inst_reg_it != fi_inst_regs_map->end(); ++inst_reg_it) {
@@ -45,28 +57,62 @@ bool ProfilingPass::runOnModule(Module &M) {
     std::list<Value* > *fi_regs = inst_reg_it->second;
     Value *fi_reg = *(fi_regs->begin());
     Instruction *insertptr = getInsertPtrforRegsofInst(fi_reg, fi_inst);
+
+    if (blockcyclecounting && !profilesites) {
+      long long cycle = getOpcodeExecCycle(fi_inst->getOpcode());
+      std::pair<long long, long long> &hook = hooks[insertptr];
+      hook.first += cycle;
+      if (cycle > hook.second)
+        hook.second = cycle;
+      continue;
+    }
     
     // function declaration
-    Constant* profilingfunc = getLLFILibProfilingFunc(M);
+    Constant* profilingfunc = profilesites ? getLLFILibProfilingSiteFunc(M) :
+                                             getLLFILibProfilingFunc(M);
 
     // prepare for the calling argument and call the profiling function
-    std::vector<Value*> profilingarg(1);
+    std::vector<Value*> profilingarg(profilesites ? 2 : 1);
     const IntegerType* itype = IntegerType::get(context, 32);
 
     //LLVM 3.3 Upgrading
     IntegerType* itype_non_const = const_cast<IntegerType*>(itype);
     Value* opcode = ConstantInt::get(itype_non_const, fi_inst->getOpcode());
     profilingarg[0] = opcode; 
+    if (profilesites)
+      profilingarg[1] = ConstantInt::get(Type::getInt64Ty(context),
+                                         getLLFIIndexofInst(fi_inst));
     ArrayRef<Value*> profilingarg_array_ref(profilingarg);
 
     CallInst::Create(profilingfunc, profilingarg_array_ref,
                      "", insertptr);
   }
 
+  if (blockcyclecounting && !profilesites)
+    addBlockProfilingFuncCall(M, hooks);
   addEndProfilingFuncCall(M);
   return true;
 }
 
+// Count the cycles of each basic block segment with a single call, instead of
+// one call per instruction
+void ProfilingPass::addBlockProfilingFuncCall(Module &M,
+    std::map<Instruction*, std::pair<long long, long long> > &hooks) {
+  std::set<Instruction*> hookcalls;
+  std::vector<CycleSegment> segments;
+  getCycleSegments(M, hooks, hookcalls, segments);
+
+  Constant *blockprofilingfunc = getLLFILibBlockProfilingFunc(M);
+  Type *i64type = Type::getInt64Ty(M.getContext());
+  for (std::vector<CycleSegment>::iterator seg_it = segments.begin();
+       seg_it != segments.end(); ++seg_it) {
+    std::vector<Value*> args(1);
+    args[0] = ConstantInt::get(i64type, seg_it->delta);
+    ArrayRef<Value*> args_array_ref(args);
+    CallInst::Create(blockprofilingfunc, args_array_ref, "", seg_it->first);
+  }
+}
+
 
 void ProfilingPass::addEndProfilingFuncCall(Module &M) {
   Function* mainfunc = M.getFunction("main");
@@ -106,6 +152,33 @@ Constant *ProfilingPass::getLLFILibProfilingFunc(Module &M) {
   return profilingfunc;
 }
 
+Constant *ProfilingPass::getLLFILibProfilingSiteFunc(Module &M) {
+  LLVMContext& context = M.getContext();
+  std::vector<Type*> paramtypes(2);
+  paramtypes[0] = Type::getInt32Ty(context);
+  paramtypes[1] = Type::getInt64Ty(context);
+  ArrayRef<Type*> paramtypes_array_ref(paramtypes);
+
+  FunctionType* profilingsitefunctype = FunctionType::get(
+      Type::getVoidTy(context), paramtypes_array_ref, false);
+  Constant *profilingsitefunc = M.getOrInsertFunction(
+      "doProfilingSite", profilingsitefunctype);
+  return profilingsitefunc;
+}
+
+Constant *ProfilingPass::getLLFILibBlockProfilingFunc(Module &M) {
+  LLVMContext& context = M.getContext();
+  std::vector<Type*> paramtypes(1);
+  paramtypes[0] = Type::getInt64Ty(context);
+  ArrayRef<Type*> paramtypes_array_ref(paramtypes);
+
+  FunctionType* blockprofilingfunctype = FunctionType::get(
+      Type::getVoidTy(context), paramtypes_array_ref, false);
+  Constant *blockprofilingfunc = M.getOrInsertFunction(
+      "doBlockProfiling", blockprofilingfunctype);
+  return blockprofilingfunc;
+}
+
 Constant *ProfilingPass::getLLFILibEndProfilingFunc(Module &M) {
   LLVMContext& context = M.getContext();
   FunctionType* endprofilingfunctype = FunctionType::get(
@@ -7,6 +7,7 @@
 #include "llvm/IR/Module.h"
 
 #include <iostream>
+#include <map>
 
 using namespace llvm;
 namespace llfi {
@@ -18,9 +19,13 @@ class ProfilingPass: public ModulePass {
 
  private: 
   void addEndProfilingFuncCall(Module &M);
+  void addBlockProfilingFuncCall(Module &M,
+      std::map<Instruction*, std::pair<long long, long long> > &hooks);
  private:
   Constant *getLLFILibProfilingFunc(Module &M);
   Constant *getLLFILibEndProfilingFunc(Module &M);
+  Constant *getLLFILibBlockProfilingFunc(Module &M);
+  Constant *getLLFILibProfilingSiteFunc(Module &M);
 };
 
 char ProfilingPass::ID=0;
@@ -133,6 +133,59 @@ void genFullNameOpcodeMap(
 #include "llvm/IR/Instruction.def"
 }
 
+long long getOpcodeExecCycle(unsigned opcode) {
+  switch (opcode) {
+#define HANDLE_INST(N, OPC, CLASS, CYCLE) \
+    case N: return CYCLE;
+#include "../runtime_lib/Instruction.def"
+    default:
+      errs() << "ERROR: opcode " << opcode << " does not exist, need to "
+          << "update instructions.def of the runtime library\n";
+      exit(4);
+  }
+}
+
+void getCycleSegments(Module &M,
+    std::map<Instruction*, std::pair<long long, long long> > &hooks,
+    std::set<Instruction*> &hookcalls, std::vector<CycleSegment> &segments) {
+  for (Module::iterator m_it = M.begin(); m_it != M.end(); ++m_it) {
+    if (m_it->isDeclaration())
+      continue;
+    for (Function::iterator bb_it = m_it->begin(); bb_it != m_it->end();
+         ++bb_it) {
+      CycleSegment seg = {NULL, 0, 0};
+      long long maxcycle = 0;
+      for (BasicBlock::iterator it = bb_it->begin(); it != bb_it->end(); ++it) {
+        Instruction *inst = it;
+        std::map<Instruction*, std::pair<long long, long long> >::iterator
+            hook_it = hooks.find(inst);
+        if (hook_it != hooks.end()) {
+          if (seg.first == NULL)
+            seg.first = inst;
+          seg.delta += hook_it->second.first;
+          if (hook_it->second.second > maxcycle)
+            maxcycle = hook_it->second.second;
+        }
+
+        // the callee may run hooks of its own, or never return
+        bool endsegment = isa<InvokeInst>(inst) || (isa<CallInst>(inst) &&
+            !isa<IntrinsicInst>(inst) && hookcalls.count(inst) == 0);
+        if (endsegment && seg.first != NULL) {
+          seg.window = seg.delta + maxcycle;
+          segments.push_back(seg);
+          seg.first = NULL;
+          seg.delta = 0;
+          maxcycle = 0;
+        }
+      }
+      if (seg.first != NULL) {
+        seg.window = seg.delta + maxcycle;
+        segments.push_back(seg);
+      }
+    }
+  }
+}
+
 //Returns true if the function is indexed by llfi 
 //(and therefore we should perform trace/fault injects on it)
 bool isLLFIIndexedInst(Instruction *inst) {
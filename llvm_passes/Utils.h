@@ -7,6 +7,7 @@
 #include "llvm/IR/Value.h"
 #include "llvm/IR/BasicBlock.h"
 #include "llvm/IR/Instructions.h"
+#include "llvm/IR/IntrinsicInst.h"
 #include "llvm/IR/Metadata.h"
 
 #include "llvm/Support/Debug.h"
@@ -20,6 +21,7 @@
 #include <set>
 #include <string>
 #include <sstream>
+#include <vector>
 
 using namespace llvm;
 namespace llfi {
@@ -46,6 +48,26 @@ void genFullNameOpcodeMap(std::map<std::string, unsigned> &opcodenamemap);
 
 //Check metadata to see if instruction was generated/inserted by LLFI
 bool isLLFIIndexedInst(Instruction *inst);
+
+// execution cycles of the opcode, as set in Instruction.def of the runtime
+// library
+long long getOpcodeExecCycle(unsigned opcode);
+
+// A cycle segment is a run of instructions of a basic block that no call
+// interrupts, so all the hooks of a segment execute as soon as its first hook
+// does. Cycles can then be counted once per segment instead of once per hook.
+struct CycleSegment {
+  Instruction *first; // position of the first hook of the segment
+  long long delta; // cycles counted by all the hooks of the segment
+  long long window; // delta plus the largest cycle of a hook of the segment
+};
+
+// hooks maps each hook position (the instruction a hook is inserted before,
+// or the hook call itself) to the cycles it counts and the cycles of the
+// instruction it instruments. Calls in hookcalls do not end a segment.
+void getCycleSegments(Module &M,
+    std::map<Instruction*, std::pair<long long, long long> > &hooks,
+    std::set<Instruction*> &hookcalls, std::vector<CycleSegment> &segments);
 }
 
 #endif
@@ -2,8 +2,14 @@
 #include <stdlib.h>
 #include <string.h>
 #include <stdbool.h>
+#include <limits.h>
 #include <time.h>
+#include <math.h>
 #include <assert.h>
+#include <stdint.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
 
 #include "Utils.h"
 #define OPTION_LENGTH 512
@@ -19,16 +25,36 @@ static FILE *injectedfaultsFile;
 static int opcodecyclearray[OPCODE_CYCLE_ARRAY_LEN];
 static bool is_fault_injected_in_curr_dyn_inst = false;
 
+/* with cycleCounting: block, true while running a basic block (segment) whose
+ * cycles were counted on entry as it cannot contain the target cycle */
+static bool in_skipped_cycle_block = false;
+
+/* dynamic instances of fi_index executed so far */
+static long long fi_index_count = 0;
+
+/* curr_cycle published to the harness through the file named by the
+ * LLFI_HEARTBEAT_FILE environment variable, mapped in memory, so that it can
+ * tell a run that stopped progressing from a slow one */
+#define HEARTBEAT_MAGIC "LLFIHB01"
+struct heartbeat {
+  char magic[8];
+  volatile uint64_t cycle;
+};
+static struct heartbeat *heartbeat = NULL;
+
 static struct {
   char fi_type[OPTION_LENGTH];
   bool fi_accordingto_cycle;
   // if both fi_cycle and fi_index are specified, use fi_cycle
   long long fi_cycle;
   long fi_index;
+  // with fi_index, only inject into this dynamic instance (counting from 0)
+  // of the instruction, instead of every instance
+  long long fi_index_instance;
   /* (1/fi_rate) chance of injecting per cycle.
-   * TODO: Currently overwrites fi_cycle to keep other functionality untouched.
-   * This should probably be changed in the future. For now, the user must
-   * either specify fi_rate or fi_cycle.
+   * fi_cycle then holds the cycle of the next fault, drawn ahead of time from
+   * a geometric distribution, so the user must either specify fi_rate or
+   * fi_cycle.
    */
   long long fi_rate;
 
@@ -37,7 +63,11 @@ static struct {
   // a previous fault injection experiment
   int fi_reg_index;
   int fi_bit;
-} config = {"bitflip", false, -1, -1, -1, -1, -1};
+
+  // seed of the random choices of the runtime, from /dev/urandom if not
+  // specified
+  long long fi_seed;
+} config = {"bitflip", false, -1, -1, -1, -1, -1, -1, -1};
 // -1 to tell the value is not specified in the config file
 
 // declaration of the real implementation of the fault injection function
@@ -49,9 +79,13 @@ void injectFaultImpl(const char *fi_type, long llfi_index, unsigned size,
  */
 void _initRandomSeed() {
   unsigned int seed;
-	FILE* urandom = fopen("/dev/urandom", "r");
-	fread(&seed, sizeof(int), 1, urandom);
-	fclose(urandom);
+  if (config.fi_seed >= 0) {
+    seed = (unsigned int)config.fi_seed;
+  } else {
+	  FILE* urandom = fopen("/dev/urandom", "r");
+	  fread(&seed, sizeof(int), 1, urandom);
+	  fclose(urandom);
+  }
 	srand(seed);
 }
 
@@ -71,6 +105,48 @@ unsigned long long fast_rand(long long max) {
   return fast_seed % max;
 }
 
+/* Cycle of the next fault at or after cycle from, when injecting with
+ * probability 1/fi_rate at every cycle. The number of cycles without a fault
+ * is geometrically distributed, so a single draw replaces one Bernoulli trial
+ * per cycle. */
+long long _nextFaultCycle(long long from) {
+  if (config.fi_rate <= 1)
+    return from;
+
+  /* uniform in (0, 1], from the high 53 bits of the LCG */
+  fast_rand(1);
+  double u = ((fast_seed >> 11) + 1.0) / 9007199254740992.0;
+  double gap = floor(log(u) / log1p(-1.0 / config.fi_rate));
+  if (gap >= (double)(LLONG_MAX - from))
+    return LLONG_MAX;
+  return from + (long long)gap;
+}
+
+void _initHeartbeat() {
+  const char *filename = getenv("LLFI_HEARTBEAT_FILE");
+  if (filename == NULL || filename[0] == '\0')
+    return;
+  /* the harness creates the file, a missing one disables the heartbeat */
+  int fd = open(filename, O_RDWR);
+  if (fd < 0)
+    return;
+  if (ftruncate(fd, sizeof(struct heartbeat)) == 0) {
+    void *addr = mmap(NULL, sizeof(struct heartbeat), PROT_READ | PROT_WRITE,
+                      MAP_SHARED, fd, 0);
+    if (addr != MAP_FAILED) {
+      heartbeat = (struct heartbeat *)addr;
+      heartbeat->cycle = 0;
+      memcpy(heartbeat->magic, HEARTBEAT_MAGIC, sizeof(heartbeat->magic));
+    }
+  }
+  close(fd);
+}
+
+static inline void _publishCycle() {
+  if (heartbeat != NULL)
+    heartbeat->cycle = curr_cycle;
+}
+
 void _parseLLFIConfigFile() {
   char ficonfigfilename[80];
   strncpy(ficonfigfilename, "llfi.config.fi.txt", 80);
@@ -107,8 +183,6 @@ void _parseLLFIConfigFile() {
     } else if (strcmp(option, "fi_rate") == 0) {
       config.fi_rate = atoll(value);
       assert(config.fi_rate >= 0 && "invalid fi_rate in config file");
-      assert(config.fi_rate <= RAND_MAX
-        && "fi_rate larger than RAND_MAX not supported yet");
       config.fi_cycle = -1;
       config.fi_accordingto_cycle = true;
       /* disable fault injection */
@@ -118,12 +192,19 @@ void _parseLLFIConfigFile() {
     } else if (strcmp(option, "fi_index") == 0) {
       config.fi_index = atol(value);
       assert(config.fi_index >= 0 && "invalid fi_index in config file");
+    } else if (strcmp(option, "fi_index_instance") == 0) {
+      config.fi_index_instance = atoll(value);
+      assert(config.fi_index_instance >= 0 &&
+             "invalid fi_index_instance in config file");
     } else if (strcmp(option, "fi_reg_index") == 0) {
       config.fi_reg_index = atoi(value);
       assert(config.fi_reg_index >= 0 && "invalid fi_reg_index in config file");
     } else if (strcmp(option, "fi_bit") == 0) {
       config.fi_bit = atoi(value);
       assert(config.fi_bit >= 0 && "invalid fi_bit in config file");
+    } else if (strcmp(option, "fi_seed") == 0) {
+      config.fi_seed = atoll(value);
+      assert(config.fi_seed >= 0 && "invalid fi_seed in config file");
     } else {
       fprintf(stderr,
               "ERROR: Unknown option %s for LLFI runtime fault injection\n",
@@ -148,8 +229,9 @@ void _parseLLFIConfigFile() {
  * external libraries
  */
 void initInjections() {
-  _initRandomSeed();
   _parseLLFIConfigFile();
+  _initRandomSeed();
+  _initHeartbeat();
   getOpcodeExecCycleArray(OPCODE_CYCLE_ARRAY_LEN, opcodecyclearray);
 
   char injectedfaultsfilename[80];
@@ -162,24 +244,36 @@ void initInjections() {
   }
 
   fast_seed = rand();
+  if (config.fi_rate > 0)
+    config.fi_cycle = _nextFaultCycle(0);
   start_tracing_flag = TRACING_FI_RUN_INIT; //Tell instTraceLib that we are going to inject faults
 }
 
+/* called at the start of each basic block segment, with the cycles of its
+ * instructions and the cycle window in which they may inject */
+void enterCycleBlock(long long cycles, long long window) {
+  /* fi_index needs every instruction to be checked */
+  if (config.fi_accordingto_cycle &&
+      (config.fi_cycle < curr_cycle ||
+       config.fi_cycle >= curr_cycle + window)) {
+    in_skipped_cycle_block = true;
+    curr_cycle += cycles;
+    _publishCycle();
+  } else {
+    in_skipped_cycle_block = false;
+  }
+}
+
 bool preFunc(long llfi_index, unsigned opcode, unsigned my_reg_index,
              unsigned total_reg_target_num) {
+  if (in_skipped_cycle_block)
+    return false;
+
   assert(opcodecyclearray[opcode] >= 0 &&
           "opcode does not exist, need to update instructions.def");
   if (my_reg_index == 0)
     is_fault_injected_in_curr_dyn_inst = false;
 
-  if (config.fi_rate > -1) {
-    if (fast_rand(config.fi_rate) == 0) {
-      config.fi_cycle = curr_cycle;
-      printf("Injecting fault at cycle %lld\n", curr_cycle);
-      fflush(stdout);
-    }
-  }
-
   bool inst_selected = false;
   bool reg_selected = false;
   if (config.fi_accordingto_cycle) {
@@ -187,8 +281,11 @@ bool preFunc(long llfi_index, unsigned opcode, unsigned my_reg_index,
         config.fi_cycle < curr_cycle + opcodecyclearray[opcode])
       inst_selected = true;
   } else {
-    // inject into every runtime instance of the specified instruction
-    if (llfi_index == config.fi_index)
+    // inject into every runtime instance of the specified instruction, or only
+    // into the specified one
+    if (llfi_index == config.fi_index &&
+        (config.fi_index_instance < 0 ||
+         fi_index_count == config.fi_index_instance))
       inst_selected = true;
   }
 
@@ -204,11 +301,22 @@ bool preFunc(long llfi_index, unsigned opcode, unsigned my_reg_index,
     if (reg_selected) {
       //debug(("selected reg index %u\n", my_reg_index));
       is_fault_injected_in_curr_dyn_inst = true;
+      if (config.fi_rate > 0) {
+        printf("Injecting fault at cycle %lld\n", curr_cycle);
+        fflush(stdout);
+      }
     }
   }
 
-  if (my_reg_index == total_reg_target_num - 1)
+  if (my_reg_index == total_reg_target_num - 1) {
     curr_cycle += opcodecyclearray[opcode];
+    _publishCycle();
+    if (llfi_index == config.fi_index)
+      fi_index_count++;
+    /* at most one fault per dynamic instruction, draw the next one after it */
+    if (config.fi_rate > 0 && config.fi_cycle < curr_cycle)
+      config.fi_cycle = _nextFaultCycle(curr_cycle);
+  }
 
   return reg_selected;
 }
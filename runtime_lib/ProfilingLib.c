@@ -6,6 +6,14 @@
 #include "Utils.h"
 
 static long long opcodecount[OPCODE_CYCLE_ARRAY_LEN] = {0};
+// cycles counted per basic block, when compiled with cycleCounting: block
+static long long blockcycles = 0;
+
+// dynamic execution count and opcode of each llfi_index, when compiled with
+// profileSites
+static unsigned long long *sitecount = NULL;
+static unsigned char *siteopcode = NULL;
+static long sitelen = 0;
 
 void doProfiling(int opcode) {
   assert(opcodecount[opcode] >= 0 && 
@@ -13,6 +21,59 @@ void doProfiling(int opcode) {
   opcodecount[opcode]++;
 }
 
+void doProfilingSite(int opcode, long llfi_index) {
+  assert(llfi_index >= 0 && "invalid llfi index");
+  if (llfi_index >= sitelen) {
+    long newlen = sitelen > 0 ? sitelen : 1024;
+    while (newlen <= llfi_index)
+      newlen *= 2;
+    sitecount = realloc(sitecount, newlen * sizeof(*sitecount));
+    siteopcode = realloc(siteopcode, newlen * sizeof(*siteopcode));
+    if (sitecount == NULL || siteopcode == NULL) {
+      fprintf(stderr, "ERROR: Unable to allocate the site profile\n");
+      exit(1);
+    }
+    memset(sitecount + sitelen, 0, (newlen - sitelen) * sizeof(*sitecount));
+    memset(siteopcode + sitelen, 0, (newlen - sitelen) * sizeof(*siteopcode));
+    sitelen = newlen;
+  }
+  sitecount[llfi_index]++;
+  siteopcode[llfi_index] = opcode;
+  doProfiling(opcode);
+}
+
+/**
+ * The site profile is a binary file made of the magic "LLFISIT1", the number
+ * of sites n as an unsigned 64 bit integer, the n unsigned 64 bit execution
+ * counts indexed by llfi_index and the n opcodes as bytes (0 for the indices
+ * never executed). Integers are stored in the byte order of the machine.
+ */
+static void writeSiteProfile() {
+  char sitefilename[80] = "llfi.stat.prof.sites.bin";
+  FILE *siteFile = fopen(sitefilename, "wb");
+  if (siteFile == NULL) {
+    fprintf(stderr, "ERROR: Unable to open site profile file %s\n",
+            sitefilename);
+    exit(1);
+  }
+
+  // trim the indices past the last executed one
+  unsigned long long n = sitelen;
+  while (n > 0 && sitecount[n - 1] == 0)
+    --n;
+  fwrite("LLFISIT1", 1, 8, siteFile);
+  fwrite(&n, sizeof(n), 1, siteFile);
+  fwrite(sitecount, sizeof(*sitecount), n, siteFile);
+  fwrite(siteopcode, sizeof(*siteopcode), n, siteFile);
+  fclose(siteFile);
+}
+
+void doBlockProfiling(long long cycles) {
+  blockcycles += cycles;
+  assert(blockcycles >= 0 &&
+         "dynamic instruction number too large to be handled by llfi");
+}
+
 void endProfiling() {
   FILE *profileFile;
   char profilefilename[80] = "llfi.stat.prof.txt";
@@ -27,7 +88,7 @@ void endProfiling() {
   getOpcodeExecCycleArray(OPCODE_CYCLE_ARRAY_LEN, opcode_cycle_arr);
 
   unsigned i = 0;
-  long long total_cycle = 0;
+  long long total_cycle = blockcycles;
   for (i = 0; i < 100; ++i) {
     assert(total_cycle >= 0 && 
             "total dynamic instruction cycle too large to be handled by llfi");
@@ -43,4 +104,7 @@ void endProfiling() {
           "# cycle considered the execution cycle of each instruction type\n");
   fprintf(profileFile, "total_cycle=%lld\n", total_cycle);
 	fclose(profileFile); 
+
+  if (sitecount != NULL)
+    writeSiteProfile();
 }
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the tests import the llfi commands as llfi.py does, and the synthetic inputs
+# of the benchmarks
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'benchmarks'))
@@ -0,0 +1,116 @@
+import os
+import types
+
+import pytest
+
+import synth
+from bin import inject
+from tools import stats
+from tools import telemetry
+
+# llfi_index, opcode, widths, uses: the icmp is dead, and index 4 is executed
+# but was not instrumented
+SITES = [(0, "add", [4], 1), (1, "icmp", [1], 0), (2, "call", [2, 3], 2),
+         (3, "mul", [8], 1)]
+COUNTS = [2, 3, 1, 0, 5]
+# injections of the space, in order: 8 into the add, the icmp pruned, and 5
+# into the call
+NINJECTIONS = 14
+
+DSTREG = {"compileOption": {"regSelMethod": "regloc", "regloc": "dstreg"}}
+
+class fakeCampaign:
+  #a campaign recording the runs it is given, each exiting successfully,
+  #interrupted after stopAfter runs
+  def __init__(self, llfi_dir, doc, stopAfter=None):
+    self.llfi_dir = llfi_dir
+    self.fi_exe = os.path.join(llfi_dir, "standin")
+    self.logdir = os.path.join(llfi_dir, "log_output")
+    self.doc = doc
+    self.cache = None
+    self.timeout = 1.0
+    self.stopAfter = stopAfter
+    self.runs = []
+
+  def runAll(self, specs, record):
+    for spec in specs:
+      if len(self.runs) == self.stopAfter:
+        raise KeyboardInterrupt
+      self.runs.append(spec)
+      record(spec, {'ret': '0', 'code': 0, 'time': 0.0})
+
+@pytest.fixture
+def llfi_dir(tmp_path):
+  synth.makeWorkspace(str(tmp_path), {"ok": 100})
+  llfi_dir = os.path.join(str(tmp_path), "llfi")
+  os.mkdir(os.path.join(llfi_dir, "log_output"))
+  synth.writeSiteCatalog(os.path.join(llfi_dir, "llfi.stat.catalog.txt"),
+                         SITES)
+  synth.writeSiteProfile(os.path.join(llfi_dir, "llfi.stat.prof.sites.bin"),
+                         COUNTS)
+  return llfi_dir
+
+def runExhaustive(campaign, shard=(0, 1)):
+  options = types.SimpleNamespace(SHARD=shard)
+  rOpt = [{"run": {"fi_type": "bitflip"}}]
+  inject.runExhaustive(campaign, options, rOpt,
+                       telemetry.campaignTelemetry(None, None, 1.0))
+
+def test_space():
+  executed = [(0, 2, 0), (2, 1, 0)]
+  widths = {0: [2], 2: [1, 2]}
+  assert list(inject.exhaustiveSpace(executed, widths, set())) == [
+    ("live", 0, 0, 0, 0, 1), ("live", 0, 0, 0, 1, 1),
+    ("live", 0, 1, 0, 0, 1), ("live", 0, 1, 0, 1, 1),
+    ("live", 2, 0, 0, 0, 1), ("live", 2, 0, 1, 0, 1),
+    ("live", 2, 0, 1, 1, 1)]
+
+def test_space_pruned():
+  executed = [(0, 2, 0), (1, 3, 0)]
+  widths = {0: [1], 1: [4, 8]}
+  space = list(inject.exhaustiveSpace(executed, widths, set([1])))
+  assert space == [("live", 0, 0, 0, 0, 1), ("live", 0, 1, 0, 0, 1),
+                   ("pruned", 1, 0, 0, 0, 36)]
+
+def test_run(llfi_dir):
+  campaign = fakeCampaign(llfi_dir, DSTREG)
+  runExhaustive(campaign)
+  faults = [spec.info[1:] for spec in campaign.runs]
+  assert len(faults) == NINJECTIONS
+  # instructions not in the catalog and not executed are left out
+  assert set(f[1] for f in faults) == set([0, 1, 2])
+  assert [f for f in faults if f[1] == 1] == [("pruned", 1, 0, 0, 0, 3)]
+  assert [spec.run_id for spec in campaign.runs] == \
+         ["0-" + str(k) for k in range(NINJECTIONS)]
+  # the weights of the journal, read by llfi stats, add up to the whole space
+  plan = stats.readPlans(llfi_dir)[0]
+  assert [run for run, _, _ in plan] == list(range(NINJECTIONS))
+  assert sum(weight for _, _, weight in plan) == pytest.approx(1.0)
+
+def test_run_without_pruning(llfi_dir):
+  # only the destination registers of dead values can be pruned
+  campaign = fakeCampaign(llfi_dir, {})
+  runExhaustive(campaign)
+  assert len(campaign.runs) == NINJECTIONS - 1 + 3
+
+def test_shards(llfi_dir):
+  ran = []
+  for shard in range(3):
+    campaign = fakeCampaign(llfi_dir, DSTREG)
+    runExhaustive(campaign, (shard, 3))
+    ks = [spec.info[0] for spec in campaign.runs]
+    assert ks == list(range(shard, NINJECTIONS, 3))
+    ran.extend(ks)
+  assert sorted(ran) == list(range(NINJECTIONS))
+
+def test_resume(llfi_dir):
+  campaign = fakeCampaign(llfi_dir, DSTREG, stopAfter=5)
+  with pytest.raises(KeyboardInterrupt):
+    runExhaustive(campaign)
+  assert inject.readJournal(0, campaign.logdir) == set(range(5))
+
+  resumed = fakeCampaign(llfi_dir, DSTREG)
+  runExhaustive(resumed)
+  assert [spec.info[0] for spec in resumed.runs] == \
+         list(range(5, NINJECTIONS))
+  assert inject.readJournal(0, campaign.logdir) == set(range(NINJECTIONS))
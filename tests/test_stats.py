@@ -0,0 +1,42 @@
+import os
+import random
+
+import synth
+from tools import stats
+
+def writeShard(llfi_dir, group, runs, failed=()):
+  #the result files of the runs of one shard of a campaign
+  synth.writeResults(llfi_dir, 0, random.Random(0))
+  for run in runs:
+    run_id = "{}-{}".format(group, run)
+    code = 1 if run in failed else 0
+    with open(os.path.join(llfi_dir, "llfi_stat_output",
+                           "llfi.stat.fi.injectedfaults." + run_id + ".txt"), "w") as f:
+      f.write("FI stat: fi_type=bitflip, fi_cycle=1\n")
+    with open(os.path.join(llfi_dir, "log_output",
+                           "logfile-run-" + run_id + ".txt"), "w") as f:
+      f.write("code={}, time=0.010\n".format(code))
+    if code:
+      with open(os.path.join(llfi_dir, "error_output",
+                             "errorfile-run-" + run_id), "w") as f:
+        f.write("Program crashed, terminated by itself, return code 1\n")
+
+def test_run_sizes(tmp_path):
+  synth.writeResults(str(tmp_path), 12, random.Random(1), groups=3)
+  assert stats.getRunSizes(str(tmp_path)) == [4, 4, 4]
+
+def test_run_sizes_of_a_shard(tmp_path):
+  # shard 1/3 of 10 runs: the run indices have gaps
+  writeShard(str(tmp_path), 0, [1, 4, 7], failed=[4])
+  nruns = stats.getRunSizes(str(tmp_path))
+  assert nruns == [3]
+  codes = stats.genCodeSummary(str(tmp_path), nruns)
+  assert dict(codes[0]) == {'0': 2, '1': 1}
+
+def test_run_sizes_without_injected_fault(tmp_path):
+  # a run whose fault was never reached has a log but no injectedfaults stat
+  writeShard(str(tmp_path), 0, [0, 1])
+  with open(os.path.join(str(tmp_path), "log_output",
+                         "logfile-run-0-2.txt"), "w") as f:
+    f.write("code=0, time=0.010\n")
+  assert stats.getRunSizes(str(tmp_path)) == [3]
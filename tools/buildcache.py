@@ -0,0 +1,134 @@
+#! /usr/bin/env python3
+
+"""
+buildcache is a content-addressed store for the outputs of LLFI build steps
+(IR files, objects and executables), shared by llfi-compile and
+llfi-instrument.
+
+A cache entry is keyed on everything that determines the outputs of a step:
+the contents of its input files, its command line and the identity of the
+tools it runs. Entries are written atomically, so several LLFI processes can
+share a cache directory.
+"""
+
+import sys, os
+import hashlib
+import shutil
+import subprocess
+import tempfile
+import threading
+
+def defaultCacheDir():
+  if os.environ.get('LLFI_CACHE_DIR'):
+    return os.environ['LLFI_CACHE_DIR']
+  base = os.environ.get('XDG_CACHE_HOME',
+                        os.path.join(os.path.expanduser('~'), '.cache'))
+  return os.path.join(base, 'llfi')
+
+################################################################################
+# file hashes, memoized on (path, size, mtime) as the same inputs (e.g. the
+# llfi passes library) are hashed by many steps
+_file_hashes = {}
+_tool_versions = {}
+_lock = threading.Lock()
+
+def hashFile(path):
+  st = os.stat(path)
+  memokey = (os.path.realpath(path), st.st_size, st.st_mtime_ns)
+  with _lock:
+    if memokey in _file_hashes:
+      return _file_hashes[memokey]
+
+  h = hashlib.sha256()
+  with open(path, 'rb') as f:
+    while True:
+      chunk = f.read(1 << 20)
+      if not chunk:
+        break
+      h.update(chunk)
+  digest = h.hexdigest()
+  with _lock:
+    _file_hashes[memokey] = digest
+  return digest
+
+def toolVersion(tool):
+  '''
+    Return a string identifying the version of tool. Falls back on the hash of
+    the tool binary when it does not understand --version.
+  '''
+  with _lock:
+    if tool in _tool_versions:
+      return _tool_versions[tool]
+  try:
+    p = subprocess.Popen([tool, '--version'], stdout=subprocess.PIPE,
+                         stderr=subprocess.STDOUT)
+    version = p.communicate()[0].decode('utf-8', 'replace')
+    if p.returncode != 0:
+      raise OSError(tool + " --version failed")
+  except OSError:
+    try:
+      version = 'sha256:' + hashFile(tool)
+    except OSError:
+      version = 'unknown:' + tool
+  with _lock:
+    _tool_versions[tool] = version
+  return version
+
+def cacheKey(*parts):
+  h = hashlib.sha256()
+  for part in parts:
+    h.update(repr(part).encode('utf-8'))
+    h.update(b'\0')
+  return h.hexdigest()
+
+################################################################################
+class buildCache:
+  def __init__(self, cachedir, namespace):
+    self.root = os.path.join(cachedir, namespace)
+    self.hits = 0
+    self.misses = 0
+
+  def key(self, *parts):
+    return cacheKey(*parts)
+
+  def _entrydir(self, key):
+    return os.path.join(self.root, key[:2], key)
+
+  def restore(self, key, outputs):
+    '''
+      Copy the cached outputs of key to the paths in outputs. Returns False
+      (and copies nothing) if there is no complete entry for key.
+    '''
+    entry = self._entrydir(key)
+    cached = [os.path.join(entry, str(i)) for i in range(len(outputs))]
+    if not all(os.path.isfile(f) for f in cached):
+      self.misses += 1
+      return False
+    for src, dst in zip(cached, outputs):
+      shutil.copy2(src, dst)
+    self.hits += 1
+    return True
+
+  def store(self, key, outputs):
+    '''
+      Add the files in outputs to the cache under key. Missing outputs make the
+      entry incomplete, so nothing is stored in that case.
+    '''
+    if not all(os.path.isfile(f) for f in outputs):
+      return False
+    entry = self._entrydir(key)
+    if os.path.isdir(entry):
+      return True
+    parent = os.path.dirname(entry)
+    os.makedirs(parent, exist_ok=True)
+    tmpdir = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+      for i, src in enumerate(outputs):
+        shutil.copy2(src, os.path.join(tmpdir, str(i)))
+      os.rename(tmpdir, entry)
+    except OSError:
+      # another process stored the same entry first, or the cache is not
+      # writable; either way the build itself is not affected
+      shutil.rmtree(tmpdir, ignore_errors=True)
+      return False
+    return True
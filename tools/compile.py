@@ -8,8 +8,11 @@ import sys, os, subprocess, tempfile
 script_path = os.path.realpath(os.path.dirname(__file__))
 sys.path.append(os.path.join(script_path, '../config'))
 import llvm_paths
+sys.path.append(script_path)
+import buildcache
 
 import argparse
+import concurrent.futures
 
 llvmlink = os.path.join(llvm_paths.LLVM_DST_ROOT, "bin/llvm-link")
 llvmgcc = os.path.join(llvm_paths.LLVM_GXX_BIN_DIR, "clang")
@@ -30,7 +33,9 @@ def usage(msg = None):
 
 def verbosePrint(msg, verbose):
   if verbose:
-    print(msg)
+    # single write, so lines from concurrent compilations do not interleave
+    sys.stdout.write(msg + "\n")
+    sys.stdout.flush()
 
 def help():
   parser = initParser()
@@ -50,6 +55,16 @@ def initParser():
                       help='include directory for header files')
   parser.add_argument('--readable', action='store_true', dest='READABLE',
                       help='generate human-readable IR file')
+  parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                      dest='JOBS',
+                      help='number of source files to compile at the same \
+                      time (default: number of CPUs)')
+  parser.add_argument('--cache', action='store_true', dest='USE_CACHE',
+                      help='reuse the IR of source files that did not change \
+                      from a content-addressed build cache')
+  parser.add_argument('--cache-dir', default=buildcache.defaultCacheDir(),
+                      dest='CACHE_DIR',
+                      help='location of the build cache (default: %(default)s)')
   parser.add_argument('-v', '--verbose', dest='VERBOSE', action='store_true',
                       help='show verbose information')
   return parser
@@ -63,7 +78,12 @@ def parseArgs(parser, args):
     options.INCLUDE_DIRS[index] = os.path.join(basedir, opt)
   for index, opt in enumerate(options.SOURCES):
     options.SOURCES[index] = os.path.join(basedir, opt)
+  if options.JOBS is not None and options.JOBS < 1:
+    usage("The number of jobs must be at least 1")
 
+  options.cache = None
+  if options.USE_CACHE:
+    options.cache = buildcache.buildCache(options.CACHE_DIR, 'compile')
   return options
 
 ################################################################################
@@ -74,6 +94,45 @@ def execute(execlist, options):
   return p.returncode
 
 
+def sourceDependencies(compiler, inputfile, options):
+  '''
+    Return the list of files (the source and every header it includes) whose
+    contents determine the IR of inputfile, or None if it cannot be computed
+  '''
+  execlist = [compiler, '-M', '-w', inputfile]
+  for header_dir in options.INCLUDE_DIRS:
+    execlist.extend(['-I', header_dir])
+  try:
+    p = subprocess.Popen(execlist, stdout=subprocess.PIPE,
+                         stderr=subprocess.DEVNULL)
+  except OSError:
+    return None
+  rule = p.communicate()[0].decode('utf-8', 'replace')
+  if p.returncode != 0:
+    return None
+  # make rule "target.o: dep1 dep2 \\\n dep3 ..."
+  rule = rule.replace('\\\n', ' ')
+  deps = rule[rule.find(':') + 1:].split()
+  return [inputfile] + sorted(set(deps) - set([inputfile]))
+
+def compileKey(execlist, outputfile, inputfile, options):
+  deps = sourceDependencies(execlist[0], inputfile, options)
+  if deps is None:
+    return None
+  args = []
+  for arg in execlist[1:]:
+    if arg == outputfile:
+      args.append('<output>')
+    elif arg == inputfile:
+      args.append('<input>')
+    else:
+      args.append(arg)
+  # the source is keyed on its contents and the contents of its headers;
+  # header paths are kept as they depend on the include-dir list
+  hashes = [buildcache.hashFile(inputfile)]
+  hashes += [(d, buildcache.hashFile(d)) for d in deps[1:]]
+  return options.cache.key(buildcache.toolVersion(execlist[0]), args, hashes)
+
 def compileToIR(outputfile, inputfile, options):
   if inputfile.endswith(".c"):
     execlist = [llvmgcc]
@@ -89,7 +148,19 @@ def compileToIR(outputfile, inputfile, options):
     execlist.append('-S')
   else:
     execlist.append('-c')
-  return execute(execlist, options)
+
+  key = None
+  if options.cache is not None:
+    key = compileKey(execlist, outputfile, inputfile, options)
+    if key is not None and options.cache.restore(key, [outputfile]):
+      verbosePrint("Restored IR of " + inputfile + " from cache",
+                   options.VERBOSE)
+      return 0
+
+  retcode = execute(execlist, options)
+  if retcode == 0 and key is not None:
+    options.cache.store(key, [outputfile])
+  return retcode
 
 
 def linkFiles(outputfile, inputlist, options):
@@ -115,10 +186,20 @@ def compileProg(options):
     tmpfiles = []
     for src in srcfiles:
       file_handler, tmpfile = tempfile.mkstemp()
+      os.close(file_handler)
       tmpfiles.append(tmpfile)
-      retcode = compileToIR(tmpfile, src, options)
-      if retcode != 0:
-        break
+
+    # translation units are independent, compile them in parallel and stop
+    # starting new ones after the first error
+    retcode = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=options.JOBS) as pool:
+      futures = [pool.submit(compileToIR, tmpfile, src, options)
+                 for tmpfile, src in zip(tmpfiles, srcfiles)]
+      for future in concurrent.futures.as_completed(futures):
+        if future.result() != 0 and retcode == 0:
+          retcode = future.result()
+          for f in futures:
+            f.cancel()
 
     if retcode == 0:
       retcode = linkFiles(outputfile, tmpfiles, options)
@@ -0,0 +1,102 @@
+#! /usr/bin/env python3
+
+"""
+outcomecache memoizes the outcomes of fault injection runs for llfi-inject.
+
+An outcome is keyed on what determines it, the program being deterministic:
+the fault injection executable and the LLFI runtime library it is linked to,
+its arguments and input files, the fully resolved fault (the runtime
+configuration, including the seed of its random choices), and the options of
+llfi-inject the outcome depends on (timeout, or the adaptiveTimeOut it is
+derived from, heartbeat and runLimits). Other libraries and the environment of
+the run are not part of the key. It records
+the return code and time of the run along with the output files it produced,
+which are stored once per content hash. Entries are written atomically, so
+several LLFI processes can share a cache directory.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+
+from buildcache import hashFile, cacheKey
+
+class outcomeCache:
+  def __init__(self, cachedir, namespace='inject'):
+    self.root = os.path.join(cachedir, namespace)
+    self.hits = 0
+    self.misses = 0
+    self._lock = threading.Lock()
+
+  def key(self, *parts):
+    return cacheKey(*parts)
+
+  def _path(self, kind, key):
+    return os.path.join(self.root, kind, key[:2], key)
+
+  def _atomicCopy(self, src, dst):
+    parent = os.path.dirname(dst)
+    os.makedirs(parent, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=parent, prefix='.tmp-')
+    os.close(fd)
+    try:
+      shutil.copy2(src, tmp)
+      os.replace(tmp, dst)
+    except OSError:
+      os.remove(tmp)
+      raise
+
+  def lookup(self, key):
+    '''
+      Return the outcome recorded for key, or None
+    '''
+    try:
+      with open(self._path('outcomes', key)) as f:
+        record = json.load(f)
+    except (IOError, OSError, ValueError):
+      record = None
+    if record is not None and \
+       not all(os.path.isfile(self._path('blobs', sha))
+               for _, _, sha in record['files']):
+      record = None
+    with self._lock:
+      if record is None:
+        self.misses += 1
+      else:
+        self.hits += 1
+    return record
+
+  def restore(self, record, destination):
+    '''
+      Copy the output files of record back, destination(kind, name) giving
+      the path of each of them
+    '''
+    for kind, name, sha in record['files']:
+      shutil.copy2(self._path('blobs', sha), destination(kind, name))
+
+  def store(self, key, record, files):
+    '''
+      Record the outcome of key. files is a list of (kind, name, path) of the
+      output files of the run. Failures to write the cache are ignored.
+    '''
+    record = dict(record)
+    record['files'] = []
+    try:
+      for kind, name, path in files:
+        sha = hashFile(path)
+        blob = self._path('blobs', sha)
+        if not os.path.isfile(blob):
+          self._atomicCopy(path, blob)
+        record['files'].append((kind, name, sha))
+
+      dst = self._path('outcomes', key)
+      os.makedirs(os.path.dirname(dst), exist_ok=True)
+      fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dst), prefix='.tmp-')
+      with os.fdopen(fd, 'w') as f:
+        json.dump(record, f)
+      os.replace(tmp, dst)
+    except OSError:
+      return False
+    return True
@@ -0,0 +1,183 @@
+#! /usr/bin/env python3
+
+"""
+llfi-propagation aggregates fault reports (the output of tracediff and
+traceunion) over a whole campaign. For every llfi_index it counts how often
+the instruction was corrupted, and from which injection sites.
+
+The reports are read in a single streaming pass, so campaigns with hundreds of
+thousands of reports can be processed without holding them in memory. The
+counts are written as CSV files:
+  <PREFIX>-index.csv   llfi_index,corrupted,injected
+  <PREFIX>-matrix.csv  site,llfi_index,count (sparse injection site x
+                       corrupted instruction matrix)
+
+If a program dot graph (llfi.stat.graph.dot) is given with --graph, a copy of
+it is written where every corrupted instruction is filled with an intensity
+proportional to its corruption frequency, and injection sites are bordered in
+red.
+"""
+
+import sys, os, re
+import argparse
+from collections import defaultdict
+
+script_path = os.path.realpath(os.path.dirname(__file__))
+sys.path.append(script_path)
+from tracetools import iterFaultReportsfromFile
+
+# Hue of the fill color used for corrupted instructions (yellow), the
+# saturation is scaled with the corruption frequency
+AFFECTED_FILL_HUE = 0.167
+FAULT_INJECTED_BORDER_COLOR = "red"
+
+def help():
+  parser = initParser()
+  parser.print_help()
+
+def initParser():
+  parser = argparse.ArgumentParser(
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    prog='llfi propagation',
+    epilog=__doc__,
+  )
+  parser.add_argument('REPORTS', nargs='+',
+                      help='fault report files, or directories containing them')
+  parser.add_argument('-o', '--output', default='propagation', dest='PREFIX',
+                      help='prefix of the generated CSV files')
+  parser.add_argument('--graph', dest='GRAPH',
+                      help='program dot graph to overlay the counts onto')
+  parser.add_argument('--graph-output', default='propagation.dot',
+                      dest='GRAPH_OUT',
+                      help='output file of the dot graph overlay')
+  parser.add_argument('--npz', dest='NPZ',
+                      help='also save the counts as NumPy arrays in NPZ '
+                      '(requires NumPy)')
+  return parser
+
+################################################################################
+class propagationMatrix:
+  def __init__(self):
+    self.nreports = 0
+    # llfi_index -> number of reports in which it was corrupted
+    self.corrupted = defaultdict(int)
+    # llfi_index -> number of reports injecting into it
+    self.injected = defaultdict(int)
+    # (injection site, llfi_index) -> count, a sparse matrix in DOK form
+    self.pairs = defaultdict(int)
+
+  def add(self, report):
+    if report.faultID < 0:
+      return # malformed report
+    self.nreports += 1
+    site = int(report.faultID)
+    self.injected[site] += 1
+    for inst in report.getAffectedSet():
+      self.corrupted[inst] += 1
+      self.pairs[(site, inst)] += 1
+
+  def maxCorrupted(self):
+    return max(self.corrupted.values()) if self.corrupted else 0
+
+  def writeIndexCSV(self, filename):
+    indices = sorted(set(self.corrupted) | set(self.injected))
+    with open(filename, 'w') as f:
+      f.write("llfi_index,corrupted,injected\n")
+      for idx in indices:
+        f.write("{},{},{}\n".format(idx, self.corrupted.get(idx, 0),
+                                    self.injected.get(idx, 0)))
+
+  def writeMatrixCSV(self, filename):
+    with open(filename, 'w') as f:
+      f.write("site,llfi_index,count\n")
+      for (site, idx) in sorted(self.pairs):
+        f.write("{},{},{}\n".format(site, idx, self.pairs[(site, idx)]))
+
+  def toArrays(self):
+    '''
+      Return the matrix in coordinate form as NumPy arrays
+      (sites, indices, counts)
+    '''
+    import numpy
+    n = len(self.pairs)
+    sites = numpy.empty(n, dtype=numpy.int64)
+    indices = numpy.empty(n, dtype=numpy.int64)
+    counts = numpy.empty(n, dtype=numpy.int64)
+    for i, ((site, idx), count) in enumerate(sorted(self.pairs.items())):
+      sites[i] = site
+      indices[i] = idx
+      counts[i] = count
+    return sites, indices, counts
+
+  def writeNPZ(self, filename):
+    import numpy
+    sites, indices, counts = self.toArrays()
+    numpy.savez_compressed(filename, sites=sites, indices=indices,
+                           counts=counts)
+
+################################################################################
+def iterReportFiles(paths):
+  for path in paths:
+    if os.path.isdir(path):
+      for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for f in sorted(files):
+          yield os.path.join(root, f)
+    else:
+      yield path
+
+def collectPropagation(paths):
+  matrix = propagationMatrix()
+  for reportfile in iterReportFiles(paths):
+    for report in iterFaultReportsfromFile(reportfile):
+      matrix.add(report)
+  return matrix
+
+################################################################################
+def overlayGraph(matrix, graphFile, outputFile):
+  node_re = re.compile(r'^\s*llfiID_(\d+) \[shape')
+  maxcount = matrix.maxCorrupted()
+
+  with open(graphFile, 'r') as graphF, open(outputFile, 'w') as outF:
+    for line in graphF:
+      m = node_re.match(line)
+      if m:
+        idx = int(m.group(1))
+        attrs = ""
+        if idx in matrix.injected:
+          attrs += ", color=\"" + FAULT_INJECTED_BORDER_COLOR + "\""
+        count = matrix.corrupted.get(idx, 0)
+        if count > 0:
+          saturation = float(count) / maxcount
+          attrs += ", style=\"filled\", fillcolor=\"{:.3f} {:.3f} 1.000\""\
+                   .format(AFFECTED_FILL_HUE, saturation)
+          attrs += ", tooltip=\"corrupted {} times\"".format(count)
+        if attrs:
+          line = line.rstrip()
+          line = line[:-2] + attrs + "];\n"
+      outF.write(line)
+
+################################################################################
+def run(args):
+  parser = initParser()
+  options = parser.parse_args(args)
+
+  matrix = collectPropagation(options.REPORTS)
+
+  matrix.writeIndexCSV(options.PREFIX + "-index.csv")
+  matrix.writeMatrixCSV(options.PREFIX + "-matrix.csv")
+  if options.NPZ:
+    try:
+      matrix.writeNPZ(options.NPZ)
+    except ImportError:
+      print("ERROR: NumPy is required for --npz", file=sys.stderr)
+      sys.exit(1)
+  if options.GRAPH:
+    overlayGraph(matrix, options.GRAPH, options.GRAPH_OUT)
+
+  print("Fault reports: {}".format(matrix.nreports))
+  print("Injection sites: {}".format(len(matrix.injected)))
+  print("Corrupted instructions: {}".format(len(matrix.corrupted)))
+
+if __name__ == "__main__":
+  run(sys.argv[1:])
@@ -1,10 +1,26 @@
 #!/usr/bin/env python2
 '''
 llfi-stats is a set of analysis tools <TODO>
+
+Groups of runs injected with a plan or with --exhaustive (see llfi-inject) are
+also summarized with their run weights, giving unbiased program-level rates of
+each return code, and per stratum.
+
+The resource usage of the runs recorded by llfi-inject (CPU time, max RSS,
+page faults, terminating signal and runLimits hit) is also aggregated per
+group of runs, along with the runs using the most memory.
+
+With --harness, the phases of the runs timed by llfi-inject --profile-harness
+(log_output/harness-profile.jsonl) are summarized instead: the percentiles of
+the duration of each phase, its share of the time of the runs, and the
+overhead of the harness per run (every phase but waiting for a worker and for
+FI_EXE).
 '''
 
 import os
 import re
+import json
+import math
 import argparse
 from collections import defaultdict
 
@@ -18,6 +34,15 @@ def help():
 def run(args):
   parser = initParser()
   options = parser.parse_args(args)
+  if options.HARNESS:
+    profile = readHarnessProfile(options.DIR)
+    if not profile:
+      print("No harness profile in " + options.DIR + ", run llfi inject with "
+            "--profile-harness")
+      return
+    printHarnessSummary(profile)
+    return
+
   nruns = getRunSizes(options.DIR)
 
   # First generate return code summary
@@ -25,6 +50,14 @@ def run(args):
 
   printCodeSummary(codes, nruns)
 
+  plans = readPlans(options.DIR)
+  if plans:
+    printPlanSummary(plans, getRunCodes(options.DIR))
+
+  usage = readRunUsage(options.DIR)
+  if usage:
+    printUsageSummary(usage, options.TOP)
+
 ##############################################################################
 
 def initParser():
@@ -37,6 +70,11 @@ def initParser():
                       help='directory containing LLFI output')
   #parser.add_argument('--summary', action='store_true', dest='SUMMARY',
                       #help='generate a summary of injection output')
+  parser.add_argument('--top', type=int, default=5, dest='TOP',
+                      help='number of runs with the largest max RSS to list')
+  parser.add_argument('--harness', action='store_true', dest='HARNESS',
+                      help='summarize the harness profile of llfi inject \
+                      --profile-harness')
 
   return parser
 
@@ -74,11 +112,194 @@ def genCodeSummary(directory, nruns):
 
   return codes
 
+def getRunCodes(directory):
+  '''
+    Return a dict of (group, run) -> return code, for the runs that did not
+    exit successfully
+  '''
+  runcodes = {}
+  error_dir = os.path.join(directory, "error_output")
+  run_re = re.compile('errorfile-run-(\d+)-(\d+)$')
+  code_re = re.compile('.*return code (-?\d+)')
+  for f in os.listdir(error_dir):
+    m = run_re.match(f)
+    if m:
+      with open(os.path.join(error_dir, f)) as fh:
+        c = code_re.match(fh.read())
+      runcodes[(int(m.group(1)), int(m.group(2)))] = c.group(1) if c else 'TO'
+  return runcodes
+
+def readPlans(directory):
+  '''
+    Return a dict of group -> list of (run, stratum, weight), for the groups
+    injected with a plan
+  '''
+  plans = {}
+  log_dir = os.path.join(directory, "log_output")
+  if not os.path.isdir(log_dir):
+    return plans
+  plan_re = re.compile('planfile-run-(\d+)$')
+  for f in os.listdir(log_dir):
+    m = plan_re.match(f)
+    if m:
+      runs = []
+      with open(os.path.join(log_dir, f)) as fh:
+        for line in fh:
+          if line.startswith('#') or not line.strip():
+            continue
+          flds = line.strip().split(',')
+          runs.append((int(flds[0]), flds[1], float(flds[-1])))
+      plans[int(m.group(1))] = runs
+  return plans
+
+def printPlanSummary(plans, runcodes):
+  print("Weighted return codes (planned groups):")
+  for g in sorted(plans):
+    rates = defaultdict(float)
+    strata = defaultdict(lambda: defaultdict(int))
+    for run, stratum, weight in plans[g]:
+      code = runcodes.get((g, run), '0')
+      rates[code] += weight
+      strata[stratum][code] += 1
+    print("Group: {} [{} runs, {} strata]".format(g, len(plans[g]),
+                                                 len(strata)))
+    # the runs of an exhaustive campaign may only cover part of the space
+    total = sum(rates.values())
+    for k in sorted(rates.keys()):
+      print("   {:>3s}: {:>8.3%}".format(k, rates[k] / total))
+    for s in sorted(strata):
+      nruns = sum(strata[s].values())
+      print("   {} [{} runs]: ".format(s, nruns) + ", ".join(
+        "{}: {:.1%}".format(k, float(v) / nruns)
+        for k, v in sorted(strata[s].items())))
+    print("")
+
+USAGE_FIELDS = ('utime', 'stime', 'maxrss', 'majflt', 'minflt', 'signal')
+
+def readRunUsage(directory):
+  '''
+    Return a dict of group -> list of (run, usage dict), for the runs whose
+    log records their resource usage. Logs are appended to by every campaign,
+    the last usage recorded for a run is the one kept.
+  '''
+  usage = defaultdict(list)
+  log_dir = os.path.join(directory, "log_output")
+  if not os.path.isdir(log_dir):
+    return usage
+  log_re = re.compile('logfile-run-(\d+)-(\d+)\.txt$')
+  for f in os.listdir(log_dir):
+    m = log_re.match(f)
+    if not m:
+      continue
+    last = None
+    with open(os.path.join(log_dir, f)) as fh:
+      for line in fh:
+        flds = dict(fld.strip().split('=', 1) for fld in line.split(',')
+                    if '=' in fld)
+        if all(k in flds for k in USAGE_FIELDS):
+          last = dict((k, float(flds[k])) for k in USAGE_FIELDS)
+          last['limit'] = flds.get('limit')
+    if last is not None:
+      usage[int(m.group(1))].append((int(m.group(2)), last))
+  return usage
+
+def printUsageSummary(usage, top):
+  print("Resource usage:")
+  for g in sorted(usage):
+    runs = usage[g]
+    n = len(runs)
+    print("Group: {} [{} runs]".format(g, n))
+    print("   CPU time: user {:.3f}s, sys {:.3f}s (total), "
+          "user {:.3f}s, sys {:.3f}s (avg)".format(
+            sum(u['utime'] for _, u in runs), sum(u['stime'] for _, u in runs),
+            sum(u['utime'] for _, u in runs) / n,
+            sum(u['stime'] for _, u in runs) / n))
+    print("   max RSS: {:,.0f} KiB (avg), {:,.0f} KiB (max)".format(
+            sum(u['maxrss'] for _, u in runs) / n,
+            max(u['maxrss'] for _, u in runs)))
+    print("   page faults: {:.1f} major, {:.1f} minor (avg)".format(
+            sum(u['majflt'] for _, u in runs) / n,
+            sum(u['minflt'] for _, u in runs) / n))
+    signals = defaultdict(int)
+    for _, u in runs:
+      if u['signal']:
+        signals[int(u['signal'])] += 1
+    if signals:
+      print("   signals: " + ", ".join(
+        "{}: {}".format(s, c) for s, c in sorted(signals.items())))
+    limits = defaultdict(int)
+    for _, u in runs:
+      if u['limit']:
+        limits[u['limit']] += 1
+    if limits:
+      print("   killed by a limit: " + ", ".join(
+        "{}: {}".format(l, c) for l, c in sorted(limits.items())))
+    largest = sorted(runs, key=lambda r: r[1]['maxrss'], reverse=True)[:top]
+    print("   largest max RSS: " + ", ".join(
+      "run {} ({:,.0f} KiB)".format(run, u['maxrss']) for run, u in largest))
+    print("")
+
+# phases of a run that are not overhead of the harness
+HARNESS_WAIT_PHASES = ('queue', 'wait')
+
+def readHarnessProfile(directory):
+  '''
+    Return the list of runs of the harness profile, each a list of
+    (phase, duration in ns)
+  '''
+  runs = []
+  profile = os.path.join(directory, "log_output", "harness-profile.jsonl")
+  if not os.path.isfile(profile):
+    return runs
+  with open(profile) as f:
+    for line in f:
+      try:
+        runs.append([tuple(p) for p in json.loads(line)['phases']])
+      except (ValueError, KeyError):
+        # a line cut short by a stopped campaign
+        continue
+  return runs
+
+def percentile(values, pct):
+  #nearest-rank percentile of sorted values
+  rank = int(math.ceil(pct / 100.0 * len(values))) - 1
+  return values[min(max(rank, 0), len(values) - 1)]
+
+def printHarnessSummary(runs):
+  phases = defaultdict(list)
+  order = []
+  overhead = []
+  for run in runs:
+    for phase, ns in run:
+      if phase not in phases:
+        order.append(phase)
+      phases[phase].append(ns)
+    overhead.append(sum(ns for phase, ns in run
+                        if phase not in HARNESS_WAIT_PHASES))
+  total = float(sum(sum(v) for v in phases.values())) or 1.0
+
+  print("Harness phases [{} runs] (us):".format(len(runs)))
+  print("   {:<16s} {:>6s} {:>7s} {:>10s} {:>10s} {:>10s} {:>10s}".format(
+        "phase", "runs", "share", "p50", "p90", "p99", "max"))
+  def row(name, values, share):
+    values = sorted(values)
+    print("   {:<16s} {:>6,} {:>7s} {:>10,.1f} {:>10,.1f} {:>10,.1f} {:>10,.1f}".format(
+          name, len(values), share,
+          percentile(values, 50) / 1e3, percentile(values, 90) / 1e3,
+          percentile(values, 99) / 1e3, values[-1] / 1e3))
+  for phase in order:
+    row(phase, phases[phase], "{:.1%}".format(sum(phases[phase]) / total))
+  row("overhead/run", overhead, "{:.1%}".format(sum(overhead) / total))
+  print("")
+
 def getRunSizes(directory):
   '''
-    Return a list of run sizes for each group of runs
+    Return a list of run sizes for each group of runs. The runs are counted
+    from the files they left, not from their largest index: a group injected
+    by shards (llfi-inject --shard), or with --exhaustive, has gaps in its run
+    indices.
   '''
-  run_dict = defaultdict(int)
+  run_dict = defaultdict(set)
   stat_dir = os.path.join(directory, 'llfi_stat_output');
   files = os.listdir(stat_dir)
 
@@ -86,14 +307,21 @@ def getRunSizes(directory):
   for f in files:
     m = run_re.match(f)
     if m:
-      group = int(m.group(1))
-      run = int(m.group(2)) + 1 # adjust for zero-indexing
-      run_dict[group] = max(run_dict[group], run)
+      run_dict[int(m.group(1))].add(int(m.group(2)))
+
+  # every run logs its return code, even when it injected no fault
+  log_dir = os.path.join(directory, 'log_output')
+  if os.path.isdir(log_dir):
+    log_re = re.compile('logfile-run-(\d+)-(\d+)\.txt$')
+    for f in os.listdir(log_dir):
+      m = log_re.match(f)
+      if m:
+        run_dict[int(m.group(1))].add(int(m.group(2)))
 
   # Convert dict to list
-  runs = [0] * len(run_dict)
+  runs = [0] * (max(run_dict) + 1 if run_dict else 0)
   for k,v in run_dict.items():
-    runs[k] = v
+    runs[k] = len(v)
 
   return runs
 
@@ -0,0 +1,198 @@
+#! /usr/bin/env python3
+
+"""
+telemetry tracks the progress of an llfi-inject campaign while it runs.
+
+For each run configuration, it counts the runs completed and their outcomes,
+and derives the throughput (runs/s), an ETA from the moving average of the
+last completions, the average time of the runs and the overhead of the
+harness per run (the wall-clock time of a run outside of FI_EXE). Recording
+a run only updates counters; the metrics are rendered in the Prometheus text
+format by a background thread, every interval seconds, to a file (replaced
+atomically) and to a localhost HTTP endpoint if a port is given.
+"""
+
+import os
+import time
+import tempfile
+import threading
+import collections
+import http.server
+
+# completions the moving average of the ETA is taken over
+ETA_WINDOW = 50
+
+class configProgress:
+  def __init__(self, nruns):
+    self.nruns = nruns
+    self.done = 0
+    self.codes = collections.defaultdict(int)
+    self.hangs = 0
+    self.runTime = 0.0
+    self.harness = 0.0
+    self.start = time.time()
+    self.last = collections.deque(maxlen=ETA_WINDOW)
+
+  def rate(self):
+    elapsed = time.time() - self.start
+    return self.done / elapsed if elapsed > 0 else 0.0
+
+  def eta(self):
+    #seconds left, from the rate of the last completions, or None
+    left = self.nruns - self.done
+    if left <= 0:
+      return 0.0
+    if len(self.last) < 2 or self.last[-1] == self.last[0]:
+      return None
+    recent = (len(self.last) - 1) / (self.last[-1] - self.last[0])
+    return left / recent
+
+class campaignTelemetry:
+  def __init__(self, path=None, port=None, interval=5.0):
+    self.path = path
+    self.port = port
+    self.interval = interval
+    self.configs = collections.OrderedDict()
+    self._lock = threading.Lock()
+    self._stop = threading.Event()
+    self._thread = None
+    self._server = None
+
+  def start(self):
+    '''
+      Start refreshing the metrics file and serving the endpoint, if any
+    '''
+    if self.port is not None:
+      telemetry = self
+      class handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+          body = telemetry.render().encode()
+          self.send_response(200)
+          self.send_header("Content-Type", "text/plain; version=0.0.4")
+          self.send_header("Content-Length", str(len(body)))
+          self.end_headers()
+          self.wfile.write(body)
+        def log_message(self, *args):
+          pass
+      self._server = http.server.ThreadingHTTPServer(("127.0.0.1", self.port),
+                                                     handler)
+      self._server.daemon_threads = True
+      threading.Thread(target=self._server.serve_forever, daemon=True).start()
+    if self.path is not None:
+      self._thread = threading.Thread(target=self._refresh, daemon=True)
+      self._thread.start()
+
+  def stop(self):
+    self._stop.set()
+    if self._thread is not None:
+      self._thread.join()
+    if self._server is not None:
+      self._server.shutdown()
+      self._server.server_close()
+    if self.path is not None:
+      self.write()
+
+  def startConfig(self, config, nruns):
+    with self._lock:
+      self.configs[config] = configProgress(nruns)
+
+  def record(self, config, outcome):
+    with self._lock:
+      progress = self.configs[config]
+      progress.done += 1
+      progress.codes[str(outcome['code'])] += 1
+      if outcome.get('hang'):
+        progress.hangs += 1
+      progress.runTime += outcome['time']
+      progress.harness += outcome.get('harness', 0.0)
+      progress.last.append(time.time())
+
+  def status(self, config):
+    #short progress line of config, for the progress bar
+    with self._lock:
+      progress = self.configs[config]
+      rate, eta = progress.rate(), progress.eta()
+    line = "%.2f runs/s" % rate
+    if eta is not None:
+      line += ", ETA %s" % formatDuration(eta)
+    return line
+
+  def render(self):
+    '''
+      The metrics of every run configuration, in the Prometheus text format
+    '''
+    metrics = [
+      ("runs_planned", "gauge", "Runs of the run configuration"),
+      ("runs_completed_total", "counter", "Runs completed"),
+      ("runs_per_second", "gauge", "Runs completed per second since the start"),
+      ("eta_seconds", "gauge", "Estimated time left, from the last runs"),
+      ("run_seconds_avg", "gauge", "Average time of FI_EXE per run"),
+      ("harness_overhead_seconds_avg", "gauge",
+       "Average wall-clock time of a run spent outside of FI_EXE"),
+      ("hangs_total", "counter", "Runs considered hung"),
+    ]
+    samples = collections.defaultdict(list)
+    outcomes = []
+    with self._lock:
+      for config, p in self.configs.items():
+        label = 'config="{}"'.format(config)
+        n = max(p.done, 1)
+        eta = p.eta()
+        values = {
+          "runs_planned": p.nruns,
+          "runs_completed_total": p.done,
+          "runs_per_second": p.rate(),
+          "eta_seconds": eta,
+          "run_seconds_avg": p.runTime / n,
+          "harness_overhead_seconds_avg": p.harness / n,
+          "hangs_total": p.hangs,
+        }
+        for name, val in values.items():
+          if val is not None:
+            samples[name].append((label, val))
+        for code, count in sorted(p.codes.items()):
+          outcomes.append(('{},code="{}"'.format(label, code), count))
+
+    lines = []
+    for name, kind, doc in metrics:
+      lines.append("# HELP llfi_inject_{} {}".format(name, doc))
+      lines.append("# TYPE llfi_inject_{} {}".format(name, kind))
+      for label, val in samples[name]:
+        lines.append("llfi_inject_{}{{{}}} {}".format(name, label, formatValue(val)))
+    lines.append("# HELP llfi_inject_outcomes_total Runs completed, by return code")
+    lines.append("# TYPE llfi_inject_outcomes_total counter")
+    for label, count in outcomes:
+      lines.append("llfi_inject_outcomes_total{{{}}} {}".format(label, count))
+    lines.append("# HELP llfi_inject_last_update_seconds Time of this update")
+    lines.append("# TYPE llfi_inject_last_update_seconds gauge")
+    lines.append("llfi_inject_last_update_seconds {:.3f}".format(time.time()))
+    return "\n".join(lines) + "\n"
+
+  def write(self):
+    #replace the metrics file, atomically for the readers of the file
+    parent = os.path.dirname(os.path.abspath(self.path))
+    fd, tmp = tempfile.mkstemp(dir=parent, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+      f.write(self.render())
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, self.path)
+
+  def _refresh(self):
+    while not self._stop.wait(self.interval):
+      try:
+        self.write()
+      except OSError:
+        pass
+
+def formatValue(val):
+  if isinstance(val, int):
+    return str(val)
+  return "{:.6g}".format(val)
+
+def formatDuration(seconds):
+  seconds = int(seconds)
+  if seconds >= 3600:
+    return "%dh%02dm" % (seconds // 3600, seconds % 3600 // 60)
+  if seconds >= 60:
+    return "%dm%02ds" % (seconds // 60, seconds % 60)
+  return "%ds" % seconds
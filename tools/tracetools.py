@@ -461,38 +461,69 @@ class faultReport:
 
     return affectedEdges
 
-def parseFaultReportsfromFile(target):
-  reports = []
-  reportFile = open(target, 'r')
-  fileLines = reportFile.readlines()
-
-  #Remove blank lines from list
-  i = 0
-  length = len(fileLines)
-  while i < length:
-    if not fileLines[i].strip():
-      fileLines.pop(i)
-      length -= 1
-    i += 1
-
-  #Parse the faultReports
-  i = 0
-  fileLineCount = len(fileLines)
-
-  while (i < fileLineCount):
-    if "#FaultReport" in fileLines[i]:
-      temp = []
-      temp.append(fileLines[i])
-      i += 1
-      while ("#FaultReport" not in fileLines[i]):
-        temp.append(fileLines[i])
-        i += 1
-        if i >= fileLineCount:
-          break
-      reports.append(faultReport(temp))
-    else:
-      i += 1
-    if i >= fileLineCount:
-      break
+def iterFaultReportsfromFile(target):
+  #Yield the faultReports of target one at a time, so that large campaign
+  #reports can be processed without reading the whole file into memory
+  temp = None
+  with open(target, 'r') as reportFile:
+    for line in reportFile:
+      #Skip blank lines
+      if not line.strip():
+        continue
+      if "#FaultReport" in line:
+        if temp is not None:
+          yield faultReport(temp)
+        temp = [line]
+      elif temp is not None:
+        temp.append(line)
+  if temp is not None:
+    yield faultReport(temp)
 
-  return reports
+def parseFaultReportsfromFile(target):
+  return list(iterFaultReportsfromFile(target))
+
+class catalogEntry:
+  #A fault injection site of the catalog written by llfi-instrument
+  #(llfi.stat.catalog.txt beside the fault injection executable)
+  def __init__(self, line):
+    flds = line.rstrip('\n').split('\t')
+    self.index = int(flds[0])
+    self.opcode = flds[1]
+    self.function = flds[2]
+    self.block = flds[3]
+    self.regs = int(flds[4])
+    self.widths = [int(w) for w in flds[5].split(',')] if flds[5] else []
+    self.uses = int(flds[6])
+
+  def bits(self):
+    #Number of (register, bit) faults of one dynamic instance of the site
+    return sum(self.widths)
+
+def readCatalog(target):
+  #Return the catalogEntries of target, in llfi index order
+  entries = []
+  with open(target, 'r') as catalogFile:
+    for line in catalogFile:
+      if line.startswith('#') or not line.strip():
+        continue
+      entries.append(catalogEntry(line))
+  return entries
+
+def loadCatalog(target):
+  #Return the catalog of target as a dict of NumPy arrays (requires NumPy),
+  #with one element per site: index, opcode, function, block, regs, bits
+  #(total bits of the register targets), width (widest register target) and
+  #uses
+  import numpy
+  entries = readCatalog(target)
+  return {
+    'index': numpy.array([e.index for e in entries], dtype=numpy.int64),
+    'opcode': numpy.array([e.opcode for e in entries], dtype=str),
+    'function': numpy.array([e.function for e in entries], dtype=str),
+    'block': numpy.array([e.block for e in entries], dtype=str),
+    'regs': numpy.array([e.regs for e in entries], dtype=numpy.int32),
+    'bits': numpy.array([e.bits() for e in entries], dtype=numpy.int64),
+    'width': numpy.array([max(e.widths or [0]) for e in entries],
+                         dtype=numpy.int32),
+    'uses': numpy.array([e.uses for e in entries], dtype=numpy.int64),
+  }